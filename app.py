@@ -1,35 +1,272 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, g, has_request_context, \
+    send_from_directory, make_response, before_render_template, template_rendered, abort
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from markupsafe import Markup
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+from jsonschema import Draft202012Validator
+from PIL import Image, ImageOps
+import atexit
+import base64
+import bisect
+import click
+import cProfile
+import csv
+import gzip
+import hashlib
+import heapq
+import hmac
 import json
+import logging
+import math
+import mimetypes
 import os
+import queue
+import random
+import re
+import secrets
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
 import uuid
 
+try:
+    import brotli
+except ImportError:  # sem brotli os assets saem só com a versão gzip
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # sem orjson a serialização usa o json da biblioteca padrão
+    orjson = None
+
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_aqui_mude_em_producao'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///contadores.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///contadores.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool dimensionado para servidores com várias threads por processo
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'connect_args': {'check_same_thread': False}
+}
+# Aplicados a cada nova conexão do pool. Com WAL os leitores não bloqueiam
+# enquanto alguém escreve; busy_timeout faz o escritor esperar pelo lock em
+# vez de falhar na hora com "database is locked".
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'cache_size': -20000,  # KiB (negativo = tamanho em KiB)
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY'
+}
+# Hash de senhas: método do werkzeug na forma completa (ex.: 'scrypt:32768:8:1'
+# ou 'pbkdf2:sha256:600000'). Hashes em outro método são refeitos no login.
+app.config['SENHA_METODO'] = os.environ.get('SENHA_METODO', 'scrypt:32768:8:1')
+app.config['HASH_WORKERS'] = 2
+app.config['HASH_FILA_MAX'] = 16  # além dos workers; acima disso rejeita na hora
+app.config['HASH_TIMEOUT'] = 10  # segundos
+# Limites de tentativas: (quantidade, janela em segundos)
+app.config['LIMITE_TENTATIVAS_IP'] = (30, 300)
+app.config['LIMITE_TENTATIVAS_EMAIL'] = (5, 900)
+# Rotas marcadas com @somente_leitura usam um pool separado, aberto em modo ro
+app.config['SQLITE_POOL_LEITURA'] = os.environ.get('SQLITE_POOL_LEITURA') == '1'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Variantes geradas para cada foto enviada: nome -> lado em pixels (quadrado)
+app.config['FOTO_VARIANTES'] = {'avatar': 96, 'card': 180, 'perfil': 400}
+app.config['FOTO_QUALIDADE'] = 82
+app.config['CACHE_DIRETORIO_MAX_ITENS'] = 256
+app.config['CACHE_DIRETORIO_TTL'] = 300  # segundos
+app.config['CACHE_FRAGMENTOS_MAX_ITENS'] = 20000  # contadores já serializados
+app.config['CACHE_PERFIS_MAX_ITENS'] = 2000  # partes fixas do perfil já renderizadas
+app.config['AVALIACOES_POR_PAGINA'] = 10
+app.config['PROPOSTAS_POR_PAGINA'] = 20
+app.config['PAGINA_LIMITE_PADRAO'] = 20
+app.config['PAGINA_LIMITE_MAXIMO'] = 100
+app.config['SUGESTOES_LIMITE'] = 8
+app.config['SUGESTOES_INTERVALO'] = 60  # segundos entre conferências da geração do diretório
+# Ranking do diretório: a nota bayesiana parte de NOTA_PRIORI com o peso de
+# PESO_PRIORI avaliações; PESOS combinam os sinais na pontuação (0 a 1)
+app.config['RANKING_NOTA_PRIORI'] = 4.0
+app.config['RANKING_PESO_PRIORI'] = 10
+app.config['RANKING_PESOS'] = {'nota': 0.6, 'verificado': 0.15, 'resposta': 0.15, 'aceite': 0.1}
+app.config['EVENTOS_HEARTBEAT'] = 15  # segundos entre comentários de keep-alive no SSE
+app.config['EVENTOS_HISTORICO'] = 100  # eventos guardados por usuário para reconexão
+app.config['EVENTOS_HISTORICO_USUARIOS'] = 10000
+app.config['EVENTOS_MAX_CONEXOES'] = 5  # conexões SSE simultâneas por usuário
+app.config['MENSAGEM_TAMANHO_MAXIMO'] = 5000
+# Instrumentação: histogramas por processo, somados pelo /metrics
+app.config['METRICAS_PASTA'] = os.environ.get('METRICAS_PASTA', os.path.join(app.instance_path, 'metricas'))
+app.config['METRICAS_INTERVALO'] = 5  # segundos entre gravações do arquivo do processo
+# /metrics: admins, o Prometheus com "Authorization: Bearer <METRICAS_TOKEN>" e os
+# IPs listados. Atrás de proxy todo mundo chega do mesmo IP: não libere loopback
+app.config['METRICAS_TOKEN'] = os.environ.get('METRICAS_TOKEN')
+app.config['METRICAS_IPS'] = ()
+app.config['SQL_LENTA_SEGUNDOS'] = float(os.environ.get('SQL_LENTA_SEGUNDOS', '0.1'))
+# Perfil sob demanda: requisições com o cabeçalho X-Perfil igual ao token geram um .prof
+app.config['PERFIL_TOKEN'] = os.environ.get('PERFIL_TOKEN')
+app.config['PERFIL_PASTA'] = os.path.join(app.instance_path, 'perfis')
+# Fila de tarefas: prioridade de cada faixa (menor sai antes) e novas tentativas
+# com espera exponencial (ESPERA_BASE, dobrando a cada falha, até ESPERA_MAXIMA)
+app.config['TAREFAS_PRIORIDADES'] = {'alta': 0, 'normal': 5, 'baixa': 9}
+app.config['TAREFAS_MAX_TENTATIVAS'] = 5
+app.config['TAREFAS_ESPERA_BASE'] = 5  # segundos
+app.config['TAREFAS_ESPERA_MAXIMA'] = 3600
+app.config['TAREFAS_TIMEOUT'] = 600  # segundos em 'executando' até a tarefa voltar para a fila
+app.config['TAREFAS_LOTE'] = 100  # tarefas reservadas por vez pelo trabalhador
+app.config['TAREFAS_INTERVALO'] = 1.0  # segundos entre consultas com a fila vazia
+# Identidade do usuário logado (nome, tipo, foto...): cache por processo
+app.config['IDENTIDADE_TTL'] = 30  # segundos
+app.config['IDENTIDADE_MAX_ITENS'] = 10000
+# Sessões: 'cookie' (assinada pelo Flask), 'banco' (tabela sessao) ou 'arquivo'
+# (SESSAO_PASTA). Nas duas últimas o cookie leva só o id e a sessão pode ser revogada
+app.config['SESSAO_BACKEND'] = os.environ.get('SESSAO_BACKEND', 'cookie')
+app.config['SESSAO_PASTA'] = os.path.join(app.instance_path, 'sessoes')
 
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-db = SQLAlchemy(app)
 
 
-# Adicionar filtro personalizado para JSON
-@app.template_filter('fromjson')
-def fromjson_filter(value):
-    """Converte string JSON para objeto Python"""
-    if not value:
-        return []
-    try:
-        return json.loads(value)
-    except (json.JSONDecodeError, TypeError):
-        return []
+class SessaoRoteada(Session):
+    """Sessão que envia as rotas somente leitura para o pool de leitura, quando habilitado"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and app.config['SQLITE_POOL_LEITURA'] and has_request_context() \
+                and g.get('somente_leitura'):
+            return motor_leitura()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={'class_': SessaoRoteada})
+
+
+def aplicar_pragmas(conexao_dbapi, somente_leitura=False):
+    cursor = conexao_dbapi.cursor()
+    for nome, valor in app.config['SQLITE_PRAGMAS'].items():
+        if somente_leitura and nome == 'journal_mode':
+            continue  # o modo do arquivo é definido pelo pool de escrita
+        cursor.execute(f"PRAGMA {nome} = {valor}")
+    cursor.close()
+    # Funções SQL da aplicação (o SQLite nem sempre vem com as funções matemáticas)
+    conexao_dbapi.create_function('distancia_km', 4, distancia_km, deterministic=True)
+
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        db.event.listen(db.engine, 'connect', lambda conexao, registro: aplicar_pragmas(conexao))
+
+_motor_leitura = None
+_motor_leitura_lock = threading.Lock()
+
+
+def motor_leitura():
+    """Engine somente leitura sobre o mesmo arquivo SQLite, criada no primeiro uso"""
+    global _motor_leitura
+    with _motor_leitura_lock:
+        if _motor_leitura is None:
+            caminho = db.engine.url.database
+            _motor_leitura = db.create_engine(f"sqlite:///file:{caminho}?mode=ro&uri=true",
+                                              **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+            db.event.listen(_motor_leitura, 'connect',
+                            lambda conexao, registro: aplicar_pragmas(conexao, somente_leitura=True))
+            instrumentar_engine(_motor_leitura)
+        return _motor_leitura
+
+
+def somente_leitura(view):
+    """Marca a rota como somente leitura (usa o pool de leitura se SQLITE_POOL_LEITURA)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.somente_leitura = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Requisições condicionais
+# O ETag sai só de números de versão (geração do diretório, versão do contador,
+# dados da sessão e build dos assets), calculado antes de qualquer consulta
+# pesada ou renderização. Se o navegador já tem essa versão, a resposta é 304.
+def condicional(partes_etag, publico=False):
+    """Responde 304 quando If-None-Match bate com o ETag de partes_etag(**kwargs)"""
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            partes = partes_etag(**kwargs)
+            if partes is None:
+                return view(*args, **kwargs)
+            etag = hashlib.sha1(json.dumps(
+                [view.__name__, partes, manifesto_assets()], sort_keys=True, default=str
+            ).encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            if publico:
+                response.cache_control.public = True
+            else:
+                response.cache_control.private = True
+                response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorador
+
+
+def identidade_sessao():
+    """Dados do usuário logado que aparecem nas páginas"""
+    usuario = usuario_atual()
+    return usuario and [usuario.id, usuario.tipo, usuario.nome, usuario.foto]
+
+
+def versao_contador(contador_id):
+    """Versão do perfil; lida uma vez por requisição (ETag e cache de fragmentos usam a mesma)"""
+    versoes = g.setdefault('versoes_contador', {})
+    if contador_id not in versoes:
+        versoes[contador_id] = db.session.execute(
+            db.select(Contador.versao).where(Contador.id == contador_id)).scalar()
+    return versoes[contador_id]
+
+
+def nova_versao(contador):
+    """Marca o perfil como alterado (chamar antes do commit da escrita)"""
+    if contador.id is not None:
+        contador.versao = Contador.versao + 1
+
+
+# Filtro para obter os nomes das tags de um contador nos templates
+@app.template_filter('nomes_tags')
+def nomes_tags_filter(tags):
+    """Converte a lista de Tag em lista de nomes"""
+    return [tag.nome for tag in tags or []]
+
+
+# Filtro para usar a variante redimensionada de uma foto enviada
+@app.template_filter('foto_variante')
+def foto_variante_filter(url, variante):
+    return url_foto(url, variante)
 
 
 # Modelos do Banco de Dados (mantenha os mesmos modelos anteriores)
@@ -54,14 +291,47 @@ class Usuario(db.Model):
 
 
 class Contador(db.Model):
+    __table_args__ = (
+        db.Index('ix_contador_usuario_id', 'usuario_id'),
+        db.Index('ix_contador_ativo_id', 'ativo', 'id'),  # diretório paginado
+        # Uma ordenação do diretório por índice
+        db.Index('ix_contador_ativo_pontuacao_id', 'ativo', 'pontuacao', 'id'),
+        db.Index('ix_contador_ativo_nota_ajustada_id', 'ativo', 'nota_ajustada', 'id'),
+        db.Index('ix_contador_ativo_tempo_resposta_horas_id', 'ativo', 'tempo_resposta_horas', 'id'),
+        # Filtros de localização
+        db.Index('ix_contador_uf', 'uf'),
+        db.Index('ix_contador_municipio_id', 'municipio_id'),
+        db.Index('ix_contador_latitude_longitude', 'latitude', 'longitude'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     nome = db.Column(db.String(100), nullable=False)
     especialidade = db.Column(db.String(200), nullable=False)
     nota = db.Column(db.Float, default=0.0)
     avaliacoes_count = db.Column(db.Integer, default=0)
+    # Agregados mantidos incrementalmente a cada avaliação
+    soma_notas = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    estrelas_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    estrelas_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    estrelas_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    estrelas_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    estrelas_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Incrementada a cada mudança que aparece no perfil (base do ETag da página)
+    versao = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Ranking: mantidos junto com avaliações, respostas a propostas e edições do perfil
+    nota_ajustada = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    pontuacao = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    tempo_resposta_horas = db.Column(db.Float, nullable=False, default=168.0, server_default='168')
+    propostas_respondidas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    propostas_aceitas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Localização resolvida a partir do texto de `localizacao`
+    municipio_id = db.Column(db.Integer, db.ForeignKey('municipio.id'))
+    uf = db.Column(db.String(2))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     foto = db.Column(db.String(300))
-    tags = db.Column(db.String(500))  # JSON string
+    tags_legado = db.Column('tags', db.String(500))  # JSON antigo, migrado para contador_tag
     tempo_resposta = db.Column(db.String(50), default='4 horas')
     localizacao = db.Column(db.String(100))
     descricao = db.Column(db.Text)
@@ -72,11 +342,46 @@ class Contador(db.Model):
 
     # Relacionamentos
     usuario = db.relationship('Usuario', backref=db.backref('perfil_contador', uselist=False))
+    tags = db.relationship('Tag', secondary='contador_tag', order_by='Tag.nome', lazy='selectin')
     avaliacoes = db.relationship('Avaliacao', backref='contador', lazy=True)
     propostas = db.relationship('Proposta', backref='contador', lazy=True)
 
 
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(50), unique=True, nullable=False)
+
+
+class Municipio(db.Model):
+    __table_args__ = (
+        db.Index('ix_municipio_nome_normalizado_uf', 'nome_normalizado', 'uf'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    nome_normalizado = db.Column(db.String(100), nullable=False)  # sem acentos, minúsculo
+    uf = db.Column(db.String(2), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+
+
+# Índice invertido tag -> contadores. A chave primária (contador_id, tag_id)
+# atende a leitura das tags de um contador; o índice (tag_id, contador_id)
+# atende a interseção de tags no filtro.
+contador_tag = db.Table(
+    'contador_tag',
+    db.Column('contador_id', db.Integer, db.ForeignKey('contador.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_contador_tag_tag_id_contador_id', 'tag_id', 'contador_id')
+)
+
+
 class Avaliacao(db.Model):
+    # Cada usuário avalia um contador uma única vez
+    __table_args__ = (
+        db.Index('uq_avaliacao_contador_id_usuario_id', 'contador_id', 'usuario_id', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     contador_id = db.Column(db.Integer, db.ForeignKey('contador.id'), nullable=False)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
@@ -110,6 +415,1609 @@ class AdminLog(db.Model):
     data_acao = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class Tarefa(db.Model):
+    # Fila de tarefas em segundo plano; o índice segue a ordem em que o trabalhador as reserva
+    __table_args__ = (
+        db.Index('ix_tarefa_status_prioridade_executar_em_id', 'status', 'prioridade', 'executar_em', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    dados = db.Column(db.Text, nullable=False, default='{}')  # JSON com os argumentos
+    prioridade = db.Column(db.Integer, nullable=False, default=5)  # menor sai antes
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluida, falhou
+    chave = db.Column(db.String(200), unique=True)  # idempotência: uma tarefa por chave
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=5)
+    executar_em = db.Column(db.Float, nullable=False)  # time.time()
+    iniciada_em = db.Column(db.Float)
+    trabalhador = db.Column(db.String(100))
+    erro = db.Column(db.Text)
+    criada_em = db.Column(db.DateTime, default=datetime.utcnow)
+    concluida_em = db.Column(db.DateTime)
+
+
+class Sessao(db.Model):
+    # Sessões guardadas no servidor (SESSAO_BACKEND = 'banco'); o cookie leva só o id
+    __table_args__ = (
+        db.Index('ix_sessao_usuario_id', 'usuario_id'),
+        db.Index('ix_sessao_expira_em', 'expira_em'),
+    )
+
+    id = db.Column(db.String(64), primary_key=True)  # sha256 do id do cookie
+    usuario_id = db.Column(db.Integer)
+    dados = db.Column(db.Text, nullable=False)
+    expira_em = db.Column(db.Float, nullable=False)  # time.time()
+    criada_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class LimiteTentativa(db.Model):
+    # Contador de tentativas por janela fixa (chave = 'login:ip:...', 'login:email:...')
+    chave = db.Column(db.String(200), primary_key=True)
+    inicio = db.Column(db.Float, nullable=False)
+    contagem = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Índices compostos que seguem o filtro e a ordenação das rotas
+db.Index('ix_proposta_contador_id_data_envio', Proposta.contador_id, Proposta.data_envio.desc())
+db.Index('ix_proposta_cliente_id_data_envio', Proposta.cliente_id, Proposta.data_envio.desc())
+db.Index('ix_avaliacao_contador_id_data_avaliacao', Avaliacao.contador_id, Avaliacao.data_avaliacao.desc())
+db.Index('ix_avaliacao_usuario_id_data_avaliacao', Avaliacao.usuario_id, Avaliacao.data_avaliacao.desc())
+db.Index('ix_mensagem_destinatario_id_lida', Mensagem.destinatario_id, Mensagem.lida)
+db.Index('ix_mensagem_remetente_id_destinatario_id_id', Mensagem.remetente_id, Mensagem.destinatario_id, Mensagem.id)
+
+
+# Índice de busca textual (SQLite FTS5)
+# Tabela virtual cujo rowid é o id do Contador. O tokenizer unicode61 com
+# remove_diacritics faz "contábil" casar com "contabil".
+SQL_CRIAR_INDICE_BUSCA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS contador_busca USING fts5(
+    nome, especialidade, descricao, tags,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# Pesos do bm25 na ordem das colunas: nome, especialidade, descricao, tags
+PESOS_BUSCA = (10.0, 5.0, 1.0, 3.0)
+
+
+def reconstruir_indice_busca():
+    """Recria todas as entradas do índice de busca a partir das tabelas contador e tag"""
+    db.session.execute(db.text("DELETE FROM contador_busca"))
+    db.session.execute(db.text("""
+        INSERT INTO contador_busca (rowid, nome, especialidade, descricao, tags)
+        SELECT c.id, COALESCE(c.nome, ''), COALESCE(c.especialidade, ''), COALESCE(c.descricao, ''),
+               COALESCE((SELECT group_concat(t.nome, ' ')
+                         FROM contador_tag ct JOIN tag t ON t.id = ct.tag_id
+                         WHERE ct.contador_id = c.id), '')
+        FROM contador c
+    """))
+
+
+def indexar_contador(contador):
+    """Atualiza a entrada do contador no índice de busca (chamar antes do commit)"""
+    if contador.id is None:
+        db.session.flush()
+    db.session.execute(db.text("DELETE FROM contador_busca WHERE rowid = :id"), {"id": contador.id})
+    db.session.execute(
+        db.text("INSERT INTO contador_busca (rowid, nome, especialidade, descricao, tags) "
+                "VALUES (:id, :nome, :especialidade, :descricao, :tags)"),
+        {
+            "id": contador.id,
+            "nome": contador.nome or '',
+            "especialidade": contador.especialidade or '',
+            "descricao": contador.descricao or '',
+            "tags": ' '.join(tag.nome for tag in contador.tags)
+        }
+    )
+
+
+def expressao_busca(q):
+    """Converte o texto digitado em uma expressão MATCH do FTS5 (busca por prefixo em cada termo)"""
+    termos = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def subconsulta_busca(expressao):
+    """Subconsulta (id, rank) com os contadores que casam com a expressão"""
+    pesos = ', '.join(str(peso) for peso in PESOS_BUSCA)
+    return db.text(
+        f"SELECT rowid AS id, bm25(contador_busca, {pesos}) AS rank "
+        "FROM contador_busca WHERE contador_busca MATCH :expressao"
+    ).bindparams(expressao=expressao).columns(id=db.Integer, rank=db.Float).subquery('busca')
+
+
+# Tags normalizadas
+def definir_tags(contador, nomes):
+    """Associa ao contador as tags informadas, criando as que ainda não existem"""
+    nomes = list(dict.fromkeys(nome.strip() for nome in nomes or [] if nome and nome.strip()))
+    existentes = {tag.nome: tag for tag in Tag.query.filter(Tag.nome.in_(nomes)).all()} if nomes else {}
+    tags = []
+    for nome in nomes:
+        tag = existentes.get(nome)
+        if tag is None:
+            tag = Tag(nome=nome)
+            db.session.add(tag)
+        tags.append(tag)
+    contador.tags = tags
+
+
+def subconsulta_tags(nomes):
+    """Ids dos contadores que possuem TODAS as tags informadas (interseção via índice)"""
+    nomes = list(dict.fromkeys(nomes))
+    return db.select(contador_tag.c.contador_id) \
+        .join(Tag, Tag.id == contador_tag.c.tag_id) \
+        .where(Tag.nome.in_(nomes)) \
+        .group_by(contador_tag.c.contador_id) \
+        .having(db.func.count() == len(nomes))
+
+
+def contagem_tags():
+    """Quantidade de contadores ativos por tag, para a barra de filtros"""
+    linhas = db.session.query(Tag.nome, db.func.count(contador_tag.c.contador_id)) \
+        .join(contador_tag, contador_tag.c.tag_id == Tag.id) \
+        .join(Contador, Contador.id == contador_tag.c.contador_id) \
+        .filter(Contador.ativo.is_(True)) \
+        .group_by(Tag.nome) \
+        .all()
+    return dict(linhas)
+
+
+# Cache do diretório
+# Cada processo guarda o diretório serializado e os resultados recentes de
+# /filtrar. Toda escrita que altera o diretório incrementa a linha
+# 'diretorio' de cache_geracao na mesma transação; como a geração é lida do
+# banco a cada requisição, todos os workers descartam o cache assim que a
+# alteração é confirmada.
+class CacheGeracao(db.Model):
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CacheDiretorio:
+    """Cache LRU com TTL, esvaziado sempre que a geração do diretório muda"""
+
+    def __init__(self, max_itens, ttl):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.itens = OrderedDict()
+        self.geracao = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave, geracao, calcular):
+        """Retorna o valor em cache para a chave ou calcula e armazena"""
+        with self._lock:
+            if geracao != self.geracao:
+                self.itens.clear()
+                self.geracao = geracao
+            item = self.itens.get(chave)
+            if item is not None and item[0] > time.monotonic():
+                self.itens.move_to_end(chave)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+
+        valor = calcular()
+
+        with self._lock:
+            # Se outra requisição viu uma geração mais nova, o valor já está velho
+            if geracao == self.geracao:
+                self.itens[chave] = (time.monotonic() + self.ttl, valor)
+                self.itens.move_to_end(chave)
+                while len(self.itens) > self.max_itens:
+                    self.itens.popitem(last=False)
+        return valor
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "geracao": self.geracao,
+                "itens": len(self.itens),
+                "max_itens": self.max_itens,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+cache_diretorio = CacheDiretorio(app.config['CACHE_DIRETORIO_MAX_ITENS'], app.config['CACHE_DIRETORIO_TTL'])
+
+
+def geracao_diretorio():
+    """Geração atual do diretório, compartilhada entre processos pelo banco"""
+    valor = db.session.execute(
+        db.select(CacheGeracao.valor).where(CacheGeracao.nome == 'diretorio')
+    ).scalar()
+    return valor or 0
+
+
+def invalidar_diretorio():
+    """Incrementa a geração do diretório (chamar antes do commit da escrita)"""
+    db.session.execute(db.text(
+        "INSERT INTO cache_geracao (nome, valor) VALUES ('diretorio', 1) "
+        "ON CONFLICT (nome) DO UPDATE SET valor = valor + 1"
+    ))
+
+
+def em_cache(chave, calcular):
+    return cache_diretorio.obter(chave, geracao_diretorio(), calcular)
+
+
+# Identidade do usuário
+# A sessão guarda só o id do usuário. Nome, email, tipo, foto e o id do perfil
+# de contador vêm de usuario_atual(), numa única consulta feita na primeira
+# chamada da requisição e guardada em g. Entre requisições a identidade fica
+# num cache do processo; quem altera esses dados chama esquecer_identidade()
+# depois do commit (nos outros processos a entrada expira em IDENTIDADE_TTL).
+Identidade = namedtuple('Identidade', 'id nome email tipo foto contador_id')
+
+
+class CacheIdentidades:
+    """Cache LRU com TTL das identidades, por id do usuário"""
+
+    def __init__(self, max_itens, ttl):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id):
+        with self._lock:
+            item = self.itens.get(usuario_id)
+            if item is None or item[0] <= time.monotonic():
+                return None
+            self.itens.move_to_end(usuario_id)
+            return item[1]
+
+    def guardar(self, identidade):
+        with self._lock:
+            self.itens[identidade.id] = (time.monotonic() + self.ttl, identidade)
+            self.itens.move_to_end(identidade.id)
+            while len(self.itens) > self.max_itens:
+                self.itens.popitem(last=False)
+
+    def esquecer(self, usuario_id):
+        with self._lock:
+            self.itens.pop(usuario_id, None)
+
+
+cache_identidades = CacheIdentidades(app.config['IDENTIDADE_MAX_ITENS'], app.config['IDENTIDADE_TTL'])
+
+
+def consulta_identidade(usuario_id):
+    return db.select(Usuario.id, Usuario.nome, Usuario.email, Usuario.tipo, Usuario.foto,
+                     Contador.id.label('contador_id')) \
+        .outerjoin(Contador, Contador.usuario_id == Usuario.id) \
+        .where(Usuario.id == usuario_id)
+
+
+def usuario_atual():
+    """Identidade do usuário logado (None sem login ou se o usuário não existe mais)"""
+    if 'identidade' not in g:
+        usuario_id = session.get('usuario_id')
+        identidade = None
+        if usuario_id is not None:
+            identidade = cache_identidades.obter(usuario_id)
+            if identidade is None:
+                linha = db.session.execute(consulta_identidade(usuario_id)).first()
+                if linha is not None:
+                    identidade = Identidade(*linha)
+                    cache_identidades.guardar(identidade)
+        g.identidade = identidade
+    return g.identidade
+
+
+def tipo_usuario_atual():
+    usuario = usuario_atual()
+    return usuario.tipo if usuario else None
+
+
+def esquecer_identidade(usuario_id):
+    """Descarta a identidade em cache (chamar depois do commit que a alterou)"""
+    cache_identidades.esquecer(usuario_id)
+    g.pop('identidade', None)
+
+
+# Sessões no servidor
+# Com SESSAO_BACKEND 'banco' ou 'arquivo' o cookie leva só um id aleatório, e
+# os dados da sessão ficam na tabela sessao ou em SESSAO_PASTA, guardados pelo
+# sha256 do id (quem lê o banco não obtém cookies válidos). A sessão expira em
+# PERMANENT_SESSION_LIFETIME sem ser gravada; é regravada quando muda ou
+# quando passou da metade desse prazo. O id muda sempre que muda o usuário da
+# sessão (login), e `flask sessoes revogar` encerra as sessões de um usuário.
+class SessaoServidor(SecureCookieSession):
+    def __init__(self, dados=None, sid=None, expira_em=0.0):
+        super().__init__(dados)
+        self.sid = sid
+        self.expira_em = expira_em
+        self.usuario_original = dict.get(self, 'usuario_id')
+
+
+def chave_sessao(sid):
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+class SessoesBanco:
+    """Sessões na tabela sessao, em conexões próprias (fora da transação da rota)"""
+
+    def __init__(self):
+        self._tabela_criada = False
+
+    def _conexao(self):
+        conexao = db.engine.connect()
+        if not self._tabela_criada:
+            # A sessão é aberta antes da migração da primeira requisição
+            Sessao.__table__.create(conexao, checkfirst=True)
+            conexao.commit()
+            self._tabela_criada = True
+        return conexao
+
+    def carregar(self, chave):
+        with self._conexao() as conexao:
+            return conexao.execute(
+                db.select(Sessao.dados, Sessao.expira_em).where(Sessao.id == chave, Sessao.expira_em > time.time())
+            ).first()
+
+    def gravar(self, chave, dados, usuario_id, expira_em):
+        valores = {'dados': dados, 'usuario_id': usuario_id, 'expira_em': expira_em}
+        with self._conexao() as conexao:
+            conexao.execute(insert_sqlite(Sessao.__table__).values(id=chave, **valores)
+                            .on_conflict_do_update(index_elements=['id'], set_=valores))
+            conexao.commit()
+
+    def remover(self, chave):
+        self._apagar(Sessao.id == chave)
+
+    def revogar(self, usuario_id=None):
+        return self._apagar(*([Sessao.usuario_id == usuario_id] if usuario_id is not None else []))
+
+    def limpar_expiradas(self):
+        return self._apagar(Sessao.expira_em <= time.time())
+
+    def _apagar(self, *condicoes):
+        with self._conexao() as conexao:
+            resultado = conexao.execute(db.delete(Sessao.__table__).where(*condicoes))
+            conexao.commit()
+        return resultado.rowcount
+
+
+class SessoesArquivos:
+    """Sessões em arquivos JSON (um por sessão) na pasta informada"""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.json")
+
+    def _ler(self, caminho):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+    def carregar(self, chave):
+        registro = self._ler(self._caminho(chave))
+        if registro is None or registro['expira_em'] <= time.time():
+            return None
+        return registro['dados'], registro['expira_em']
+
+    def gravar(self, chave, dados, usuario_id, expira_em):
+        os.makedirs(self.pasta, exist_ok=True)
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump({'dados': dados, 'usuario_id': usuario_id, 'expira_em': expira_em}, arquivo)
+        os.replace(temporario, caminho)
+
+    def remover(self, chave):
+        try:
+            os.remove(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def revogar(self, usuario_id=None):
+        return self._apagar(lambda registro: usuario_id is None or registro['usuario_id'] == usuario_id)
+
+    def limpar_expiradas(self):
+        return self._apagar(lambda registro: registro['expira_em'] <= time.time())
+
+    def _apagar(self, condicao):
+        removidas = 0
+        for nome in os.listdir(self.pasta) if os.path.isdir(self.pasta) else ():
+            if not nome.endswith('.json'):
+                continue
+            registro = self._ler(os.path.join(self.pasta, nome))
+            if registro is None or condicao(registro):
+                self.remover(nome[:-len('.json')])
+                removidas += 1
+        return removidas
+
+
+class InterfaceSessaoServidor(SessionInterface):
+    serializer = TaggedJSONSerializer()  # o mesmo formato da sessão em cookie do Flask
+
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            registro = self.armazenamento.carregar(chave_sessao(sid))
+            if registro is not None:
+                dados, expira_em = registro
+                return SessaoServidor(self.serializer.loads(dados), sid, expira_em)
+        return SessaoServidor()
+
+    def save_session(self, app, sessao, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+        if sessao.accessed:
+            response.vary.add('Cookie')
+
+        if not sessao:
+            if sessao.sid is not None and sessao.modified:  # session.clear() (logout)
+                self.armazenamento.remover(chave_sessao(sessao.sid))
+                response.delete_cookie(nome, domain=dominio, path=caminho, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+                response.vary.add('Cookie')
+            return
+
+        duracao = app.permanent_session_lifetime.total_seconds()
+        renovar = sessao.sid is not None and sessao.expira_em - time.time() < duracao / 2
+        if not (sessao.modified or renovar):
+            return
+        if sessao.sid is None or sessao.get('usuario_id') != sessao.usuario_original:
+            # Um id conhecido antes do login não vale depois dele
+            if sessao.sid is not None:
+                self.armazenamento.remover(chave_sessao(sessao.sid))
+            sessao.sid = secrets.token_urlsafe(32)
+        sessao.expira_em = time.time() + duracao
+        self.armazenamento.gravar(chave_sessao(sessao.sid), self.serializer.dumps(dict(sessao)),
+                                  sessao.get('usuario_id'), sessao.expira_em)
+        response.set_cookie(nome, sessao.sid, expires=self.get_expiration_time(app, sessao),
+                            httponly=self.get_cookie_httponly(app), domain=dominio, path=caminho,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+
+ARMAZENAMENTOS_SESSAO = {
+    'banco': lambda: SessoesBanco(),
+    'arquivo': lambda: SessoesArquivos(app.config['SESSAO_PASTA']),
+}
+if app.config['SESSAO_BACKEND'] != 'cookie':
+    if app.config['SESSAO_BACKEND'] not in ARMAZENAMENTOS_SESSAO:
+        raise ValueError(f"SESSAO_BACKEND inválido: {app.config['SESSAO_BACKEND']}")
+    app.session_interface = InterfaceSessaoServidor(ARMAZENAMENTOS_SESSAO[app.config['SESSAO_BACKEND']]())
+
+sessoes_cli = AppGroup('sessoes', help='Sessões guardadas no servidor.')
+
+
+def armazenamento_sessoes():
+    if not isinstance(app.session_interface, InterfaceSessaoServidor):
+        raise click.ClickException("Sessões em cookie não ficam no servidor; use SESSAO_BACKEND=banco ou arquivo.")
+    return app.session_interface.armazenamento
+
+
+@sessoes_cli.command('revogar')
+@click.option('--usuario', 'usuario_id', type=int, help='Id do usuário.')
+@click.option('--todas', is_flag=True, help='Encerra as sessões de todos os usuários.')
+def revogar_sessoes_command(usuario_id, todas):
+    """Encerra as sessões de um usuário (ou de todos, com --todas)."""
+    if (usuario_id is None) == (not todas):
+        raise click.UsageError("Informe --usuario ou --todas.")
+    removidas = armazenamento_sessoes().revogar(usuario_id)
+    print(f"✅ {removidas} sessão(ões) revogada(s)")
+
+
+@sessoes_cli.command('limpar')
+def limpar_sessoes_command():
+    """Apaga as sessões expiradas."""
+    print(f"✅ {armazenamento_sessoes().limpar_expiradas()} sessão(ões) expirada(s) removida(s)")
+
+
+app.cli.add_command(sessoes_cli)
+
+
+# Migrações do esquema
+# A versão do esquema fica em PRAGMA user_version. Um banco novo é criado
+# direto na versão mais recente; um banco existente recebe, em ordem, as
+# migrações que ainda não foram aplicadas, cada uma em sua própria transação.
+# As migrações usam SQL direto (e não os modelos), pois os modelos refletem
+# sempre o esquema mais recente.
+MIGRACOES = []
+
+
+def migracao(versao, descricao):
+    """Registra uma função como a migração de número `versao`"""
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        return funcao
+    return registrar
+
+
+def versao_esquema():
+    return db.session.execute(db.text("PRAGMA user_version")).scalar()
+
+
+def _colunas(tabela):
+    return {linha[1] for linha in db.session.execute(db.text(f'PRAGMA table_info("{tabela}")'))}
+
+
+def _adicionar_coluna(tabela, coluna, definicao):
+    """ALTER TABLE ADD COLUMN, se a coluna ainda não existir. Retorna True se adicionou"""
+    if coluna in _colunas(tabela):
+        return False
+    db.session.execute(db.text(f'ALTER TABLE "{tabela}" ADD COLUMN "{coluna}" {definicao}'))
+    return True
+
+
+def _criar_tabelas(*tabelas):
+    conexao = db.session.connection()
+    for tabela in tabelas:
+        tabela.create(conexao, checkfirst=True)
+
+
+def _criar_indices(*nomes):
+    """Cria os índices declarados nos modelos com os nomes informados"""
+    indices = {indice.name: indice for tabela in db.metadata.tables.values() for indice in tabela.indexes}
+    conexao = db.session.connection()
+    for nome in nomes:
+        indices[nome].create(conexao, checkfirst=True)
+
+
+@migracao(1, 'Tags normalizadas em tag/contador_tag')
+def _migracao_tags():
+    _criar_tabelas(Tag.__table__, contador_tag)
+    linhas = db.session.execute(db.text("SELECT id, tags FROM contador WHERE tags IS NOT NULL")).all()
+    for contador_id, tags_json in linhas:
+        try:
+            nomes = [nome.strip() for nome in json.loads(tags_json) if nome and nome.strip()]
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            nomes = []
+        for nome in dict.fromkeys(nomes):
+            db.session.execute(db.text("INSERT OR IGNORE INTO tag (nome) VALUES (:nome)"), {"nome": nome})
+            db.session.execute(db.text(
+                "INSERT OR IGNORE INTO contador_tag (contador_id, tag_id) "
+                "SELECT :contador_id, id FROM tag WHERE nome = :nome"
+            ), {"contador_id": contador_id, "nome": nome})
+    db.session.execute(db.text("UPDATE contador SET tags = NULL"))
+
+
+@migracao(2, 'Geração do cache do diretório')
+def _migracao_cache_geracao():
+    _criar_tabelas(CacheGeracao.__table__)
+
+
+@migracao(3, 'Agregados de avaliação e índice único (contador_id, usuario_id)')
+def _migracao_agregados_avaliacao():
+    if _adicionar_coluna('contador', 'soma_notas', 'FLOAT NOT NULL DEFAULT 0'):
+        # Bancos antigos só têm a média: preserva a nota exibida
+        db.session.execute(db.text(
+            "UPDATE contador SET soma_notas = COALESCE(nota, 0) * COALESCE(avaliacoes_count, 0)"
+        ))
+    for estrelas in range(1, 6):
+        _adicionar_coluna('contador', f'estrelas_{estrelas}', 'INTEGER NOT NULL DEFAULT 0')
+    _criar_indices('uq_avaliacao_contador_id_usuario_id')
+
+
+@migracao(4, 'Índice de busca textual (FTS5)')
+def _migracao_indice_busca():
+    db.session.execute(db.text(SQL_CRIAR_INDICE_BUSCA))
+    reconstruir_indice_busca()
+
+
+@migracao(5, 'Índices das consultas das rotas')
+def _migracao_indices_rotas():
+    _criar_indices(
+        'ix_contador_usuario_id',
+        'ix_contador_ativo_id',
+        'ix_proposta_contador_id_data_envio',
+        'ix_proposta_cliente_id_data_envio',
+        'ix_avaliacao_contador_id_data_avaliacao',
+        'ix_avaliacao_usuario_id_data_avaliacao',
+        'ix_mensagem_destinatario_id_lida'
+    )
+
+
+@migracao(6, 'Limites de tentativas de login')
+def _migracao_limite_tentativa():
+    _criar_tabelas(LimiteTentativa.__table__)
+
+
+@migracao(7, 'Versão do contador para ETag')
+def _migracao_versao_contador():
+    _adicionar_coluna('contador', 'versao', 'INTEGER NOT NULL DEFAULT 1')
+
+
+@migracao(8, 'Índice das conversas de mensagens')
+def _migracao_indice_conversas():
+    _criar_indices('ix_mensagem_remetente_id_destinatario_id_id')
+
+
+@migracao(9, 'Pontuação do ranking e índices das ordenações')
+def _migracao_ranking():
+    for coluna in ('nota_ajustada', 'pontuacao'):
+        _adicionar_coluna('contador', coluna, 'FLOAT NOT NULL DEFAULT 0')
+    _adicionar_coluna('contador', 'tempo_resposta_horas', 'FLOAT NOT NULL DEFAULT 168')
+    for coluna in ('propostas_respondidas', 'propostas_aceitas'):
+        _adicionar_coluna('contador', coluna, 'INTEGER NOT NULL DEFAULT 0')
+    _criar_indices('ix_contador_ativo_pontuacao_id', 'ix_contador_ativo_nota_ajustada_id',
+                   'ix_contador_ativo_tempo_resposta_horas_id')
+    recalcular_ranking()
+
+
+@migracao(10, 'Municípios e localização estruturada dos contadores')
+def _migracao_localizacao():
+    _criar_tabelas(Municipio.__table__)
+    _adicionar_coluna('contador', 'municipio_id', 'INTEGER REFERENCES municipio (id)')
+    _adicionar_coluna('contador', 'uf', 'VARCHAR(2)')
+    _adicionar_coluna('contador', 'latitude', 'FLOAT')
+    _adicionar_coluna('contador', 'longitude', 'FLOAT')
+    _criar_indices('ix_municipio_nome_normalizado_uf', 'ix_contador_uf', 'ix_contador_municipio_id',
+                   'ix_contador_latitude_longitude')
+    carregar_municipios()
+    atualizar_localizacoes()
+
+
+@migracao(11, 'Fila de tarefas em segundo plano')
+def _migracao_tarefas():
+    _criar_tabelas(Tarefa.__table__)
+
+
+@migracao(12, 'Sessões guardadas no servidor')
+def _migracao_sessoes():
+    _criar_tabelas(Sessao.__table__)
+
+
+def migrar():
+    """Aplica as migrações pendentes. Retorna a lista de versões aplicadas"""
+    MIGRACOES.sort(key=lambda item: item[0])
+    ultima = MIGRACOES[-1][0]
+    atual = versao_esquema()
+
+    banco_vazio = not db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usuario'"
+    )).first()
+    if banco_vazio:
+        db.create_all()
+        db.session.execute(db.text(SQL_CRIAR_INDICE_BUSCA))
+        carregar_municipios()
+        db.session.execute(db.text(f"PRAGMA user_version = {ultima}"))
+        db.session.commit()
+        return [ultima]
+
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        if versao <= atual:
+            continue
+        try:
+            funcao()
+            db.session.execute(db.text(f"PRAGMA user_version = {versao}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        aplicadas.append(versao)
+    return aplicadas
+
+
+_esquema_atualizado = False
+
+
+@app.before_request
+def atualizar_esquema():
+    # Garante que o banco está na versão esperada pelo código antes da primeira requisição
+    global _esquema_atualizado
+    if _esquema_atualizado:
+        return
+    migrar()
+    _esquema_atualizado = True
+
+
+# Verificação dos planos de consulta
+# Consultas equivalentes às executadas pelas rotas. Cada uma deve ser
+# atendida por um índice: um "SCAN <tabela>" sem "USING ... INDEX" no
+# EXPLAIN QUERY PLAN indica varredura completa.
+def consultas_das_rotas():
+    db.configure_mappers()  # os backrefs (Avaliacao.usuario...) só existem depois disso
+    agora = datetime.utcnow()
+    return {
+        'login / registro': db.select(Usuario).where(Usuario.email == 'email@exemplo.com'),
+        'index / filtrar': db.select(Contador).where(Contador.ativo.is_(True))
+            .where(db.tuple_(Contador.pontuacao, Contador.id) < (0.9, 100))
+            .order_by(Contador.pontuacao.desc(), Contador.id.desc()).limit(21),
+        'filtrar (melhor avaliados)': db.select(Contador).where(Contador.ativo.is_(True))
+            .order_by(Contador.nota_ajustada.desc(), Contador.id.desc()).limit(21),
+        'filtrar (resposta mais rápida)': db.select(Contador).where(Contador.ativo.is_(True))
+            .where(db.tuple_(Contador.tempo_resposta_horas, Contador.id) > (2.0, 100))
+            .order_by(Contador.tempo_resposta_horas, Contador.id).limit(21),
+        'filtrar (tags)': db.select(Contador).where(Contador.ativo.is_(True))
+            .where(Contador.id.in_(subconsulta_tags(['MEI', 'eSocial'])))
+            .order_by(Contador.pontuacao.desc(), Contador.id.desc()).limit(21),
+        'filtrar (uf)': db.select(Contador).where(Contador.ativo.is_(True), *filtros_localizacao(uf='SP'))
+            .order_by(Contador.pontuacao.desc(), Contador.id.desc()).limit(21),
+        'filtrar (cidade)': db.select(Contador).where(Contador.ativo.is_(True), Contador.municipio_id.in_([1, 2]))
+            .order_by(Contador.pontuacao.desc(), Contador.id.desc()).limit(21),
+        'filtrar (raio)': db.select(Contador)
+            .where(Contador.ativo.is_(True), *filtros_localizacao(latitude=-23.55, longitude=-46.63, raio_km=50))
+            .order_by(Contador.pontuacao.desc(), Contador.id.desc()).limit(21),
+        'localização (município)': consulta_municipios('São Paulo', 'SP'),
+        'tarefas (próximas)': consulta_proximas_tarefas(time.time(), 100),
+        'identidade do usuário': consulta_identidade(1),
+        'filtrar (texto)': db.select(Contador).join(
+            subconsulta_busca('"mei"*'), db.literal_column('busca.id') == Contador.id
+        ).where(Contador.ativo.is_(True)).order_by(db.literal_column('busca.rank'), Contador.id).limit(21),
+        'tags dos contadores': db.select(contador_tag.c.contador_id, Tag)
+            .join(Tag, Tag.id == contador_tag.c.tag_id).where(contador_tag.c.contador_id.in_([1, 2, 3])),
+        'contagem de tags': db.select(Tag.nome, db.func.count())
+            .join(contador_tag, contador_tag.c.tag_id == Tag.id)
+            .join(Contador, Contador.id == contador_tag.c.contador_id)
+            .where(Contador.ativo.is_(True)).group_by(Tag.nome),
+        'perfil do contador logado': db.select(Contador).where(Contador.usuario_id == 1),
+        'perfil_contador (avaliações)': consulta_avaliacoes(1, 11, (agora, 100)),
+        'minhas_avaliacoes': db.select(Avaliacao, Contador).join(Contador)
+            .where(Avaliacao.usuario_id == 1).order_by(Avaliacao.data_avaliacao.desc()),
+        'avaliar_contador (duplicata)': db.select(Avaliacao.id)
+            .where(Avaliacao.contador_id == 1, Avaliacao.usuario_id == 1),
+        'minhas_solicitacoes': consulta_propostas('cliente', 1, 21, depois_de=(agora, 100)),
+        'minhas_solicitacoes (status)': consulta_propostas('cliente', 1, 21, 'pendente'),
+        'minhas_solicitacoes (estatísticas)': consulta_estatisticas_propostas(Proposta.cliente_id == 1, agora),
+        'solicitacoes_contador': consulta_propostas('contador', 1, 21, depois_de=(agora, 100)),
+        'solicitacoes_contador (status)': consulta_propostas('contador', 1, 21, 'pendente'),
+        'solicitacoes_contador (estatísticas)': consulta_estatisticas_propostas(Proposta.contador_id == 1, agora),
+        'mensagens não lidas': db.select(db.func.count(Mensagem.id))
+            .where(Mensagem.destinatario_id == 1, Mensagem.lida.is_(False)),
+        'mensagens (conversa)': db.select(Mensagem).where(filtro_conversa(1, 2), Mensagem.id < 1000)
+            .order_by(Mensagem.id.desc()).limit(51),
+        'mensagens (lista de conversas)': consulta_conversas(1),
+    }
+
+
+def plano_consulta(consulta):
+    """Linhas de detalhe do EXPLAIN QUERY PLAN de uma consulta SQLAlchemy"""
+    compilada = consulta.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    parametros = tuple(compilada.params[nome] for nome in compilada.positiontup)
+    linhas = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}", parametros).all()
+    return [linha[-1] for linha in linhas]
+
+
+def varredura_completa(detalhe, subconsultas=()):
+    """SCAN de tabela sem índice; subconsultas já materializadas no plano não contam"""
+    return detalhe.startswith('SCAN ') and 'USING' not in detalhe and 'VIRTUAL TABLE' not in detalhe \
+        and detalhe != 'SCAN CONSTANT ROW' and detalhe.split()[1] not in subconsultas
+
+
+def verificar_planos():
+    """Retorna {rota: (ok, linhas do plano)} para as consultas das rotas"""
+    resultado = {}
+    for rota, consulta in consultas_das_rotas().items():
+        detalhes = plano_consulta(consulta)
+        subconsultas = {detalhe.split()[1] for detalhe in detalhes if detalhe.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+        resultado[rota] = (not any(varredura_completa(detalhe, subconsultas) for detalhe in detalhes), detalhes)
+    return resultado
+
+
+banco_cli = AppGroup('banco', help='Esquema e migrações do banco de dados.')
+
+
+@banco_cli.command('migrar')
+def migrar_command():
+    """Aplica as migrações pendentes sem apagar dados."""
+    aplicadas = migrar()
+    print(f"✅ Esquema na versão {versao_esquema()} (aplicadas: {aplicadas or 'nenhuma'})")
+
+
+@banco_cli.command('versao')
+def versao_command():
+    """Mostra a versão do esquema e as migrações conhecidas."""
+    atual = versao_esquema()
+    print(f"Versão atual: {atual}")
+    for versao, descricao, _ in sorted(MIGRACOES, key=lambda item: item[0]):
+        print(f"  [{'x' if versao <= atual else ' '}] {versao}: {descricao}")
+
+
+@banco_cli.command('planos')
+def planos_command():
+    """Confere com EXPLAIN QUERY PLAN que as consultas das rotas usam índices."""
+    falhas = 0
+    for rota, (ok, detalhes) in verificar_planos().items():
+        print(f"{'✅' if ok else '❌'} {rota}")
+        for detalhe in detalhes:
+            print(f"      {detalhe}")
+        falhas += not ok
+    if falhas:
+        raise SystemExit(f"{falhas} consulta(s) com varredura completa de tabela")
+
+
+@banco_cli.command('estresse')
+@click.option('--segundos', default=5.0, help='Duração de cada fase.')
+@click.option('--leitores', default=8, help='Threads lendo o diretório.')
+@click.option('--escritores', default=2, help='Threads escrevendo na segunda fase.')
+def estresse_command(segundos, leitores, escritores):
+    """Mede leituras/s do diretório sem e com escritas concorrentes."""
+    # As escritas vão para uma tabela temporária, mas disputam o mesmo lock
+    # de escrita do arquivo que as rotas reais usam.
+    db.session.execute(db.text("CREATE TABLE IF NOT EXISTS _estresse (id INTEGER PRIMARY KEY, valor TEXT)"))
+    db.session.commit()
+
+    def executar(com_escrita):
+        fim = time.monotonic() + segundos
+        contagem = {"leituras": 0, "escritas": 0, "erros": 0}
+        lock = threading.Lock()
+
+        def somar(chave):
+            with lock:
+                contagem[chave] += 1
+
+        def leitor():
+            with app.app_context():
+                while time.monotonic() < fim:
+                    try:
+                        buscar_contadores('', [], app.config['PAGINA_LIMITE_PADRAO'])
+                        somar("leituras")
+                    except Exception:
+                        somar("erros")
+                    finally:
+                        db.session.close()
+
+        def escritor():
+            with app.app_context():
+                while time.monotonic() < fim:
+                    try:
+                        db.session.execute(db.text("INSERT INTO _estresse (valor) VALUES (:valor)"),
+                                           {"valor": uuid.uuid4().hex})
+                        db.session.commit()
+                        somar("escritas")
+                    except Exception:
+                        db.session.rollback()
+                        somar("erros")
+                    finally:
+                        db.session.close()
+
+        threads = [threading.Thread(target=leitor) for _ in range(leitores)]
+        if com_escrita:
+            threads += [threading.Thread(target=escritor) for _ in range(escritores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {chave: valor / segundos for chave, valor in contagem.items()}
+
+    try:
+        sem_escrita = executar(False)
+        com_escrita = executar(True)
+    finally:
+        db.session.execute(db.text("DROP TABLE IF EXISTS _estresse"))
+        db.session.commit()
+
+    journal = db.session.execute(db.text("PRAGMA journal_mode")).scalar()
+    print(f"journal_mode={journal}, {leitores} leitores, {escritores} escritores, {segundos:.0f}s por fase")
+    print(f"Somente leituras: {sem_escrita['leituras']:.0f} leituras/s, {sem_escrita['erros']:.1f} erros/s")
+    print(f"Com escritas:     {com_escrita['leituras']:.0f} leituras/s, {com_escrita['escritas']:.0f} escritas/s, "
+          f"{com_escrita['erros']:.1f} erros/s")
+    if sem_escrita['leituras']:
+        print(f"Leituras mantidas: {com_escrita['leituras'] / sem_escrita['leituras'] * 100:.0f}%")
+
+
+app.cli.add_command(banco_cli)
+
+
+# Utilitários de teste
+@contextmanager
+def contar_consultas():
+    """Conta as instruções SQL executadas dentro do bloco: `with contar_consultas() as c: ...; c['total']`"""
+    contagem = {"total": 0, "sql": []}
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        contagem["total"] += 1
+        contagem["sql"].append(statement)
+
+    db.event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        yield contagem
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', registrar)
+
+
+def verificar_consultas_constantes(requisitar, aumentar_dados, rodadas=2):
+    """Falha (AssertionError) se o número de consultas de `requisitar` crescer junto com os dados.
+
+    `requisitar()` faz a requisição (ex.: cliente.get(url)) e `aumentar_dados()`
+    insere mais linhas entre uma medição e outra. Retorna as contagens medidas.
+    """
+    requisitar()  # aquece caches e estruturas criadas sob demanda
+    contagens = []
+    for rodada in range(rodadas + 1):
+        if rodada:
+            aumentar_dados()
+        with contar_consultas() as contagem:
+            requisitar()
+        contagens.append(contagem["total"])
+    if len(set(contagens)) != 1:
+        raise AssertionError(f"Número de consultas cresce com os dados: {contagens}")
+    return contagens
+
+
+# Instrumentação
+# Cada requisição mede o tempo total, as consultas SQL (quantidade e tempo) e a
+# renderização dos templates. Os números vão para o cabeçalho Server-Timing e
+# para histogramas do processo, gravados em METRICAS_PASTA/<pid>-<token>.json no
+# máximo a cada METRICAS_INTERVALO segundos; o /metrics soma os arquivos de todos
+# os processos no formato texto do Prometheus. Os arquivos de processos que já
+# terminaram são somados em encerrados.json (ao iniciar ou encerrar um processo),
+# então a pasta não cresce e os contadores não voltam atrás com PIDs reutilizados.
+# Consultas acima de SQL_LENTA_SEGUNDOS vão para o log 'app.consultas_lentas' com
+# o plano.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+# nome -> (tipo, descrição, buckets)
+METRICAS = {
+    'http_requisicao_segundos': ('histogram', 'Duração das requisições por endpoint', BUCKETS_SEGUNDOS),
+    'http_requisicoes_total': ('counter', 'Requisições por endpoint e status', None),
+    'sql_consultas_por_requisicao': ('histogram', 'Consultas SQL por requisição', BUCKETS_CONSULTAS),
+    'sql_segundos_por_requisicao': ('histogram', 'Tempo gasto em SQL por requisição', BUCKETS_SEGUNDOS),
+    'sql_consultas_lentas_total': ('counter', 'Consultas acima de SQL_LENTA_SEGUNDOS', None),
+    'template_render_segundos': ('histogram', 'Renderização por template', BUCKETS_SEGUNDOS),
+    'tarefa_segundos': ('histogram', 'Execução das tarefas em segundo plano por tipo', BUCKETS_SEGUNDOS),
+    'tarefas_total': ('counter', 'Tarefas executadas por tipo e resultado', None),
+}
+
+
+def somar_series(total, linhas):
+    """Acumula em total as linhas [nome, rótulos, série] lidas de um arquivo de métricas"""
+    for nome, rotulos, serie in linhas:
+        if nome not in METRICAS:
+            continue
+        chave = (nome, tuple(tuple(par) for par in rotulos))
+        atual = total.get(chave)
+        if atual is None or len(atual) != len(serie):
+            total[chave] = list(serie)
+        else:
+            total[chave] = [a + b for a, b in zip(atual, serie)]
+    return total
+
+
+def processo_vivo(pid):
+    if os.name == 'nt':  # no Windows o os.kill encerraria o processo; considera vivo
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # existe, mas é de outro usuário
+    return True
+
+
+class Metricas:
+    """Histogramas e contadores do processo, persistidos em arquivo para a agregação"""
+
+    CONSOLIDADO = 'encerrados.json'
+    TRAVA_EXPIRA = 30  # segundos; trava mais antiga que isso ficou de um processo morto
+
+    def __init__(self, pasta, intervalo):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        # (nome, rótulos) -> contagens por bucket (+Inf por último) e a soma; contadores: [valor]
+        self._series = {}
+        self._lock = threading.Lock()
+        self._gravado_em = time.monotonic()
+        self._pid = None  # o arquivo é por processo: muda depois de um fork
+        self._token = None
+        self._encerrado = False
+
+    def observar(self, nome, valor, **rotulos):
+        buckets = METRICAS[nome][2]
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [0] * (len(buckets) + 1) + [0.0]
+            serie[bisect.bisect_left(buckets, valor)] += 1
+            serie[-1] += valor
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            serie = self._series.setdefault(chave, [0])
+            serie[0] += valor
+
+    def nome_arquivo(self):
+        """<pid>-<token>.json: o token evita que um PID reutilizado sobrescreva o arquivo de um processo morto"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:8]
+            self._iniciar()
+        return f"{self._pid}-{self._token}.json"
+
+    def _iniciar(self):
+        """Primeira gravação deste processo: aproveita para consolidar os processos que já terminaram"""
+        try:
+            self.consolidar()
+        except (OSError, TimeoutError) as erro:
+            app.logger.warning("Métricas: não foi possível consolidar os processos encerrados: %s", erro)
+
+    def gravar(self):
+        with self._lock:
+            self._gravado_em = time.monotonic()
+            if not self._series or self._encerrado:
+                return
+            linhas = [[nome, rotulos, list(serie)] for (nome, rotulos), serie in self._series.items()]
+        os.makedirs(self.pasta, exist_ok=True)
+        self._gravar_json(self.nome_arquivo(), linhas)
+
+    def _gravar_json(self, nome_arquivo, conteudo):
+        caminho = os.path.join(self.pasta, nome_arquivo)
+        with open(f"{caminho}.{os.getpid()}.tmp", 'w', encoding='utf-8') as arquivo:
+            json.dump(conteudo, arquivo)
+        os.replace(f"{caminho}.{os.getpid()}.tmp", caminho)
+
+    def _ler_json(self, nome_arquivo):
+        try:
+            with open(os.path.join(self.pasta, nome_arquivo), encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None  # arquivo removido ou de outra versão
+
+    def _ler_consolidado(self):
+        consolidado = self._ler_json(self.CONSOLIDADO)
+        if not isinstance(consolidado, dict):
+            return {"series": [], "incluidos": []}
+        return consolidado
+
+    def arquivos_processos(self):
+        """{nome do arquivo: pid} dos arquivos por processo na pasta"""
+        arquivos = {}
+        for nome_arquivo in os.listdir(self.pasta) if os.path.isdir(self.pasta) else ():
+            if nome_arquivo.endswith('.json') and nome_arquivo != self.CONSOLIDADO:
+                pid = nome_arquivo[:-len('.json')].split('-', 1)[0]
+                if pid.isdigit():
+                    arquivos[nome_arquivo] = int(pid)
+        return arquivos
+
+    @contextmanager
+    def _trava(self, espera=5.0):
+        """Exclusão entre processos para reescrever o consolidado (arquivo criado com O_EXCL)"""
+        caminho = os.path.join(self.pasta, '.trava')
+        limite = time.monotonic() + espera
+        while True:
+            try:
+                descritor = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(caminho) > self.TRAVA_EXPIRA:
+                        os.remove(caminho)
+                        continue
+                except OSError:
+                    continue  # a trava acabou de ser liberada
+                if time.monotonic() >= limite:
+                    raise TimeoutError(f"trava de métricas ocupada: {caminho}")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(descritor)
+            os.remove(caminho)
+
+    def consolidar(self, encerrando=False):
+        """Soma ao consolidado os arquivos dos processos que já terminaram e os apaga.
+
+        Com encerrando=True o arquivo deste processo entra junto (chamado no atexit).
+        Retorna quantos arquivos foram consolidados.
+        """
+        os.makedirs(self.pasta, exist_ok=True)
+        proprio = f"{self._pid}-{self._token}.json" if self._pid == os.getpid() else None
+        with self._trava():
+            consolidado = self._ler_consolidado()
+            ja_incluidos = set(consolidado["incluidos"])
+            total = somar_series({}, consolidado["series"])
+            incluidos, novos = [], 0
+            for nome_arquivo, pid in self.arquivos_processos().items():
+                if nome_arquivo in ja_incluidos:
+                    # Sobra de uma consolidação interrompida antes de apagar os arquivos já somados
+                    incluidos.append(nome_arquivo)
+                    continue
+                if nome_arquivo == proprio:
+                    if not encerrando:
+                        continue
+                elif pid == os.getpid() or processo_vivo(pid):
+                    continue
+                linhas = self._ler_json(nome_arquivo)
+                if isinstance(linhas, list):
+                    somar_series(total, linhas)
+                incluidos.append(nome_arquivo)
+                novos += 1
+            if not incluidos:
+                return 0
+            # Primeiro o consolidado (que lista os arquivos somados), depois a remoção:
+            # quem estiver somando no meio do caminho ignora os arquivos listados
+            self._gravar_json(self.CONSOLIDADO, {
+                "series": [[nome, rotulos, serie] for (nome, rotulos), serie in total.items()],
+                "incluidos": incluidos,
+            })
+            for nome_arquivo in incluidos:
+                try:
+                    os.remove(os.path.join(self.pasta, nome_arquivo))
+                except FileNotFoundError:
+                    pass
+        return novos
+
+    def encerrar(self):
+        """Grava as séries finais do processo e as passa para o consolidado"""
+        self.gravar()
+        if self._pid != os.getpid():
+            return  # nada gravado por este processo
+        try:
+            self.consolidar(encerrando=True)
+        except (OSError, TimeoutError):
+            return  # o arquivo fica; o próximo processo a iniciar consolida
+        self._encerrado = True
+
+    def talvez_gravar(self):
+        if time.monotonic() - self._gravado_em >= self.intervalo:
+            self.gravar()
+
+    def somar_processos(self):
+        """Séries de todos os arquivos da pasta, somadas"""
+        self.gravar()
+        lidos = {}
+        for nome_arquivo in self.arquivos_processos():
+            linhas = self._ler_json(nome_arquivo)
+            if isinstance(linhas, list):
+                lidos[nome_arquivo] = linhas
+        # O consolidado é lido por último: um arquivo somado a ele no meio da leitura não conta duas vezes
+        consolidado = self._ler_consolidado()
+        total = somar_series({}, consolidado["series"])
+        for nome_arquivo, linhas in lidos.items():
+            if nome_arquivo not in consolidado["incluidos"]:
+                somar_series(total, linhas)
+        return total
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus"""
+        series = self.somar_processos()
+        saida = []
+        for nome, (tipo, descricao, buckets) in METRICAS.items():
+            saida.append(f"# HELP {nome} {descricao}")
+            saida.append(f"# TYPE {nome} {tipo}")
+            for (nome_serie, rotulos), serie in sorted(series.items()):
+                if nome_serie != nome:
+                    continue
+                if tipo == 'counter':
+                    saida.append(f"{nome}{formatar_rotulos(rotulos)} {serie[0]}")
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(buckets + ('+Inf',), serie):
+                    acumulado += contagem
+                    saida.append(f"{nome}_bucket{formatar_rotulos(rotulos + (('le', str(limite)),))} {acumulado}")
+                saida.append(f"{nome}_sum{formatar_rotulos(rotulos)} {serie[-1]}")
+                saida.append(f"{nome}_count{formatar_rotulos(rotulos)} {acumulado}")
+        return "\n".join(saida) + "\n"
+
+
+def formatar_rotulos(rotulos):
+    if not rotulos:
+        return ''
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{chave}="{escapar(valor)}"' for chave, valor in rotulos) + '}'
+
+
+metricas = Metricas(app.config['METRICAS_PASTA'], app.config['METRICAS_INTERVALO'])
+atexit.register(metricas.encerrar)
+log_consultas_lentas = logging.getLogger('app.consultas_lentas')
+if os.environ.get('LOG_CONSULTAS_LENTAS'):
+    log_consultas_lentas.addHandler(logging.FileHandler(os.environ['LOG_CONSULTAS_LENTAS'], encoding='utf-8'))
+_trava_perfil = threading.Lock()  # um perfil por vez
+
+
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info['inicio_consulta'] = time.perf_counter()
+
+
+def _depois_consulta(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info.pop('inicio_consulta', time.perf_counter())
+    medicao = g.get('medicao') if has_request_context() else None
+    if medicao is not None:
+        medicao['consultas'] += 1
+        medicao['sql'] += duracao
+    if duracao >= app.config['SQL_LENTA_SEGUNDOS'] and not executemany:
+        registrar_consulta_lenta(cursor, statement, parameters, duracao)
+
+
+def instrumentar_engine(engine):
+    db.event.listen(engine, 'before_cursor_execute', _antes_consulta)
+    db.event.listen(engine, 'after_cursor_execute', _depois_consulta)
+
+
+with app.app_context():
+    instrumentar_engine(db.engine)
+
+
+def registrar_consulta_lenta(cursor, statement, parameters, duracao):
+    """Loga a consulta com o EXPLAIN QUERY PLAN, num cursor à parte da mesma conexão"""
+    endpoint = request.endpoint if has_request_context() else None
+    metricas.incrementar('sql_consultas_lentas_total', endpoint=endpoint or '-')
+    try:
+        explicar = cursor.connection.cursor()
+        plano = [linha[-1] for linha in explicar.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()]
+        explicar.close()
+    except (AttributeError, sqlite3.Error) as erro:  # outro banco, ou instrução sem plano
+        plano = [f"(sem plano: {erro})"]
+    log_consultas_lentas.warning("Consulta lenta (%.1f ms) em %s:\n%s\nparâmetros: %r\nplano:\n  %s",
+                                 duracao * 1000, endpoint or '-', statement, parameters, "\n  ".join(plano))
+
+
+@before_render_template.connect_via(app)
+def _inicio_template(sender, template, context, **extra):
+    g.setdefault('pilha_templates', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _fim_template(sender, template, context, **extra):
+    pilha = g.get('pilha_templates')
+    if not pilha:
+        return
+    duracao = time.perf_counter() - pilha.pop()
+    metricas.observar('template_render_segundos', duracao, template=template.name or '-')
+    medicao = g.get('medicao') if has_request_context() else None
+    if medicao is not None and not pilha:  # templates aninhados já contam no de fora
+        medicao['templates'] += duracao
+
+
+@app.before_request
+def iniciar_medicao():
+    g.medicao = {'inicio': time.perf_counter(), 'consultas': 0, 'sql': 0.0, 'templates': 0.0}
+    token = app.config['PERFIL_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('X-Perfil', '').encode(), token.encode()) \
+            and _trava_perfil.acquire(blocking=False):
+        g.perfil = cProfile.Profile()
+        g.perfil.enable()
+
+
+@app.after_request
+def registrar_medicao(response):
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfil.disable()
+        _trava_perfil.release()
+        os.makedirs(app.config['PERFIL_PASTA'], exist_ok=True)
+        nome = f"{datetime.now():%Y%m%d-%H%M%S}-{request.endpoint or '-'}-{uuid.uuid4().hex[:6]}.prof"
+        perfil.dump_stats(os.path.join(app.config['PERFIL_PASTA'], nome))
+        response.headers['X-Perfil-Arquivo'] = nome
+
+    medicao = g.pop('medicao', None)
+    if medicao is None:
+        return response
+    duracao = time.perf_counter() - medicao['inicio']
+    endpoint = request.endpoint or '-'
+    metricas.observar('http_requisicao_segundos', duracao, endpoint=endpoint, metodo=request.method)
+    metricas.incrementar('http_requisicoes_total', endpoint=endpoint, metodo=request.method,
+                         status=str(response.status_code))
+    metricas.observar('sql_consultas_por_requisicao', medicao['consultas'], endpoint=endpoint)
+    metricas.observar('sql_segundos_por_requisicao', medicao['sql'], endpoint=endpoint)
+    response.headers['Server-Timing'] = (
+        f"app;dur={duracao * 1000:.1f}, sql;dur={medicao['sql'] * 1000:.1f};desc=\"{medicao['consultas']} consultas\", "
+        f"tpl;dur={medicao['templates'] * 1000:.1f}")
+    metricas.talvez_gravar()
+    return response
+
+
+@app.teardown_request
+def encerrar_perfil(erro=None):
+    # A requisição terminou sem passar pelo after_request
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfil.disable()
+        _trava_perfil.release()
+
+
+def acesso_metricas():
+    token = app.config['METRICAS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                     f'Bearer {token}'.encode()):
+        return True
+    return request.remote_addr in app.config['METRICAS_IPS'] or tipo_usuario_atual() == 'admin'
+
+
+@app.route('/metrics')
+def metricas_prometheus():
+    if not acesso_metricas():
+        return jsonify({"success": False, "message": "Acesso restrito!"}), 403
+    return app.response_class(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metricas_cli = AppGroup('metricas', help='Métricas de instrumentação.')
+
+
+@metricas_cli.command('limpar')
+def limpar_metricas_command():
+    """Zera as métricas: apaga os arquivos dos processos e o consolidado dos encerrados."""
+    removidos = 0
+    if os.path.isdir(app.config['METRICAS_PASTA']):
+        for nome in os.listdir(app.config['METRICAS_PASTA']):
+            os.remove(os.path.join(app.config['METRICAS_PASTA'], nome))
+            removidos += 1
+    print(f"✅ {removidos} arquivo(s) removido(s)")
+
+
+app.cli.add_command(metricas_cli)
+
+
+# Fila de tarefas
+# Efeitos secundários das rotas (variantes das fotos, limpeza de arquivos,
+# auditoria) saem do caminho da requisição: enfileirar() grava a tarefa na
+# mesma transação da alteração, e um processo separado (`flask tarefas
+# trabalhar`) as executa por ordem de prioridade. Quem falha volta para a fila
+# com espera exponencial até TAREFAS_MAX_TENTATIVAS e depois fica como
+# 'falhou' (`flask tarefas repetir`). Uma chave repetida não cria outra tarefa.
+# Tarefas de lote recebem juntas os dados de todas as reservadas do mesmo tipo.
+TAREFAS = {}  # tipo -> (função, lote)
+STATUS_TAREFA = ('pendente', 'executando', 'concluida', 'falhou')
+
+
+def tarefa(tipo, lote=False):
+    """Registra a função que executa as tarefas do tipo (com lote, recebe a lista de dados)"""
+    def registrar(funcao):
+        TAREFAS[tipo] = (funcao, lote)
+        return funcao
+    return registrar
+
+
+def enfileirar(tipo, prioridade='normal', chave=None, atraso=0, **dados):
+    """Adiciona a tarefa à transação atual; sai da fila só depois do commit"""
+    if tipo not in TAREFAS:
+        raise ValueError(f'tipo de tarefa desconhecido: {tipo}')
+    db.session.execute(
+        insert_sqlite(Tarefa.__table__).values(
+            tipo=tipo, dados=json.dumps(dados, ensure_ascii=False), chave=chave,
+            prioridade=app.config['TAREFAS_PRIORIDADES'][prioridade],
+            max_tentativas=app.config['TAREFAS_MAX_TENTATIVAS'], executar_em=time.time() + atraso,
+        ).on_conflict_do_nothing(index_elements=['chave'])
+    )
+
+
+def consulta_proximas_tarefas(agora, limite, prioridades=None):
+    consulta = db.select(Tarefa.id).where(Tarefa.status == 'pendente', Tarefa.executar_em <= agora)
+    if prioridades:
+        consulta = consulta.where(Tarefa.prioridade.in_(prioridades))
+    return consulta.order_by(Tarefa.prioridade, Tarefa.executar_em, Tarefa.id).limit(limite)
+
+
+def reservar_tarefas(trabalhador, limite, prioridades=None):
+    """Marca as próximas tarefas como 'executando' num único UPDATE e as retorna"""
+    agora = time.time()
+    tarefas = db.session.execute(
+        db.update(Tarefa.__table__)
+        .where(Tarefa.__table__.c.id.in_(consulta_proximas_tarefas(agora, limite, prioridades).scalar_subquery()))
+        .values(status='executando', trabalhador=trabalhador, iniciada_em=agora,
+                tentativas=Tarefa.__table__.c.tentativas + 1)
+        .returning(Tarefa.__table__.c.id, Tarefa.__table__.c.tipo, Tarefa.__table__.c.dados,
+                   Tarefa.__table__.c.prioridade, Tarefa.__table__.c.tentativas,
+                   Tarefa.__table__.c.max_tentativas)
+    ).all()
+    db.session.commit()
+    # O RETURNING não garante ordem
+    return sorted(tarefas, key=lambda tarefa: (tarefa.prioridade, tarefa.id))
+
+
+def recuperar_tarefas_abandonadas():
+    """Devolve à fila as tarefas 'executando' há mais de TAREFAS_TIMEOUT (trabalhador interrompido)"""
+    resultado = db.session.execute(
+        db.update(Tarefa)
+        .where(Tarefa.status == 'executando', Tarefa.iniciada_em < time.time() - app.config['TAREFAS_TIMEOUT'])
+        .values(status='pendente', executar_em=time.time())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def espera_nova_tentativa(tentativas):
+    espera = min(app.config['TAREFAS_ESPERA_BASE'] * 2 ** (tentativas - 1), app.config['TAREFAS_ESPERA_MAXIMA'])
+    return espera * random.uniform(0.8, 1.2)  # espalha as tentativas de várias tarefas
+
+
+def executar_tarefas(tarefas):
+    """Executa as tarefas reservadas e registra o resultado. Retorna quantas foram concluídas"""
+    grupos = {}
+    for tarefa in tarefas:
+        lote = TAREFAS.get(tarefa.tipo, (None, False))[1]
+        grupos.setdefault(tarefa.tipo if lote else tarefa.id, []).append(tarefa)
+    return sum(executar_grupo(grupo) for grupo in grupos.values())
+
+
+def executar_grupo(grupo):
+    """Executa um grupo de tarefas do mesmo tipo num único commit. Retorna quantas foram concluídas
+
+    Se um lote falhar, cada tarefa é repetida sozinha: só as que falharem de
+    novo gastam uma tentativa.
+    """
+    tipo = grupo[0].tipo
+    inicio = time.perf_counter()
+    try:
+        if tipo not in TAREFAS:
+            raise LookupError(f'tipo de tarefa desconhecido: {tipo}')
+        funcao, lote = TAREFAS[tipo]
+        dados = [json.loads(tarefa.dados) for tarefa in grupo]
+        if lote:
+            funcao(dados)
+        else:
+            funcao(**dados[0])
+        # O efeito da tarefa e a conclusão vão no mesmo commit
+        db.session.execute(
+            db.update(Tarefa).where(Tarefa.id.in_([tarefa.id for tarefa in grupo]))
+            .values(status='concluida', concluida_em=datetime.utcnow(), erro=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        concluidas = len(grupo)
+        resultado = 'concluida'
+    except Exception as erro:
+        db.session.rollback()
+        app.logger.warning("Falha na tarefa %s (%s): %s", tipo, [tarefa.id for tarefa in grupo], erro)
+        metricas.observar('tarefa_segundos', time.perf_counter() - inicio, tipo=tipo)
+        if len(grupo) > 1:
+            return sum(executar_grupo([tarefa]) for tarefa in grupo)
+        tarefa = grupo[0]
+        esgotada = tarefa.tentativas >= tarefa.max_tentativas
+        db.session.execute(
+            db.update(Tarefa).where(Tarefa.id == tarefa.id)
+            .values(status='falhou' if esgotada else 'pendente', erro=f"{type(erro).__name__}: {erro}",
+                    executar_em=time.time() + espera_nova_tentativa(tarefa.tentativas))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        metricas.incrementar('tarefas_total', tipo=tipo, resultado='erro')
+        return 0
+    metricas.observar('tarefa_segundos', time.perf_counter() - inicio, tipo=tipo)
+    metricas.incrementar('tarefas_total', concluidas, tipo=tipo, resultado=resultado)
+    return concluidas
+
+
+def trabalhar(lote, intervalo, prioridades=None, drenar=False):
+    """Laço do trabalhador; com drenar, para quando não houver mais tarefas prontas"""
+    nome = f"pid:{os.getpid()}"
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    concluidas = 0
+    proxima_recuperacao = 0
+    while not parar.is_set():
+        if time.monotonic() >= proxima_recuperacao:
+            recuperar_tarefas_abandonadas()
+            proxima_recuperacao = time.monotonic() + app.config['TAREFAS_TIMEOUT'] / 2
+        tarefas = reservar_tarefas(nome, lote, prioridades)
+        if tarefas:
+            concluidas += executar_tarefas(tarefas)
+        elif drenar:
+            break
+        else:
+            parar.wait(intervalo)
+        metricas.talvez_gravar()
+    metricas.gravar()
+    return concluidas
+
+
+# Tarefas
+@tarefa('auditoria', lote=True)
+def registrar_auditoria(registros):
+    """Grava as ações em admin_log num único INSERT em lote"""
+    db.session.execute(db.insert(AdminLog), [{
+        'acao': registro['acao'],
+        'usuario_id': registro.get('usuario_id'),
+        'data_acao': datetime.fromisoformat(registro['data_acao']),
+    } for registro in registros])
+
+
+def auditar(acao, usuario_id=None):
+    """Enfileira o registro da ação do usuário da sessão em admin_log"""
+    if usuario_id is None and has_request_context():
+        usuario_id = session.get('usuario_id')
+    enfileirar('auditoria', prioridade='baixa', acao=acao[:200], usuario_id=usuario_id,
+               data_acao=datetime.utcnow().isoformat())
+
+
+tarefas_cli = AppGroup('tarefas', help='Fila de tarefas em segundo plano.')
+opcao_prioridades = click.option('--prioridade', 'prioridades', multiple=True,
+                                 type=click.Choice(list(app.config['TAREFAS_PRIORIDADES'])),
+                                 help='Atende só estas faixas (pode repetir).')
+
+
+@tarefas_cli.command('trabalhar')
+@click.option('--lote', default=app.config['TAREFAS_LOTE'], help='Tarefas reservadas por vez.')
+@click.option('--intervalo', default=app.config['TAREFAS_INTERVALO'], help='Segundos de espera com a fila vazia.')
+@opcao_prioridades
+def trabalhar_command(lote, intervalo, prioridades):
+    """Executa as tarefas continuamente (encerra com SIGTERM ou Ctrl+C)."""
+    faixas = [app.config['TAREFAS_PRIORIDADES'][nome] for nome in prioridades]
+    print(f"Trabalhador {os.getpid()} aguardando tarefas...")
+    try:
+        concluidas = trabalhar(lote, intervalo, faixas)
+    except KeyboardInterrupt:
+        concluidas = None
+    print(f"✅ Trabalhador encerrado{f' ({concluidas} tarefa(s) concluída(s))' if concluidas is not None else ''}")
+
+
+@tarefas_cli.command('drenar')
+@click.option('--lote', default=app.config['TAREFAS_LOTE'], help='Tarefas reservadas por vez.')
+@opcao_prioridades
+def drenar_command(lote, prioridades):
+    """Executa as tarefas prontas até a fila esvaziar e sai."""
+    faixas = [app.config['TAREFAS_PRIORIDADES'][nome] for nome in prioridades]
+    concluidas = trabalhar(lote, 0, faixas, drenar=True)
+    print(f"✅ {concluidas} tarefa(s) concluída(s)")
+
+
+@tarefas_cli.command('resumo')
+def resumo_tarefas_command():
+    """Quantidade de tarefas por tipo e status."""
+    linhas = db.session.execute(
+        db.select(Tarefa.tipo, Tarefa.status, db.func.count(), db.func.min(Tarefa.executar_em))
+        .group_by(Tarefa.tipo, Tarefa.status).order_by(Tarefa.tipo, Tarefa.status)
+    ).all()
+    if not linhas:
+        print("Fila vazia")
+    for tipo, status, total, mais_antiga in linhas:
+        atraso = f" (mais antiga pronta há {max(0, time.time() - mais_antiga):.0f}s)" if status == 'pendente' else ''
+        print(f"{tipo:<20} {status:<11} {total:>7}{atraso}")
+
+
+@tarefas_cli.command('listar')
+@click.option('--status', type=click.Choice(STATUS_TAREFA), help='Filtra pelo status.')
+@click.option('--tipo', help='Filtra pelo tipo.')
+@click.option('--limite', default=20, help='Quantidade máxima de tarefas.')
+def listar_tarefas_command(status, tipo, limite):
+    """Lista as tarefas mais recentes."""
+    consulta = db.select(Tarefa).order_by(Tarefa.id.desc()).limit(limite)
+    if status:
+        consulta = consulta.where(Tarefa.status == status)
+    if tipo:
+        consulta = consulta.where(Tarefa.tipo == tipo)
+    for item in db.session.execute(consulta).scalars():
+        print(f"#{item.id} {item.tipo} [{item.status}] prioridade={item.prioridade} "
+              f"tentativas={item.tentativas}/{item.max_tentativas} dados={item.dados}"
+              f"{f' erro={item.erro}' if item.erro else ''}")
+
+
+@tarefas_cli.command('repetir')
+@click.argument('ids', nargs=-1, type=int)
+def repetir_tarefas_command(ids):
+    """Devolve à fila as tarefas que falharam (todas, ou só os IDS informados)."""
+    consulta = db.update(Tarefa).where(Tarefa.status == 'falhou')
+    if ids:
+        consulta = consulta.where(Tarefa.id.in_(ids))
+    resultado = db.session.execute(
+        consulta.values(status='pendente', tentativas=0, erro=None, executar_em=time.time())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    print(f"✅ {resultado.rowcount} tarefa(s) de volta à fila")
+
+
+@tarefas_cli.command('limpar')
+@click.option('--dias', default=7, help='Remove as concluídas há mais de N dias.')
+def limpar_tarefas_command(dias):
+    """Apaga as tarefas concluídas antigas (e libera as chaves de idempotência)."""
+    resultado = db.session.execute(
+        db.delete(Tarefa)
+        .where(Tarefa.status == 'concluida', Tarefa.concluida_em < datetime.utcnow() - timedelta(days=dias))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    print(f"✅ {resultado.rowcount} tarefa(s) removida(s)")
+
+
+app.cli.add_command(tarefas_cli)
+
+
 # Dados iniciais (mantenha os mesmos dados)
 contadores_iniciais = [
     {
@@ -159,29 +2067,32 @@ contadores_iniciais = [
 
 def init_db():
     with app.app_context():
-        # Drop todas as tabelas para recriar
-        db.drop_all()
-        db.create_all()
+        # Cria o banco ou aplica as migrações pendentes, preservando os dados
+        migrar()
 
         # Criar usuário admin padrão
         if not Usuario.query.filter_by(email='admin@contadores.com').first():
             admin = Usuario(
                 nome='Administrador Sistema',
                 email='admin@contadores.com',
-                senha=generate_password_hash('admin123'),
+                senha=generate_password_hash('admin123', method=app.config['SENHA_METODO']),
                 tipo='admin',
                 foto='https://i.pravatar.cc/150?img=12'  # Usa a mesma imagem do Dr. João Silva
             )
             db.session.add(admin)
             db.session.commit()
 
-        # Adicionar contadores iniciais
+        # Adicionar contadores iniciais (apenas em um banco ainda sem contadores)
+        if Contador.query.first():
+            print("✅ Banco de dados já inicializado!")
+            return
+
         for contador_data in contadores_iniciais:
             # Criar usuário para o contador
             usuario = Usuario(
                 nome=contador_data['nome'],
                 email=f"{contador_data['nome'].lower().replace(' ', '.')}@contadores.com",
-                senha=generate_password_hash('senha123'),
+                senha=generate_password_hash('senha123', method=app.config['SENHA_METODO']),
                 tipo='contador',
                 foto=contador_data['foto']
             )
@@ -194,8 +2105,8 @@ def init_db():
                 especialidade=contador_data['especialidade'],
                 nota=contador_data['nota'],
                 avaliacoes_count=contador_data['avaliacoes_count'],
+                soma_notas=contador_data['nota'] * contador_data['avaliacoes_count'],
                 foto=contador_data['foto'],
-                tags=json.dumps(contador_data['tags']),
                 tempo_resposta=contador_data['tempo_resposta'],
                 localizacao=contador_data['localizacao'],
                 descricao=contador_data.get('descricao', ''),
@@ -204,47 +2115,643 @@ def init_db():
                 formacao=contador_data.get('formacao', '')
             )
             db.session.add(contador)
+            definir_tags(contador, contador_data['tags'])
+            indexar_contador(contador)
 
+        invalidar_diretorio()
         db.session.commit()
         print("✅ Banco de dados inicializado com sucesso!")
 
 
+# Importação e exportação de contadores
+# Arquivos CSV (tags separadas por ";") ou JSONL, lidos e gravados em fluxo.
+# A importação valida cada linha com o esquema abaixo, insere em lotes
+# (executemany) e confirma cada lote na sua transação; as senhas são geradas
+# num pool de processos. Linhas sem senha recebem uma senha temporária, que
+# vai para o arquivo --senhas para ser repassada ao contador (sem --senhas,
+# a importação recusa o arquivo antes de inserir qualquer linha).
+CAMPOS_CONTADOR_ARQUIVO = ('nome', 'email', 'especialidade', 'tags', 'localizacao', 'tempo_resposta', 'descricao',
+                           'verificado', 'experiencia', 'formacao', 'foto', 'telefone')
+ESQUEMA_CONTADOR_ARQUIVO = {
+    "type": "object",
+    "required": ["nome", "email", "especialidade"],
+    "additionalProperties": False,
+    "properties": {
+        "nome": {"type": "string", "minLength": 1, "maxLength": 100},
+        "email": {"type": "string", "maxLength": 100, "pattern": r"^[^@\s]+@[^@\s]+\.[^@\s]+$"},
+        "senha": {"type": "string", "minLength": 6},
+        "especialidade": {"type": "string", "minLength": 1, "maxLength": 200},
+        "tags": {"type": "array", "maxItems": 20, "items": {"type": "string", "minLength": 1, "maxLength": 50}},
+        "localizacao": {"type": "string", "maxLength": 100},
+        "tempo_resposta": {"type": "string", "maxLength": 50},
+        "descricao": {"type": "string"},
+        "verificado": {"type": "boolean"},
+        "experiencia": {"type": "string", "maxLength": 100},
+        "formacao": {"type": "string", "maxLength": 200},
+        "foto": {"type": "string", "maxLength": 300},
+        "telefone": {"type": "string", "maxLength": 20},
+    },
+}
+validador_contador = Draft202012Validator(ESQUEMA_CONTADOR_ARQUIVO)
+
+
+def formato_arquivo(caminho, formato):
+    if formato:
+        return formato
+    return 'jsonl' if caminho.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def ler_linhas_contadores(arquivo, formato):
+    """Gera (número da linha, dicionário ou mensagem de erro) sem carregar o arquivo"""
+    if formato == 'jsonl':
+        for numero, texto in enumerate(arquivo, 1):
+            if not texto.strip():
+                continue
+            try:
+                yield numero, json.loads(texto)
+            except ValueError as erro:
+                yield numero, f"JSON inválido: {erro}"
+        return
+    for numero, linha in enumerate(csv.DictReader(arquivo), 2):  # a linha 1 é o cabeçalho
+        dados = {chave: valor.strip() for chave, valor in linha.items() if chave and valor and valor.strip()}
+        if 'tags' in dados:
+            dados['tags'] = [tag.strip() for tag in dados['tags'].split(';') if tag.strip()]
+        if 'verificado' in dados and dados['verificado'].lower() in ('1', 'true', 'sim', '0', 'false', 'nao', 'não'):
+            dados['verificado'] = dados['verificado'].lower() in ('1', 'true', 'sim')
+        yield numero, dados
+
+
+def erros_validacao(dados):
+    if not isinstance(dados, dict):
+        return [dados if isinstance(dados, str) else "a linha deve ser um objeto"]
+    return [f"{'.'.join(map(str, erro.absolute_path)) or 'linha'}: {erro.message}"
+            for erro in validador_contador.iter_errors(dados)]
+
+
+def importar_lote(lote, hashes):
+    """Insere um lote já validado (lista de dicionários) numa transação"""
+    usuarios = db.session.execute(
+        db.insert(Usuario).returning(Usuario.id, sort_by_parameter_order=True),
+        [{
+            'nome': dados['nome'],
+            'email': dados['email'],
+            'senha': senha,
+            'tipo': 'contador',
+            'foto': dados.get('foto') or Usuario.__table__.c.foto.default.arg,
+            'telefone': dados.get('telefone'),
+            'data_criacao': datetime.utcnow(),
+        } for dados, senha in zip(lote, hashes)]
+    ).scalars().all()
+    contadores = db.session.execute(
+        db.insert(Contador).returning(Contador.id, sort_by_parameter_order=True),
+        [{
+            'usuario_id': usuario_id,
+            'nome': dados['nome'],
+            'especialidade': dados['especialidade'],
+            'nota': 0.0,
+            'avaliacoes_count': 0,
+            'foto': dados.get('foto') or Usuario.__table__.c.foto.default.arg,
+            'tempo_resposta': dados.get('tempo_resposta', '4 horas'),
+            'tempo_resposta_horas': horas_resposta(dados.get('tempo_resposta', '4 horas')),
+            'localizacao': dados.get('localizacao', ''),
+            'descricao': dados.get('descricao', ''),
+            'verificado': dados.get('verificado', False),
+            'ativo': True,
+            'experiencia': dados.get('experiencia', ''),
+            'formacao': dados.get('formacao', ''),
+        } for usuario_id, dados in zip(usuarios, lote)]
+    ).scalars().all()
+
+    nomes = {tag for dados in lote for tag in dados.get('tags', [])}
+    ids_tags = dict(db.session.execute(db.select(Tag.nome, Tag.id).where(Tag.nome.in_(nomes))).all()) if nomes else {}
+    novas = sorted(nomes - ids_tags.keys())
+    if novas:
+        db.session.execute(db.insert(Tag), [{'nome': nome} for nome in novas])
+        ids_tags.update(db.session.execute(db.select(Tag.nome, Tag.id).where(Tag.nome.in_(novas))).all())
+    associacoes = [{'contador_id': contador_id, 'tag_id': ids_tags[tag]}
+                   for contador_id, dados in zip(contadores, lote) for tag in dict.fromkeys(dados.get('tags', []))]
+    if associacoes:
+        db.session.execute(contador_tag.insert(), associacoes)
+    db.session.execute(
+        db.text("INSERT INTO contador_busca (rowid, nome, especialidade, descricao, tags) "
+                "VALUES (:id, :nome, :especialidade, :descricao, :tags)"),
+        [{
+            "id": contador_id,
+            "nome": dados['nome'],
+            "especialidade": dados['especialidade'],
+            "descricao": dados.get('descricao', ''),
+            "tags": ' '.join(sorted(dict.fromkeys(dados.get('tags', [])))),
+        } for contador_id, dados in zip(contadores, lote)]
+    )
+    atualizar_ranking(Contador.id.in_(contadores))
+    atualizar_localizacoes(Contador.id.in_(contadores))
+    invalidar_diretorio()
+    db.session.commit()
+
+
+contadores_cli = AppGroup('contadores', help='Importação e exportação de contadores.')
+
+
+@contadores_cli.command('importar')
+@click.argument('arquivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), help='Padrão: pela extensão do arquivo.')
+@click.option('--lote', default=500, help='Linhas por transação.')
+@click.option('--processos', default=os.cpu_count() or 1, help='Processos para gerar os hashes das senhas.')
+@click.option('--senhas', type=click.File('w', encoding='utf-8'),
+              help='CSV (email,senha) com as senhas temporárias; obrigatório se alguma linha não tiver senha.')
+def importar_contadores_command(arquivo, formato, lote, processos, senhas):
+    """Importa contadores (e seus usuários) de um arquivo CSV ou JSONL."""
+    formato = formato_arquivo(arquivo.name, formato)
+    if not senhas:
+        # Sem --senhas a senha temporária se perderia e a conta ficaria inacessível
+        if not arquivo.seekable():
+            raise click.UsageError("Informe --senhas ao ler da entrada padrão.")
+        sem_senha = next((numero for numero, dados in ler_linhas_contadores(arquivo, formato)
+                          if isinstance(dados, dict) and not dados.get('senha')), None)
+        if sem_senha is not None:
+            raise click.UsageError(f"A linha {sem_senha} não tem senha: informe --senhas para gravar as "
+                                   f"senhas temporárias geradas.")
+        arquivo.seek(0)
+    saida_senhas = csv.writer(senhas) if senhas else None
+    if saida_senhas:
+        saida_senhas.writerow(['email', 'senha'])
+    lidas = importadas = com_erro = 0
+    emails_arquivo = set()
+
+    def gravar(pendentes):
+        nonlocal importadas, com_erro
+        existentes = set(db.session.execute(
+            db.select(Usuario.email).where(Usuario.email.in_([dados['email'] for _, dados in pendentes]))
+        ).scalars())
+        validos = []
+        for numero, dados in pendentes:
+            if dados['email'] in existentes:
+                click.echo(f"linha {numero}: email: {dados['email']} já cadastrado", err=True)
+                com_erro += 1
+            else:
+                validos.append(dados)
+        if not validos:
+            return
+        senhas_lote = [dados.get('senha') or secrets.token_urlsafe(9) for dados in validos]
+        hashes = list(pool.map(generate_password_hash, senhas_lote, [app.config['SENHA_METODO']] * len(validos),
+                               chunksize=max(1, len(validos) // (processos * 4))))
+        importar_lote(validos, hashes)
+        importadas += len(validos)
+        if saida_senhas:
+            saida_senhas.writerows((dados['email'], senha) for dados, senha in zip(validos, senhas_lote)
+                                   if not dados.get('senha'))
+        click.echo(f"… {lidas} linhas lidas, {importadas} importadas, {com_erro} com erro")
+
+    migrar()
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        pendentes = []
+        for numero, dados in ler_linhas_contadores(arquivo, formato):
+            lidas += 1
+            erros = erros_validacao(dados)
+            if not erros and dados['email'] in emails_arquivo:
+                erros = [f"email: {dados['email']} repetido no arquivo"]
+            if erros:
+                com_erro += 1
+                for erro in erros:
+                    click.echo(f"linha {numero}: {erro}", err=True)
+                continue
+            emails_arquivo.add(dados['email'])
+            pendentes.append((numero, dados))
+            if len(pendentes) >= lote:
+                gravar(pendentes)
+                pendentes = []
+        if pendentes:
+            gravar(pendentes)
+
+    print(f"{'✅' if not com_erro else '⚠️'} {importadas} contador(es) importado(s) de {lidas} linha(s); "
+          f"{com_erro} com erro")
+    if com_erro:
+        raise SystemExit(1)
+
+
+@contadores_cli.command('exportar')
+@click.argument('arquivo', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), help='Padrão: pela extensão do arquivo (ou CSV).')
+@click.option('--lote', default=1000, help='Linhas lidas do banco por vez.')
+def exportar_contadores_command(arquivo, formato, lote):
+    """Exporta os contadores para CSV ou JSONL (sem senhas), no formato aceito pelo importar."""
+    formato = formato_arquivo(arquivo.name, formato)
+    consulta = db.select(Contador.id, Contador.nome, Usuario.email, Contador.especialidade, Contador.localizacao,
+                         Contador.tempo_resposta, Contador.descricao, Contador.verificado, Contador.experiencia,
+                         Contador.formacao, Contador.foto, Usuario.telefone) \
+        .join(Usuario, Usuario.id == Contador.usuario_id).order_by(Contador.id)
+    escritor = None
+    if formato == 'csv':
+        escritor = csv.DictWriter(arquivo, fieldnames=CAMPOS_CONTADOR_ARQUIVO)
+        escritor.writeheader()
+    total = 0
+    # yield_per: o cursor é lido em partes, sem materializar a tabela inteira
+    for parte in db.session.execute(consulta.execution_options(yield_per=lote)).partitions():
+        tags = tags_por_contador([linha.id for linha in parte])
+        for linha in parte:
+            dados = {campo: valor for campo, valor in linha._asdict().items() if campo != 'id' and valor is not None}
+            dados['tags'] = tags[linha.id]
+            if escritor:
+                escritor.writerow({**dados, 'tags': ';'.join(dados['tags']),
+                                   'verificado': str(bool(dados.get('verificado'))).lower()})
+            else:
+                arquivo.write(json.dumps(dados, ensure_ascii=False) + "\n")
+        total += len(parte)
+    print(f"✅ {total} contador(es) exportado(s)", file=sys.stderr)
+
+
+app.cli.add_command(contadores_cli)
+
+
 # Funções auxiliares
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
 
-def salvar_arquivo(file):
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Adicionar UUID para evitar conflitos de nome
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
-        return f"/static/uploads/{unique_filename}"
+# Fotos
+# O upload é gravado em blocos num arquivo temporário enquanto calcula o
+# sha256; o nome final é o próprio hash, então reenvios são deduplicados e a
+# URL nunca muda de conteúdo. As variantes (avatar, card, perfil) são geradas
+# pela fila de tarefas e a página usa o original até elas ficarem prontas.
+ASSINATURAS_IMAGEM = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+BLOCO_UPLOAD = 64 * 1024
+RE_FOTO_ENVIADA = re.compile(r'^/static/uploads/([0-9a-f]{64})\.(png|jpg|gif|webp)$')
+
+
+def tipo_imagem(cabecalho):
+    """Identifica o formato pelos bytes iniciais, sem confiar na extensão"""
+    for assinatura, extensao in ASSINATURAS_IMAGEM:
+        if cabecalho.startswith(assinatura):
+            return extensao
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+        return 'webp'
     return None
 
 
+def caminho_upload(nome):
+    return os.path.join(app.config['UPLOAD_FOLDER'], nome)
+
+
+def nome_variante(digest, variante):
+    return f"{digest}_{variante}.webp"
+
+
+def url_foto(url, variante):
+    """URL da variante redimensionada, ou a original enquanto ela não existir"""
+    encontrado = RE_FOTO_ENVIADA.match(url or '')
+    if encontrado:
+        nome = nome_variante(encontrado.group(1), variante)
+        if os.path.exists(caminho_upload(nome)):
+            return f"/static/uploads/{nome}"
+    return url
+
+
+@tarefa('variantes_foto')
+def gerar_variantes(nome_original):
+    """Cria as versões quadradas da foto (tarefa em segundo plano).
+
+    Erros sobem para a fila, que registra a falha e agenda nova tentativa."""
+    digest = nome_original.split('.', 1)[0]
+    with Image.open(caminho_upload(nome_original)) as imagem:
+        imagem = ImageOps.exif_transpose(imagem).convert('RGB')
+        for variante, lado in app.config['FOTO_VARIANTES'].items():
+            destino = caminho_upload(nome_variante(digest, variante))
+            if os.path.exists(destino):
+                continue
+            temporario = f"{destino}.{uuid.uuid4().hex}.tmp"
+            try:
+                ImageOps.fit(imagem, (lado, lado), Image.LANCZOS).save(
+                    temporario, 'WEBP', quality=app.config['FOTO_QUALIDADE'], method=4)
+                os.replace(temporario, destino)
+            finally:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+    # Os cards em cache e os ETags apontam para o original; força a troca pela variante
+    url = f"/static/uploads/{nome_original}"
+    db.session.execute(
+        db.update(Contador).where(Contador.foto == url)
+        .values(versao=Contador.versao + 1)
+        .execution_options(synchronize_session=False)
+    )
+    for usuario_id, in db.session.execute(db.select(Usuario.id).where(Usuario.foto == url)).all():
+        tocar_perfis_avaliados(usuario_id)
+    invalidar_diretorio()
+
+
+def salvar_arquivo(file):
+    if not (file and allowed_file(file.filename)):
+        return None
+    temporario = caminho_upload(f"{uuid.uuid4().hex}.tmp")
+    resumo = hashlib.sha256()
+    extensao = None
+    try:
+        with open(temporario, 'wb') as destino:
+            while True:
+                bloco = file.stream.read(BLOCO_UPLOAD)
+                if not bloco:
+                    break
+                if extensao is None:
+                    extensao = tipo_imagem(bloco[:16])
+                    if extensao is None:
+                        return None
+                resumo.update(bloco)
+                destino.write(bloco)
+        if extensao is None:
+            return None
+        nome = f"{resumo.hexdigest()}.{extensao}"
+        if os.path.exists(caminho_upload(nome)):
+            return f"/static/uploads/{nome}"  # mesmo conteúdo já enviado
+        os.replace(temporario, caminho_upload(nome))
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    enfileirar('variantes_foto', chave=f"variantes:{nome}", nome_original=nome)
+    return f"/static/uploads/{nome}"
+
+
+@tarefa('remover_foto')
+def remover_foto_sem_uso(url):
+    """Apaga a foto enviada (e variantes) quando nenhum usuário ou contador a usa mais"""
+    encontrado = RE_FOTO_ENVIADA.match(url or '')
+    if not encontrado:
+        return
+    em_uso = db.session.query(
+        Usuario.query.filter_by(foto=url).exists() | Contador.query.filter_by(foto=url).exists()
+    ).scalar()
+    if em_uso:
+        return
+    digest = encontrado.group(1)
+    nomes = [f"{digest}.{encontrado.group(2)}"]
+    nomes += [nome_variante(digest, variante) for variante in app.config['FOTO_VARIANTES']]
+    for nome in nomes:
+        try:
+            os.remove(caminho_upload(nome))
+        except FileNotFoundError:
+            pass
+
+
+@app.after_request
+def cache_fotos_enviadas(response):
+    # Nome = hash do conteúdo, então a URL pode ficar em cache para sempre
+    if response.status_code == 200 and request.path.startswith('/static/uploads/') and \
+            re.match(r'^[0-9a-f]{64}(_\w+)?\.\w+$', os.path.basename(request.path)):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# Assets estáticos
+# O CSS e o JS das páginas ficam em static/src (base.css tem as regras comuns
+# a várias páginas). O build minifica cada arquivo, grava em static/dist com o
+# hash do conteúdo no nome, junto com as versões .gz/.br, e registra tudo em
+# manifest.json. Nos templates, {{ asset('index.css') }} devolve a URL final.
+PASTA_ASSETS_FONTE = os.path.join(app.static_folder, 'src')
+PASTA_ASSETS = os.path.join(app.static_folder, 'dist')
+_manifesto_assets = None
+_trava_assets = threading.Lock()
+
+
+def minificar_css(texto):
+    texto = re.sub(r'/\*.*?\*/', '', texto, flags=re.S)
+    texto = re.sub(r'\s+', ' ', texto)
+    texto = re.sub(r'\s*([{};,>])\s*', r'\1', texto)
+    texto = re.sub(r':\s+', ':', texto)
+    return texto.replace(';}', '}').strip()
+
+
+def minificar_js(texto):
+    # Conservador: só tira indentação, linhas vazias e linhas de comentário
+    linhas = (linha.strip() for linha in texto.splitlines())
+    return '\n'.join(linha for linha in linhas if linha and not linha.startswith('//'))
+
+
+def construir_assets():
+    """Gera static/dist a partir de static/src e devolve o manifesto"""
+    os.makedirs(PASTA_ASSETS, exist_ok=True)
+    minificadores = {'.css': minificar_css, '.js': minificar_js}
+    manifesto = {}
+    for subpasta in ('css', 'js'):
+        pasta = os.path.join(PASTA_ASSETS_FONTE, subpasta)
+        for nome in sorted(os.listdir(pasta)):
+            raiz, extensao = os.path.splitext(nome)
+            if extensao not in minificadores:
+                continue
+            with open(os.path.join(pasta, nome), encoding='utf-8') as arquivo:
+                conteudo = minificadores[extensao](arquivo.read()).encode('utf-8')
+            final = f"{raiz}.{hashlib.sha256(conteudo).hexdigest()[:12]}{extensao}"
+            versoes = {final: conteudo, final + '.gz': gzip.compress(conteudo, 9, mtime=0)}
+            if brotli is not None:
+                versoes[final + '.br'] = brotli.compress(conteudo)
+            for arquivo_final, dados in versoes.items():
+                with open(os.path.join(PASTA_ASSETS, arquivo_final), 'wb') as destino:
+                    destino.write(dados)
+            manifesto[nome] = final
+
+    # Remove builds antigos e grava o manifesto por último
+    atuais = set(manifesto.values())
+    for nome in os.listdir(PASTA_ASSETS):
+        if nome != 'manifest.json' and re.sub(r'\.(gz|br)$', '', nome) not in atuais:
+            os.remove(os.path.join(PASTA_ASSETS, nome))
+    temporario = os.path.join(PASTA_ASSETS, 'manifest.json.tmp')
+    with open(temporario, 'w', encoding='utf-8') as destino:
+        json.dump(manifesto, destino, indent=2, sort_keys=True)
+    os.replace(temporario, os.path.join(PASTA_ASSETS, 'manifest.json'))
+    return manifesto
+
+
+def _assets_desatualizados(caminho_manifesto):
+    if not os.path.exists(caminho_manifesto):
+        return True
+    if not app.debug:
+        return False
+    gerado = os.path.getmtime(caminho_manifesto)
+    return any(
+        os.path.getmtime(os.path.join(raiz, nome)) > gerado
+        for raiz, _, nomes in os.walk(PASTA_ASSETS_FONTE) for nome in nomes
+    )
+
+
+def manifesto_assets():
+    global _manifesto_assets
+    if _manifesto_assets is None or app.debug:
+        with _trava_assets:
+            caminho = os.path.join(PASTA_ASSETS, 'manifest.json')
+            if _assets_desatualizados(caminho):
+                _manifesto_assets = construir_assets()
+            elif _manifesto_assets is None or app.debug:
+                with open(caminho, encoding='utf-8') as arquivo:
+                    _manifesto_assets = json.load(arquivo)
+    return _manifesto_assets
+
+
+@app.template_global('asset')
+def asset(nome):
+    return url_for('static', filename=f"dist/{manifesto_assets()[nome]}")
+
+
+def servir_estatico(filename):
+    """Substitui a rota /static: assets do build saem pré-comprimidos e imutáveis"""
+    if not filename.startswith('dist/') or filename.endswith(('.gz', '.br')):
+        return app.send_static_file(filename)
+
+    for codificacao, sufixo in (('br', '.br'), ('gzip', '.gz')):
+        comprimido = os.path.join(app.static_folder, filename + sufixo)
+        if request.accept_encodings[codificacao] and os.path.isfile(comprimido):
+            response = send_from_directory(
+                app.static_folder, filename + sufixo,
+                mimetype=mimetypes.guess_type(filename)[0], max_age=31536000)
+            response.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        response = send_from_directory(app.static_folder, filename, max_age=31536000)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+app.view_functions['static'] = servir_estatico
+
+assets_cli = AppGroup('assets', help='Build dos arquivos estáticos.')
+
+
+@assets_cli.command('construir')
+def construir_assets_comando():
+    """Minifica static/src e grava os arquivos versionados em static/dist.
+
+    Gera sempre a versão .gz; a .br só sai com o pacote brotli (requirements.txt) instalado.
+    """
+    manifesto = construir_assets()
+    for origem, final in manifesto.items():
+        click.echo(f"{origem} -> dist/{final}")
+    if brotli is None:
+        click.echo("⚠️ brotli não instalado: assets gerados sem a versão .br", err=True)
+
+
+app.cli.add_command(assets_cli)
+
+
+# Senhas
+# O KDF é caro de propósito. Ele roda em um pool limitado de threads (o
+# hashlib libera o GIL), para que uma rajada de logins não ocupe todos os
+# workers: com a fila cheia a requisição é rejeitada na hora.
+class HashSobrecarregado(Exception):
+    """Pool de hash de senhas sem vagas ou sem resposta dentro de HASH_TIMEOUT"""
+
+
+class PoolHashSenhas:
+    def __init__(self, workers, fila_max):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash-senha')
+        self._vagas = threading.BoundedSemaphore(workers + fila_max)
+
+    def executar(self, funcao, *args, timeout=None):
+        if not self._vagas.acquire(blocking=False):
+            raise HashSobrecarregado()
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=timeout)
+        except FuturoTimeout:
+            # Ainda na fila, não chega a rodar; já em execução, termina e libera a vaga sozinho
+            futuro.cancel()
+            raise HashSobrecarregado() from None
+
+
+pool_hash = PoolHashSenhas(app.config['HASH_WORKERS'], app.config['HASH_FILA_MAX'])
+
+
+def gerar_hash_senha(senha):
+    return pool_hash.executar(generate_password_hash, senha, app.config['SENHA_METODO'],
+                              timeout=app.config['HASH_TIMEOUT'])
+
+
+def verificar_senha(hash_senha, senha):
+    return pool_hash.executar(check_password_hash, hash_senha, senha, timeout=app.config['HASH_TIMEOUT'])
+
+
+def precisa_rehash(hash_senha):
+    return hash_senha.split('$', 1)[0] != app.config['SENHA_METODO']
+
+
+def registrar_tentativa(chave, limite):
+    """Conta uma tentativa para a chave. Retorna False se o limite da janela foi ultrapassado"""
+    quantidade, janela = limite
+    agora = time.time()
+    contagem = db.session.execute(db.text("""
+        INSERT INTO limite_tentativa (chave, inicio, contagem) VALUES (:chave, :agora, 1)
+        ON CONFLICT (chave) DO UPDATE SET
+            contagem = CASE WHEN inicio <= :agora - :janela THEN 1 ELSE contagem + 1 END,
+            inicio = CASE WHEN inicio <= :agora - :janela THEN :agora ELSE inicio END
+        RETURNING contagem
+    """), {"chave": chave, "agora": agora, "janela": janela}).scalar()
+    if random.random() < 0.01:
+        # Limpeza ocasional das janelas já vencidas
+        maior_janela = max(app.config['LIMITE_TENTATIVAS_IP'][1], app.config['LIMITE_TENTATIVAS_EMAIL'][1])
+        db.session.execute(db.delete(LimiteTentativa).where(LimiteTentativa.inicio < agora - maior_janela))
+    db.session.commit()
+    return contagem <= quantidade
+
+
+def tentativas_esgotadas(chave, limite):
+    """Consulta, sem contar nova tentativa, se a chave já atingiu o limite"""
+    quantidade, janela = limite
+    registro = db.session.get(LimiteTentativa, chave)
+    return registro is not None and registro.inicio > time.time() - janela and registro.contagem >= quantidade
+
+
+def limpar_tentativas(chave):
+    db.session.execute(db.delete(LimiteTentativa).where(LimiteTentativa.chave == chave))
+    db.session.commit()
+
+
 # Rotas de Autenticação (mantenha as mesmas)
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         senha = request.form.get('senha')
+        chave_email = f"login:email:{(email or '').strip().lower()}"
+
+        # Barra excesso de tentativas antes de gastar tempo com o hash
+        if not registrar_tentativa(f"login:ip:{request.remote_addr}", app.config['LIMITE_TENTATIVAS_IP']) or \
+                tentativas_esgotadas(chave_email, app.config['LIMITE_TENTATIVAS_EMAIL']):
+            flash('Muitas tentativas de login. Aguarde alguns minutos e tente novamente.', 'error')
+            return render_template('login.html'), 429
 
         usuario = Usuario.query.filter_by(email=email).first()
 
-        if usuario and check_password_hash(usuario.senha, senha):
+        try:
+            senha_correta = usuario is not None and verificar_senha(usuario.senha, senha)
+        except HashSobrecarregado:
+            flash('Servidor ocupado no momento. Tente novamente em instantes.', 'error')
+            return render_template('login.html'), 503
+
+        if senha_correta:
+            limpar_tentativas(chave_email)
+            if precisa_rehash(usuario.senha):
+                # Atualiza hashes antigos para o método configurado
+                try:
+                    usuario.senha = gerar_hash_senha(senha)
+                    db.session.commit()
+                except HashSobrecarregado:
+                    pass  # fica para o próximo login
+
+            # Só o id: nome, tipo e foto vêm de usuario_atual() e não ficam velhos no cookie
+            session.clear()
             session['usuario_id'] = usuario.id
-            session['usuario_nome'] = usuario.nome
-            session['usuario_tipo'] = usuario.tipo
-            session['usuario_email'] = usuario.email
-            session['usuario_foto'] = usuario.foto
 
             flash('Login realizado com sucesso!', 'success')
             return redirect(url_for('index'))
         else:
+            registrar_tentativa(chave_email, app.config['LIMITE_TENTATIVAS_EMAIL'])
             flash('Email ou senha incorretos!', 'error')
 
     return render_template('login.html')
@@ -258,14 +2765,24 @@ def registro():
         senha = request.form.get('senha')
         tipo = request.form.get('tipo')
 
+        if not registrar_tentativa(f"registro:ip:{request.remote_addr}", app.config['LIMITE_TENTATIVAS_IP']):
+            flash('Muitas tentativas. Aguarde alguns minutos e tente novamente.', 'error')
+            return render_template('registro.html'), 429
+
         if Usuario.query.filter_by(email=email).first():
             flash('Email já cadastrado!', 'error')
             return render_template('registro.html')
 
+        try:
+            hash_senha = gerar_hash_senha(senha)
+        except HashSobrecarregado:
+            flash('Servidor ocupado no momento. Tente novamente em instantes.', 'error')
+            return render_template('registro.html'), 503
+
         usuario = Usuario(
             nome=nome,
             email=email,
-            senha=generate_password_hash(senha),
+            senha=hash_senha,
             tipo=tipo,
             foto=f"https://i.pravatar.cc/150?img={Usuario.query.count() + 1}"
         )
@@ -280,11 +2797,12 @@ def registro():
                 nome=nome,
                 especialidade='Especialidade a definir',
                 foto=usuario.foto,
-                tags=json.dumps([]),
                 localizacao='Localização a definir',
                 descricao='Descrição a ser preenchida'
             )
             db.session.add(contador)
+            indexar_contador(contador)
+            invalidar_diretorio()
             db.session.commit()
 
         flash('Conta criada com sucesso! Faça login para continuar.', 'success')
@@ -301,105 +2819,578 @@ def logout():
 
 
 # Rotas Principais
+def etag_index():
+    if tipo_usuario_atual() == 'contador':
+        return None  # redirecionado para o painel
+    return [geracao_diretorio(), identidade_sessao()]
+
+
 @app.route('/')
+@somente_leitura
+@condicional(etag_index)
 def index():
     # Se o usuário estiver logado como contador, redirecionar para o painel de solicitações
-    if 'usuario_id' in session and session.get('usuario_tipo') == 'contador':
+    usuario = usuario_atual()
+    if usuario and usuario.tipo == 'contador':
         return redirect(url_for('solicitacoes_contador'))
 
-    contadores = Contador.query.filter_by(ativo=True).all()
-    # Converter para formato JSON serializável
-    contadores_data = []
-    for contador in contadores:
-        contadores_data.append({
-            "id": contador.id,
-            "nome": contador.nome,
-            "especialidade": contador.especialidade,
-            "nota": contador.nota,
-            "avaliacoes_count": contador.avaliacoes_count,
-            "foto": contador.foto,
-            "tags": json.loads(contador.tags) if contador.tags else [],
-            "tempo_resposta": contador.tempo_resposta,
-            "localizacao": contador.localizacao,
-            "descricao": contador.descricao,
-            "verificado": contador.verificado,
-            "usuario_id": contador.usuario_id  # Adicionar para o chat se necessário
-        })
+    contadores, proximo = pagina_contadores('', [], app.config['PAGINA_LIMITE_PADRAO'], None)
 
     return render_template('index.html',
-                           contadores=contadores_data,
-                           usuario_logado='usuario_id' in session,
-                           usuario_tipo=session.get('usuario_tipo', ''))
+                           contadores_json=json_para_html(lista_json(contadores)),
+                           proximo_cursor=proximo,
+                           tags_contagem=em_cache(('tags_contagem',), contagem_tags),
+                           ufs=UFS,
+                           usuario=usuario,
+                           usuario_logado=usuario is not None,
+                           usuario_tipo=usuario.tipo if usuario else '')
 
 
 # Mantenha todas as outras rotas existentes (filtrar, cadastrar_contador, enviar_proposta, etc.)
-@app.route('/filtrar', methods=['POST'])
+def etag_filtrar():
+    return [geracao_diretorio(), sorted(request.args.items(multi=True))]
+
+
+# GET (?q=&tags=a&tags=b&limit=&cursor=) pode ficar em cache no navegador ou
+# num proxy; o POST com JSON continua aceito.
+@app.route('/filtrar', methods=['GET', 'POST'])
+@somente_leitura
+@condicional(etag_filtrar, publico=True)
 def filtrar():
-    dados = request.get_json()
+    if request.method == 'GET':
+        dados = request.args.to_dict()
+        dados['tags'] = request.args.getlist('tags')
+    else:
+        dados = request.get_json()
     q = dados.get('q', '')
     tags = dados.get('tags', [])
+    ordem = dados.get('ordem') or 'relevancia'
+    if ordem not in ORDENACOES:
+        return jsonify({"success": False, "message": "Ordenação inválida!"}), 400
+    # uf, cidade e raio_km (a partir da cidade ou de latitude/longitude)
+    try:
+        local = {chave: dados[chave] for chave in ('uf', 'cidade') if dados.get(chave)}
+        local.update({chave: float(dados[chave]) for chave in ('latitude', 'longitude', 'raio_km')
+                      if dados.get(chave) not in (None, '')})
+        filtros_localizacao(**local)
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({"success": False, "message": "Parâmetros de localização inválidos!"}), 400
 
-    query = Contador.query.filter_by(ativo=True)
+    try:
+        limite = int(dados.get('limit', app.config['PAGINA_LIMITE_PADRAO']))
+        limite = max(1, min(limite, app.config['PAGINA_LIMITE_MAXIMO']))
+        contadores, proximo = pagina_contadores(q, tags, limite, decodificar_cursor(dados.get('cursor')), ordem, local)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Parâmetros de paginação inválidos!"}), 400
+
+    corpo = b'{"contadores":' + lista_json(contadores) + b',"next":' + codificar_json(proximo) + b'}'
+    return app.response_class(corpo, mimetype='application/json')
+
+
+# Sugestões (autocompletar)
+# Índice de prefixos em memória com nomes de contadores, especialidades, tags e
+# cidades. Cada sugestão entra com todos os seus sufixos de palavra ("folha de
+# pagamento", "de pagamento", "pagamento") numa lista ordenada, sem acentos e
+# em minúsculas; a busca é um bisect e uma leitura até o fim do prefixo, e as
+# mais populares (contadores com o termo, ou avaliações do contador) vencem.
+# O índice é montado no primeiro uso. As alterações de perfil feitas neste
+# processo entram logo após o commit; as de outros processos, na reconstrução
+# feita quando a geração do diretório muda (conferida a cada
+# SUGESTOES_INTERVALO segundos).
+TEXTOS_PROVISORIOS = {'Especialidade a definir', 'Localização a definir'}
+PREFIXO_CURTO = 2  # prefixos até este tamanho têm o resultado guardado (intervalos grandes)
+
+
+@lru_cache(maxsize=65536)
+def normalizar_texto(texto):
+    """'São Paulo, SP' -> 'sao paulo sp'"""
+    texto = texto or ''
+    if not texto.isascii():
+        decomposto = unicodedata.normalize('NFKD', texto)
+        texto = ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+    return ' '.join(re.findall(r'\w+', texto.casefold()))
+
+
+def chaves_sugestao(texto):
+    palavras = normalizar_texto(texto).split()
+    return [' '.join(palavras[inicio:]) for inicio in range(len(palavras))]
+
+
+def contribuicoes_contador(contador_id, nome, especialidade, localizacao, tags, avaliacoes):
+    """Entradas (tipo, texto, contador_id) com que o contador contribui, e o peso de cada uma"""
+    entradas = {('contador', nome, contador_id): 1 + (avaliacoes or 0)}
+    termos = [('especialidade', especialidade), ('cidade', localizacao)] + [('tag', tag) for tag in tags]
+    for tipo, texto in termos:
+        if texto and texto not in TEXTOS_PROVISORIOS:
+            entradas[(tipo, texto, 0)] = 1
+    return entradas
+
+
+class IndiceSugestoes:
+    """Chaves normalizadas em lista ordenada (bisect), com popularidade por entrada"""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.geracao = None
+        self._verificado_em = 0.0
+        self._chaves = []  # (chave, entrada), ordenadas
+        self._popularidade = {}  # entrada -> popularidade
+        self._contadores = {}  # contador_id -> contribuições (para desfazer na atualização)
+        self._curtos = {}  # prefixo curto -> 20 entradas mais populares
+        self._lock = threading.Lock()
+        self._construcao = threading.Lock()
+
+    def construir(self):
+        contadores = db.session.execute(
+            db.select(Contador.id, Contador.nome, Contador.especialidade, Contador.localizacao,
+                      Contador.avaliacoes_count).filter_by(ativo=True)
+        ).all()
+        tags = {}
+        for contador_id, nome in db.session.execute(
+                db.select(contador_tag.c.contador_id, Tag.nome).join(Tag, Tag.id == contador_tag.c.tag_id)):
+            tags.setdefault(contador_id, []).append(nome)
+
+        popularidade, por_contador = {}, {}
+        for linha in contadores:
+            entradas = contribuicoes_contador(*linha[:4], tags.get(linha.id, []), linha.avaliacoes_count)
+            por_contador[linha.id] = entradas
+            for entrada, peso in entradas.items():
+                popularidade[entrada] = popularidade.get(entrada, 0) + peso
+        chaves = sorted((chave, entrada) for entrada in popularidade for chave in chaves_sugestao(entrada[1]))
+        with self._lock:
+            self._chaves, self._popularidade, self._contadores = chaves, popularidade, por_contador
+            self._curtos = {}
+
+    def garantir_atualizado(self):
+        """Monta no primeiro uso; depois reconstrói se a geração do diretório mudou"""
+        primeira = self.geracao is None
+        if not primeira and time.monotonic() - self._verificado_em < self.intervalo:
+            return
+        # Só a primeira montagem espera; nas outras, quem chega usa o índice atual
+        if not self._construcao.acquire(blocking=primeira):
+            return
+        try:
+            if self.geracao is not None and time.monotonic() - self._verificado_em < self.intervalo:
+                return
+            geracao = geracao_diretorio()
+            if geracao != self.geracao:
+                self.construir()
+                self.geracao = geracao
+            self._verificado_em = time.monotonic()
+        finally:
+            self._construcao.release()
+
+    def _aplicar(self, entradas, sinal):
+        for entrada, peso in entradas.items():
+            anterior = self._popularidade.get(entrada, 0)
+            atual = anterior + sinal * peso
+            if atual > 0 and anterior <= 0:
+                for chave in chaves_sugestao(entrada[1]):
+                    bisect.insort(self._chaves, (chave, entrada))
+            elif atual <= 0 and anterior > 0:
+                for chave in chaves_sugestao(entrada[1]):
+                    indice = bisect.bisect_left(self._chaves, (chave, entrada))
+                    if indice < len(self._chaves) and self._chaves[indice] == (chave, entrada):
+                        del self._chaves[indice]
+            if atual > 0:
+                self._popularidade[entrada] = atual
+            else:
+                self._popularidade.pop(entrada, None)
+
+    def atualizar(self, contador_id, dados):
+        """Troca as contribuições do contador; `dados` None remove (contador inativo)"""
+        if self.geracao is None:
+            return  # ainda não montado: a montagem já vai ler o banco
+        with self._lock:
+            self._curtos = {}
+            anteriores = self._contadores.pop(contador_id, {})
+            self._aplicar(anteriores, -1)
+            if dados is not None:
+                nome, especialidade, localizacao, tags, avaliacoes = dados
+                if tags is None:  # tags não carregadas na sessão: continuam as mesmas
+                    tags = [texto for tipo, texto, _ in anteriores if tipo == 'tag']
+                novas = contribuicoes_contador(contador_id, nome, especialidade, localizacao, tags, avaliacoes)
+                self._aplicar(novas, 1)
+                self._contadores[contador_id] = novas
+
+    def sugerir(self, prefixo, limite):
+        chave = normalizar_texto(prefixo)
+        if not chave:
+            return []
+        self.garantir_atualizado()
+        with self._lock:
+            curto = len(chave) <= PREFIXO_CURTO
+            if curto and chave in self._curtos:
+                return self._curtos[chave][:limite]
+            encontradas = set()
+            for indice in range(bisect.bisect_left(self._chaves, (chave,)), len(self._chaves)):
+                chave_indice, entrada = self._chaves[indice]
+                if not chave_indice.startswith(chave):
+                    break
+                encontradas.add(entrada)
+            popularidade = self._popularidade
+            melhores = [(entrada, popularidade[entrada]) for entrada in heapq.nlargest(
+                max(limite, 20) if curto else limite, encontradas,
+                key=lambda entrada: (popularidade[entrada], -len(entrada[1])))]
+            if curto:
+                self._curtos[chave] = melhores
+            return melhores[:limite]
+
+
+indice_sugestoes = IndiceSugestoes(app.config['SUGESTOES_INTERVALO'])
+
+
+@db.event.listens_for(Contador, 'after_insert')
+@db.event.listens_for(Contador, 'after_update')
+def _sugestoes_contador_alterado(mapper, connection, contador):
+    estado = db.inspect(contador)
+    dados = None
+    if contador.ativo is not False:
+        tags = None if 'tags' in estado.unloaded else [tag.nome for tag in contador.tags]
+        dados = (contador.nome, contador.especialidade, contador.localizacao, tags, contador.avaliacoes_count)
+    estado.session.info.setdefault('sugestoes_pendentes', {})[contador.id] = dados
+
+
+@db.event.listens_for(SessaoRoteada, 'after_commit')
+def _aplicar_sugestoes_pendentes(sessao):
+    for contador_id, dados in sessao.info.pop('sugestoes_pendentes', {}).items():
+        indice_sugestoes.atualizar(contador_id, dados)
+
+
+@db.event.listens_for(SessaoRoteada, 'after_rollback')
+def _descartar_sugestoes_pendentes(sessao):
+    sessao.info.pop('sugestoes_pendentes', None)
+
+
+@app.route('/sugestoes')
+@somente_leitura
+def sugestoes():
+    try:
+        limite = max(1, min(int(request.args.get('limit', app.config['SUGESTOES_LIMITE'])), 20))
+    except ValueError:
+        return jsonify({"success": False, "message": "Parâmetro limit inválido!"}), 400
 
-    if q:
-        query = query.filter(
-            (Contador.especialidade.ilike(f'%{q}%')) |
-            (Contador.nome.ilike(f'%{q}%')) |
-            (Contador.descricao.ilike(f'%{q}%'))
-        )
+    resultado = []
+    for (tipo, texto, contador_id), popularidade in indice_sugestoes.sugerir(request.args.get('q', ''), limite):
+        sugestao = {"tipo": tipo, "texto": texto, "popularidade": popularidade}
+        if tipo == 'contador':
+            sugestao["contador_id"] = contador_id
+        resultado.append(sugestao)
+    resposta = jsonify({"sugestoes": resultado})
+    resposta.headers['Cache-Control'] = f"public, max-age={app.config['SUGESTOES_INTERVALO']}"
+    return resposta
+
+
+# Serialização de contadores
+# Um só formato para o card (listagens) e o perfil. As listagens leem só as
+# colunas do card, como tuplas, e cada contador vira um fragmento JSON em bytes,
+# guardado por (id, versao): qualquer mudança no card incrementa a versão, então
+# o fragmento nunca fica velho. A lista é montada juntando os fragmentos.
+COLUNAS_CARD = (
+    Contador.id, Contador.versao, Contador.nome, Contador.especialidade, Contador.nota,
+    Contador.avaliacoes_count, Contador.foto, Contador.tempo_resposta, Contador.localizacao,
+    Contador.descricao, Contador.verificado, Contador.usuario_id
+)
+
+
+def contador_para_dict(contador, tags, foto='card', completo=False):
+    """Dicionário do contador; aceita a entidade ou uma linha com as COLUNAS_CARD"""
+    dados = {
+        "id": contador.id,
+        "nome": contador.nome,
+        "especialidade": contador.especialidade,
+        "nota": contador.nota,
+        "avaliacoes_count": contador.avaliacoes_count,
+        "foto": url_foto(contador.foto, foto),
+        "tags": tags,
+        "tempo_resposta": contador.tempo_resposta,
+        "localizacao": contador.localizacao,
+        "descricao": contador.descricao,
+        "verificado": contador.verificado,
+        "usuario_id": contador.usuario_id  # Adicionar para o chat se necessário
+    }
+    if completo:
+        dados["experiencia"] = contador.experiencia
+        dados["formacao"] = contador.formacao
+    return dados
+
+
+def codificar_json(valor):
+    """JSON compacto em bytes (orjson quando instalado)"""
+    if orjson is not None:
+        return orjson.dumps(valor)
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def lista_json(fragmentos):
+    return b'[' + b','.join(fragmentos) + b']'
+
+
+def json_para_html(corpo):
+    """JSON pronto para um <script>, com os mesmos escapes do filtro tojson"""
+    texto = corpo.decode('utf-8')
+    for caractere, escape in (('<', '\\u003c'), ('>', '\\u003e'), ('&', '\\u0026'), ("'", '\\u0027')):
+        texto = texto.replace(caractere, escape)
+    return Markup(texto)
+
+
+class CacheFragmentos:
+    """LRU de fragmentos (JSON dos cards, HTML dos perfis) por (id, versao)"""
+
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self.itens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def obter_varios(self, chaves):
+        with self._lock:
+            encontrados = {}
+            for chave in chaves:
+                fragmento = self.itens.get(chave)
+                if fragmento is not None:
+                    self.itens.move_to_end(chave)
+                    encontrados[chave] = fragmento
+            self.hits += len(encontrados)
+            self.misses += len(chaves) - len(encontrados)
+            return encontrados
+
+    def guardar(self, novos):
+        with self._lock:
+            self.itens.update(novos)
+            while len(self.itens) > self.max_itens:
+                self.itens.popitem(last=False)
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self.itens),
+                "max_itens": self.max_itens,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+cache_fragmentos = CacheFragmentos(app.config['CACHE_FRAGMENTOS_MAX_ITENS'])
+
+
+def tags_por_contador(ids):
+    """Nomes das tags (em ordem alfabética) de cada contador, numa só consulta"""
+    tags = {contador_id: [] for contador_id in ids}
+    linhas = db.session.execute(
+        db.select(contador_tag.c.contador_id, Tag.nome)
+        .join(Tag, Tag.id == contador_tag.c.tag_id)
+        .where(contador_tag.c.contador_id.in_(ids))
+        .order_by(Tag.nome)
+    )
+    for contador_id, nome in linhas:
+        tags[contador_id].append(nome)
+    return tags
+
+
+def serializar_cards(linhas):
+    """Fragmentos JSON dos cards; as tags só são buscadas para quem não está em cache"""
+    chaves = [(linha.id, linha.versao) for linha in linhas]
+    fragmentos = cache_fragmentos.obter_varios(chaves)
+    faltando = [linha for linha in linhas if (linha.id, linha.versao) not in fragmentos]
+    if faltando:
+        tags = tags_por_contador([linha.id for linha in faltando])
+        novos = {
+            (linha.id, linha.versao): codificar_json(contador_para_dict(linha, tags[linha.id]))
+            for linha in faltando
+        }
+        cache_fragmentos.guardar(novos)
+        fragmentos.update(novos)
+    return [fragmentos[chave] for chave in chaves]
+
+
+desempenho_cli = AppGroup('desempenho', help='Medições de desempenho.')
+
+
+@desempenho_cli.command('serializacao')
+@click.option('--linhas', '-n', multiple=True, type=int, default=(1000, 10000), help='Tamanhos das listas.')
+@click.option('--repeticoes', default=3, help='Melhor tempo entre N execuções.')
+def serializacao_command(linhas, repeticoes):
+    """Compara entidades ORM + jsonify com colunas + fragmentos em cache."""
+    global cache_fragmentos
+
+    def medir(funcao):
+        melhor = float('inf')
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return melhor * 1000
+
+    # Contadores fictícios numa transação que é desfeita no final; o cache de
+    # fragmentos é trocado por um temporário para não guardar esses ids.
+    original = cache_fragmentos
+    try:
+        tags = [Tag(nome=f'_bench_{n}') for n in range(3)]
+        usuario = Usuario(nome='_bench', email='_bench@exemplo.com', senha='-', tipo='contador')
+        db.session.add_all([usuario, *tags])
+        db.session.flush()
+        ultimo_id = db.session.query(db.func.coalesce(db.func.max(Contador.id), 0)).scalar()
+        for n in range(max(linhas)):
+            db.session.add(Contador(usuario_id=usuario.id, nome=f'Contador {n}', especialidade='Tributário', nota=4.5,
+                                    avaliacoes_count=10, foto='https://i.pravatar.cc/150?img=1',
+                                    localizacao='São Paulo, SP', descricao='Descrição ' * 10,
+                                    verificado=True, tags=tags))
+        db.session.flush()
+
+        for quantidade in linhas:
+            limite = ultimo_id + quantidade
+
+            def antigo():
+                contadores = Contador.query.filter(Contador.id > ultimo_id, Contador.id <= limite).all()
+                dados = [contador_para_dict(contador, [tag.nome for tag in contador.tags]) for contador in contadores]
+                app.json.response(dados).get_data()
+                db.session.expunge_all()
+
+            def novo():
+                linhas_card = db.session.query(*COLUNAS_CARD) \
+                    .filter(Contador.id > ultimo_id, Contador.id <= limite).all()
+                lista_json(serializar_cards(linhas_card))
+
+            def novo_frio():
+                global cache_fragmentos
+                cache_fragmentos = CacheFragmentos(max(linhas))
+                novo()
+
+            tempo_antigo = medir(antigo)
+            tempo_frio = medir(novo_frio)
+            tempo_quente = medir(novo)
+            click.echo(f"{quantidade:>6} linhas: ORM+jsonify {tempo_antigo:8.1f} ms | "
+                       f"colunas (cache frio) {tempo_frio:8.1f} ms | "
+                       f"colunas (cache quente) {tempo_quente:8.1f} ms | "
+                       f"ganho {tempo_antigo / tempo_quente:5.1f}x")
+        click.echo(f"backend JSON: {'orjson' if orjson is not None else 'json'}")
+    finally:
+        cache_fragmentos = original
+        db.session.rollback()
+
+
+app.cli.add_command(desempenho_cli)
+
+
+# Paginação por cursor (keyset)
+# A ordem é sempre (chave de ordenação, id). O cursor carrega os valores da
+# última linha da página e a próxima página começa logo depois dela, sem OFFSET.
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Valores do cursor opaco; None para a primeira página. Levanta ValueError se inválido"""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as erro:
+        raise ValueError('cursor inválido') from erro
+    if not isinstance(valores, list) or len(valores) != 2 or \
+            not all(isinstance(valor, (int, float)) and not isinstance(valor, bool) for valor in valores):
+        raise ValueError('cursor inválido')
+    return tuple(valores)
+
+
+def pagina_contadores(q, tags, limite, cursor, ordem='relevancia', local=None):
+    """Página de contadores (com cache) e o cursor da próxima página"""
+    local = tuple(sorted((local or {}).items()))
+    chave = ('filtrar', (q or '').strip().lower(), tuple(sorted(set(tags))), limite, cursor, ordem, local)
+    return em_cache(chave, lambda: buscar_contadores(q, tags, limite, cursor, ordem, dict(local)))
+
+
+def buscar_contadores(q, tags, limite, cursor=None, ordem='relevancia', local=None):
+    """Contadores ativos que casam com o texto, possuem todas as tags e estão no local (fragmentos JSON)
+
+    `local` tem os argumentos de filtros_localizacao (uf, cidade, latitude, longitude, raio_km).
+    """
+    if ordem not in ORDENACOES:
+        raise ValueError('ordenação inválida')
+    if cursor and len(cursor) != 2:
+        raise ValueError('cursor inválido')
+    query = db.session.query(*COLUNAS_CARD).filter_by(ativo=True)
+    if local:
+        query = query.filter(*filtros_localizacao(**local))
+
+    expressao = expressao_busca(q)
+    busca = subconsulta_busca(expressao) if expressao else None
+    if busca is not None:
+        query = query.join(busca, busca.c.id == Contador.id)
+
+    if busca is not None and ordem == 'relevancia':
+        # Com texto, a relevância é a do índice FTS5 (no bm25 menor é melhor)
+        chave, descendente = busca.c.rank, False
+    else:
+        # Sem texto, cada ordenação percorre o seu índice (ativo, coluna, id)
+        chave, descendente = ORDENACOES[ordem]
+    query = query.add_columns(chave)
+    if descendente:
+        query = query.order_by(chave.desc(), Contador.id.desc())
+        if cursor:
+            query = query.filter(db.tuple_(chave, Contador.id) < cursor)
+    else:
+        query = query.order_by(chave, Contador.id)
+        if cursor:
+            query = query.filter(db.tuple_(chave, Contador.id) > cursor)
 
     if tags:
-        for tag in tags:
-            query = query.filter(Contador.tags.ilike(f'%{tag}%'))
+        query = query.filter(Contador.id.in_(subconsulta_tags(tags)))
 
-    contadores = query.all()
-    contadores_data = []
+    linhas = query.limit(limite + 1).all()
+
+    proximo = None
+    if len(linhas) > limite:
+        ultima = linhas[limite - 1]
+        proximo = codificar_cursor([ultima[-1], ultima.id])
+    return serializar_cards(linhas[:limite]), proximo
 
-    for contador in contadores:
-        contadores_data.append({
-            "id": contador.id,
-            "nome": contador.nome,
-            "especialidade": contador.especialidade,
-            "nota": contador.nota,
-            "avaliacoes_count": contador.avaliacoes_count,
-            "foto": contador.foto,
-            "tags": json.loads(contador.tags) if contador.tags else [],
-            "tempo_resposta": contador.tempo_resposta,
-            "localizacao": contador.localizacao,
-            "descricao": contador.descricao,
-            "verificado": contador.verificado
-        })
 
-    return jsonify(contadores_data)
+@app.route('/cache/estatisticas')
+def estatisticas_cache():
+    if tipo_usuario_atual() != 'admin':
+        return jsonify({"success": False, "message": "Acesso restrito a administradores!"}), 403
+
+    return jsonify({**cache_diretorio.estatisticas(), "fragmentos": cache_fragmentos.estatisticas(),
+                    "perfis": cache_perfis.estatisticas()})
 
 
 @app.route('/cadastrar_contador', methods=['POST'])
 def cadastrar_contador():
-    if 'usuario_id' not in session:
+    usuario = usuario_atual()
+    if usuario is None:
         return jsonify({"success": False, "message": "Usuário não logado!"})
 
     dados = request.get_json()
 
     # Verificar se o usuário é um contador
-    usuario = Usuario.query.get(session['usuario_id'])
     if usuario.tipo != 'contador':
         return jsonify({"success": False, "message": "Apenas contadores podem cadastrar perfis!"})
 
     # Atualizar perfil do contador
-    contador = Contador.query.filter_by(usuario_id=usuario.id).first()
+    contador = db.session.get(Contador, usuario.contador_id) if usuario.contador_id else None
     if not contador:
         contador = Contador(usuario_id=usuario.id)
 
     contador.nome = dados.get('nome', usuario.nome)
     contador.especialidade = dados.get('especialidade', '')
     contador.foto = dados.get('foto') or usuario.foto
-    contador.tags = json.dumps(dados.get('tags', []))
+    definir_tags(contador, dados.get('tags', []))
     contador.localizacao = dados.get('localizacao', '')
     contador.tempo_resposta = dados.get('tempo_resposta', '4 horas')
     contador.descricao = dados.get('descricao', '')
 
     db.session.add(contador)
+    nova_versao(contador)
+    indexar_contador(contador)
+    invalidar_diretorio()
+    auditar('Cadastrou o perfil de contador')
     db.session.commit()
+    esquecer_identidade(usuario.id)
 
     return jsonify({"success": True, "message": "Perfil atualizado com sucesso!"})
 
@@ -411,15 +3402,23 @@ def enviar_proposta():
 
     dados = request.get_json()
 
+    contador_id = dados.get('contador_id')
+    contador = db.session.get(Contador, contador_id) if contador_id else None
+    if contador is None:
+        return jsonify({"success": False, "message": "Contador não encontrado!"}), 404
+
     proposta = Proposta(
-        contador_id=dados.get('contador_id'),
+        contador_id=contador.id,
         cliente_id=session['usuario_id'],
         mensagem=dados.get('mensagem'),
         status='pendente'
     )
 
     db.session.add(proposta)
+    db.session.flush()
+    auditar(f"Enviou a proposta {proposta.id} ao contador {proposta.contador_id}")
     db.session.commit()
+    publicar_proposta(proposta)
 
     return jsonify({"success": True, "message": "Proposta enviada com sucesso!"})
 
@@ -434,16 +3433,11 @@ def avaliar_contador():
     nota = dados.get('nota')
     comentario = dados.get('comentario', '')
 
-    # Verificar se o usuário já avaliou este contador
-    avaliacao_existente = Avaliacao.query.filter_by(
-        contador_id=contador_id,
-        usuario_id=session['usuario_id']
-    ).first()
-
-    if avaliacao_existente:
-        return jsonify({"success": False, "message": "Você já avaliou este contador!"})
+    # `True` e `1.0` são iguais a 1 para o `in`; só aceita inteiros de verdade
+    if not isinstance(nota, int) or isinstance(nota, bool) or not 1 <= nota <= 5:
+        return jsonify({"success": False, "message": "A nota deve ser de 1 a 5 estrelas!"})
 
-    # Criar nova avaliação
+    # Criar nova avaliação; o índice único (contador_id, usuario_id) barra duplicatas
     avaliacao = Avaliacao(
         contador_id=contador_id,
         usuario_id=session['usuario_id'],
@@ -452,21 +3446,370 @@ def avaliar_contador():
     )
 
     db.session.add(avaliacao)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"success": False, "message": "Você já avaliou este contador!"})
 
-    # Atualizar nota média do contador
-    contador = Contador.query.get(contador_id)
-    total_avaliacoes = Avaliacao.query.filter_by(contador_id=contador_id).count()
-    soma_notas = db.session.query(db.func.sum(Avaliacao.nota)).filter_by(contador_id=contador_id).scalar()
-
-    contador.nota = soma_notas / total_avaliacoes if total_avaliacoes > 0 else nota
-    contador.avaliacoes_count = total_avaliacoes
+    # Atualizar os agregados do contador em um único UPDATE atômico
+    if not registrar_nota(contador_id, nota):
+        db.session.rollback()
+        return jsonify({"success": False, "message": "Contador não encontrado!"})
+    invalidar_diretorio()
+    auditar(f"Avaliou o contador {contador_id} com nota {nota}")
 
     db.session.commit()
 
     return jsonify({"success": True, "message": "Avaliação enviada com sucesso!"})
 
 
+def registrar_nota(contador_id, nota):
+    """Soma uma nota aos agregados do contador; retorna False se ele não existir"""
+    estrelas = getattr(Contador, f'estrelas_{int(nota)}')
+    # No UPDATE do SQLite as expressões usam os valores anteriores da linha
+    resultado = db.session.execute(
+        db.update(Contador)
+        .where(Contador.id == contador_id)
+        .values({
+            Contador.soma_notas: Contador.soma_notas + nota,
+            Contador.avaliacoes_count: db.func.coalesce(Contador.avaliacoes_count, 0) + 1,
+            Contador.nota: (Contador.soma_notas + nota) / (db.func.coalesce(Contador.avaliacoes_count, 0) + 1),
+            estrelas: estrelas + 1,
+            Contador.versao: Contador.versao + 1
+        })
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != 1:
+        return False
+    atualizar_ranking(Contador.id == contador_id)
+    return True
+
+
+def recalcular_avaliacoes():
+    """Reconstrói os agregados a partir da tabela avaliacao
+
+    Contadores sem nenhuma linha em avaliacao ficam intocados: a nota deles
+    veio da semente ou de bancos anteriores à migração 3 e não há como
+    reconstruí-la.
+    """
+    colunas = [
+        db.func.count().label('total'),
+        db.func.sum(Avaliacao.nota).label('soma')
+    ] + [
+        db.func.sum(db.case((db.cast(Avaliacao.nota, db.Integer) == n, 1), else_=0)).label(f'estrelas_{n}')
+        for n in range(1, 6)
+    ]
+    agregados = db.select(Avaliacao.contador_id, *colunas).group_by(Avaliacao.contador_id).subquery()
+    db.session.execute(
+        db.update(Contador)
+        .where(Contador.id == agregados.c.contador_id)
+        .values(
+            avaliacoes_count=agregados.c.total,
+            soma_notas=agregados.c.soma,
+            nota=agregados.c.soma / agregados.c.total,
+            versao=Contador.versao + 1,
+            **{f'estrelas_{n}': agregados.c[f'estrelas_{n}'] for n in range(1, 6)}
+        )
+        .execution_options(synchronize_session=False)
+    )
+    atualizar_ranking()
+    invalidar_diretorio()
+    db.session.commit()
+
+
+avaliacoes_cli = AppGroup('avaliacoes', help='Manutenção das avaliações.')
+
+
+@avaliacoes_cli.command('recalcular')
+def recalcular_avaliacoes_command():
+    """Recalcula nota, contagem e histograma de todos os contadores."""
+    recalcular_avaliacoes()
+    print("✅ Avaliações recalculadas com sucesso!")
+
+
+app.cli.add_command(avaliacoes_cli)
+
+
+# Ranking do diretório
+# A ordem padrão do diretório é contador.pontuacao, indexada com ativo e id.
+# Ela combina a nota bayesiana (a média puxada para RANKING_NOTA_PRIORI até o
+# contador juntar avaliações, guardada em nota_ajustada), o selo de
+# verificado, o tempo de resposta e a taxa de aceite das propostas
+# respondidas. Um UPDATE do próprio contador a recalcula a cada avaliação,
+# resposta a proposta ou edição do perfil; `flask ranking recalcular`
+# reconstrói tudo.
+# nome -> (coluna, descendente)
+ORDENACOES = {
+    'relevancia': (Contador.pontuacao, True),
+    'avaliacao': (Contador.nota_ajustada, True),
+    'resposta': (Contador.tempo_resposta_horas, False),
+}
+STATUS_RESPONDIDOS = ('aceita', 'recusada')
+CAMPOS_RANKING = ('tempo_resposta', 'verificado', 'soma_notas', 'avaliacoes_count')
+HORAS_RESPOSTA_DESCONHECIDA = 168.0  # "tempo_resposta" que não dá para interpretar
+RE_TEMPO_RESPOSTA = re.compile(r'(\d+(?:[.,]\d+)?)\s*(min|h|dia)', re.IGNORECASE)
+UNIDADES_RESPOSTA = {'min': 1 / 60, 'h': 1.0, 'dia': 24.0}
+
+
+def horas_resposta(texto):
+    """'2 horas' -> 2.0, '30 minutos' -> 0.5, '1 dia' -> 24.0"""
+    encontrado = RE_TEMPO_RESPOSTA.search(texto or '')
+    if not encontrado:
+        return HORAS_RESPOSTA_DESCONHECIDA
+    return float(encontrado.group(1).replace(',', '.')) * UNIDADES_RESPOSTA[encontrado.group(2).lower()]
+
+
+def expressao_nota_ajustada():
+    priori, peso = app.config['RANKING_NOTA_PRIORI'], app.config['RANKING_PESO_PRIORI']
+    return (Contador.soma_notas + priori * peso) / (db.func.coalesce(Contador.avaliacoes_count, 0) + peso)
+
+
+def expressao_pontuacao(horas=None):
+    """Pontuação em SQL; `horas` substitui tempo_resposta_horas quando ela muda no mesmo UPDATE"""
+    pesos = app.config['RANKING_PESOS']
+    horas = Contador.tempo_resposta_horas if horas is None else db.literal(horas)
+    return (
+        pesos['nota'] * expressao_nota_ajustada() / 5
+        + pesos['verificado'] * db.case((Contador.verificado.is_(True), 1.0), else_=0.0)
+        + pesos['resposta'] * 24.0 / (24.0 + horas)
+        + pesos['aceite'] * (Contador.propostas_aceitas + 1.0) / (Contador.propostas_respondidas + 2.0)
+    )
+
+
+def atualizar_ranking(*condicoes):
+    """Recalcula nota ajustada e pontuação dos contadores filtrados (todos, sem condições)"""
+    db.session.execute(
+        db.update(Contador).where(*condicoes)
+        .values(nota_ajustada=expressao_nota_ajustada(), pontuacao=expressao_pontuacao())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def registrar_resposta_proposta(contador_id, status_anterior, status_novo):
+    """Atualiza a taxa de aceite e a pontuação. Retorna True se algo mudou"""
+    respondidas = (status_novo in STATUS_RESPONDIDOS) - (status_anterior in STATUS_RESPONDIDOS)
+    aceitas = (status_novo == 'aceita') - (status_anterior == 'aceita')
+    if not respondidas and not aceitas:
+        return False
+    db.session.execute(
+        db.update(Contador).where(Contador.id == contador_id)
+        .values(propostas_respondidas=Contador.propostas_respondidas + respondidas,
+                propostas_aceitas=Contador.propostas_aceitas + aceitas)
+        .execution_options(synchronize_session=False)
+    )
+    atualizar_ranking(Contador.id == contador_id)
+    return True
+
+
+def _ranking_do_contador(connection, contador):
+    horas = horas_resposta(contador.tempo_resposta)
+    connection.execute(
+        db.update(Contador.__table__).where(Contador.__table__.c.id == contador.id)
+        .values(tempo_resposta_horas=horas, nota_ajustada=expressao_nota_ajustada(),
+                pontuacao=expressao_pontuacao(horas))
+    )
+
+
+@db.event.listens_for(Contador, 'after_insert')
+def _ranking_contador_novo(mapper, connection, contador):
+    _ranking_do_contador(connection, contador)
+
+
+@db.event.listens_for(Contador, 'after_update')
+def _ranking_contador_alterado(mapper, connection, contador):
+    estado = db.inspect(contador)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_RANKING):
+        _ranking_do_contador(connection, contador)
+
+
+def recalcular_ranking():
+    """Reconstrói horas de resposta, taxa de aceite e pontuação de todos os contadores (sem commit)"""
+    for texto in db.session.execute(db.select(Contador.tempo_resposta).distinct()).scalars().all():
+        db.session.execute(
+            db.update(Contador).where(Contador.tempo_resposta.is_not_distinct_from(texto))
+            .values(tempo_resposta_horas=horas_resposta(texto))
+            .execution_options(synchronize_session=False)
+        )
+    agregados = db.select(
+        Proposta.contador_id,
+        db.func.sum(db.case((Proposta.status.in_(STATUS_RESPONDIDOS), 1), else_=0)).label('respondidas'),
+        db.func.sum(db.case((Proposta.status == 'aceita', 1), else_=0)).label('aceitas'),
+    ).group_by(Proposta.contador_id).subquery()
+    db.session.execute(db.update(Contador).values(propostas_respondidas=0, propostas_aceitas=0)
+                       .execution_options(synchronize_session=False))
+    db.session.execute(
+        db.update(Contador).where(Contador.id == agregados.c.contador_id)
+        .values(propostas_respondidas=agregados.c.respondidas, propostas_aceitas=agregados.c.aceitas)
+        .execution_options(synchronize_session=False)
+    )
+    atualizar_ranking()
+    invalidar_diretorio()
+
+
+ranking_cli = AppGroup('ranking', help='Pontuação do diretório.')
+
+
+@ranking_cli.command('recalcular')
+def recalcular_ranking_command():
+    """Recalcula a pontuação de todos os contadores."""
+    recalcular_ranking()
+    db.session.commit()
+    print("✅ Ranking recalculado com sucesso!")
+
+
+app.cli.add_command(ranking_cli)
+
+
+# Localização
+# O texto livre de contador.localizacao ("Campinas, SP", "Campinas - SP") é
+# resolvido contra a tabela municipio e copiado para colunas indexadas do
+# contador: municipio_id, uf, latitude e longitude. dados/municipios.csv
+# (nome, uf, latitude, longitude) traz as capitais e as maiores cidades;
+# `flask localizacao carregar` aceita a tabela completa do IBGE no mesmo
+# formato. A busca por raio filtra primeiro por uma caixa de latitude e
+# longitude (pelo índice) e só calcula a distância exata do que sobrou.
+ARQUIVO_MUNICIPIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'municipios.csv')
+RE_LOCALIZACAO = re.compile(r'^\s*(.+?)\s*[,/\-–]\s*([A-Za-z]{2})\s*$')
+KM_POR_GRAU = 111.32
+RAIO_TERRA_KM = 6371.0
+RAIO_MAXIMO_KM = 1000
+UFS = ('AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB', 'PE', 'PI',
+       'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO')
+
+
+def distancia_km(latitude1, longitude1, latitude2, longitude2):
+    """Distância pela fórmula de haversine (também registrada como função SQL)"""
+    if None in (latitude1, longitude1, latitude2, longitude2):
+        return None
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def separar_localizacao(texto):
+    """'Campinas, SP' -> ('campinas', 'SP'); sem UF -> ('campinas', None)"""
+    encontrado = RE_LOCALIZACAO.match(texto or '')
+    if encontrado:
+        return normalizar_texto(encontrado.group(1)), encontrado.group(2).upper()
+    return normalizar_texto(texto), None
+
+
+def consulta_municipios(cidade, uf=None):
+    consulta = db.select(Municipio.id, Municipio.uf, Municipio.latitude, Municipio.longitude) \
+        .where(Municipio.nome_normalizado == normalizar_texto(cidade))
+    if uf:
+        consulta = consulta.where(Municipio.uf == uf.upper())
+    return consulta
+
+
+def resolver_localizacao(texto, conexao=None):
+    """Colunas de localização do contador para o texto; cidade desconhecida ou ambígua fica só com a UF"""
+    cidade, uf = separar_localizacao(texto)
+    municipios = (conexao or db.session).execute(consulta_municipios(cidade, uf)).all() if cidade else []
+    if len(municipios) != 1:
+        return {'municipio_id': None, 'uf': uf, 'latitude': None, 'longitude': None}
+    municipio = municipios[0]
+    return {'municipio_id': municipio.id, 'uf': municipio.uf,
+            'latitude': municipio.latitude, 'longitude': municipio.longitude}
+
+
+@db.event.listens_for(Contador, 'after_insert')
+def _localizacao_contador_novo(mapper, connection, contador):
+    connection.execute(db.update(Contador.__table__).where(Contador.__table__.c.id == contador.id)
+                       .values(**resolver_localizacao(contador.localizacao, connection)))
+
+
+@db.event.listens_for(Contador, 'after_update')
+def _localizacao_contador_alterada(mapper, connection, contador):
+    if db.inspect(contador).attrs.localizacao.history.has_changes():
+        _localizacao_contador_novo(mapper, connection, contador)
+
+
+def atualizar_localizacoes(*condicoes):
+    """Resolve a localização dos contadores filtrados, uma vez por texto distinto (sem commit)"""
+    textos = db.session.execute(db.select(Contador.localizacao).where(*condicoes).distinct()).scalars().all()
+    for texto in textos:
+        db.session.execute(
+            db.update(Contador).where(Contador.localizacao.is_not_distinct_from(texto), *condicoes)
+            .values(**resolver_localizacao(texto))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def carregar_municipios(arquivo=ARQUIVO_MUNICIPIOS):
+    """Substitui a tabela municipio pelo CSV (nome, uf, latitude, longitude). Retorna a quantidade"""
+    with open(arquivo, encoding='utf-8-sig', newline='') as entrada:
+        linhas = [{
+            'nome': linha['nome'].strip(),
+            'nome_normalizado': normalizar_texto(linha['nome']),
+            'uf': linha['uf'].strip().upper(),
+            'latitude': float(linha['latitude']),
+            'longitude': float(linha['longitude']),
+        } for linha in csv.DictReader(entrada)]
+    db.session.execute(db.update(Contador).values(municipio_id=None)
+                       .execution_options(synchronize_session=False))
+    db.session.execute(db.delete(Municipio))
+    if linhas:
+        db.session.execute(db.insert(Municipio), linhas)
+    return len(linhas)
+
+
+def filtros_localizacao(uf=None, cidade=None, latitude=None, longitude=None, raio_km=None):
+    """Condições do /filtrar. Com raio_km, o centro é a cidade ou latitude/longitude. ValueError se inválido"""
+    if uf is not None:
+        uf = uf.strip().upper()
+        if not re.fullmatch(r'[A-Z]{2}', uf):
+            raise ValueError('uf inválida')
+    if raio_km is not None and not 0 < raio_km <= RAIO_MAXIMO_KM:
+        raise ValueError('raio inválido')
+    if (latitude is None) != (longitude is None) or \
+            (latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180)):
+        raise ValueError('coordenadas inválidas')
+
+    if cidade:
+        municipios = db.session.execute(consulta_municipios(cidade, uf)).all()
+        if raio_km is None:
+            return [Contador.municipio_id.in_([municipio.id for municipio in municipios])]
+        if len(municipios) != 1:
+            return [db.false()]  # cidade desconhecida ou ambígua (informe a uf)
+        latitude, longitude = municipios[0].latitude, municipios[0].longitude
+
+    if raio_km is None:
+        return [Contador.uf == uf] if uf else []
+    if latitude is None:
+        raise ValueError('raio sem cidade ou coordenadas')
+    # Caixa em volta do círculo: 1° de latitude ~ 111 km; o de longitude encolhe com o cosseno
+    delta_latitude = raio_km / KM_POR_GRAU
+    delta_longitude = raio_km / (KM_POR_GRAU * max(math.cos(math.radians(latitude)), 0.01))
+    return [
+        Contador.latitude.between(latitude - delta_latitude, latitude + delta_latitude),
+        Contador.longitude.between(longitude - delta_longitude, longitude + delta_longitude),
+        db.func.distancia_km(Contador.latitude, Contador.longitude, latitude, longitude) <= raio_km,
+    ]
+
+
+localizacao_cli = AppGroup('localizacao', help='Municípios e localização dos contadores.')
+
+
+@localizacao_cli.command('carregar')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False), default=ARQUIVO_MUNICIPIOS)
+def carregar_municipios_command(arquivo):
+    """Carrega os municípios de um CSV (nome, uf, latitude, longitude) e resolve os contadores de novo."""
+    total = carregar_municipios(arquivo)
+    atualizar_localizacoes()
+    invalidar_diretorio()
+    db.session.commit()
+    print(f"✅ {total} município(s) carregado(s)")
+
+
+app.cli.add_command(localizacao_cli)
+
+
 @app.route('/minhas_avaliacoes')
+@somente_leitura
 def minhas_avaliacoes():
     if 'usuario_id' not in session:
         return redirect(url_for('login'))
@@ -474,6 +3817,7 @@ def minhas_avaliacoes():
     usuario_id = session['usuario_id']
     avaliacoes = Avaliacao.query.filter_by(usuario_id=usuario_id) \
         .join(Contador) \
+        .options(db.contains_eager(Avaliacao.contador)) \
         .order_by(Avaliacao.data_avaliacao.desc()) \
         .all()
 
@@ -486,46 +3830,159 @@ def minhas_avaliacoes():
                            data_limite=data_limite)
 
 
-@app.route('/perfil_contador/<int:contador_id>')
-def perfil_contador(contador_id):
-    contador = Contador.query.get_or_404(contador_id)
-    avaliacoes = Avaliacao.query.filter_by(contador_id=contador_id)\
-        .join(Usuario)\
-        .order_by(Avaliacao.data_avaliacao.desc())\
-        .all()
+# Perfil do contador
+# As partes fixas da página (cabeçalho com nota, tags e formação; "Sobre") são
+# renderizadas uma vez por versão do contador e guardadas em cache_perfis;
+# editar_perfil, cadastrar_contador e avaliar_contador incrementam a versão,
+# então uma entrada nunca fica velha. As avaliações vêm por cursor
+# (data_avaliacao, id): a primeira página vai na própria página e as demais
+# em /perfil_contador/<id>/avaliacoes, como JSON com o HTML dos itens.
+cache_perfis = CacheFragmentos(app.config['CACHE_PERFIS_MAX_ITENS'])
+EPOCA = datetime(1970, 1, 1)
 
-    contador_data = {
-        "id": contador.id,
-        "nome": contador.nome,
-        "especialidade": contador.especialidade,
-        "nota": contador.nota,
-        "avaliacoes_count": contador.avaliacoes_count,
-        "foto": contador.foto,
-        "tags": json.loads(contador.tags) if contador.tags else [],
-        "tempo_resposta": contador.tempo_resposta,
-        "localizacao": contador.localizacao,
-        "descricao": contador.descricao,
-        "verificado": contador.verificado,
-        "experiencia": contador.experiencia,
-        "formacao": contador.formacao
+
+def etag_perfil_contador(contador_id):
+    versao = versao_contador(contador_id)
+    if versao is None:
+        return None  # 404
+    return [versao, 'usuario_id' in session]
+
+
+def tocar_perfis_avaliados(usuario_id):
+    """Nova versão para os perfis que exibem avaliações do usuário"""
+    db.session.execute(
+        db.update(Contador)
+        .where(Contador.id.in_(db.select(Avaliacao.contador_id).where(Avaliacao.usuario_id == usuario_id)))
+        .values(versao=Contador.versao + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def fragmentos_perfil(contador_id):
+    """Partes fixas do perfil já renderizadas; None se o contador não existe"""
+    versao = versao_contador(contador_id)
+    if versao is None:
+        return None
+    chave = (contador_id, versao)
+    perfil = cache_perfis.obter_varios([chave]).get(chave)
+    if perfil is None:
+        contador = db.session.get(Contador, contador_id)
+        dados = contador_para_dict(contador, [tag.nome for tag in contador.tags], foto='perfil', completo=True)
+        perfil = {
+            'id': contador.id,
+            'nome': contador.nome,
+            'avaliacoes_count': contador.avaliacoes_count or 0,
+            'cabecalho': Markup(render_template('_perfil_cabecalho.html', contador=dados)),
+            'sobre': Markup(render_template('_perfil_sobre.html', contador=dados)),
+        }
+        cache_perfis.guardar({chave: perfil})
+    return perfil
+
+
+def consulta_avaliacoes(contador_id, limite, depois_de=None):
+    consulta = db.select(Avaliacao).join(Usuario, Avaliacao.usuario_id == Usuario.id) \
+        .options(db.contains_eager(Avaliacao.usuario)) \
+        .where(Avaliacao.contador_id == contador_id)
+    if depois_de:
+        consulta = consulta.where(db.tuple_(Avaliacao.data_avaliacao, Avaliacao.id) < depois_de)
+    return consulta.order_by(Avaliacao.data_avaliacao.desc(), Avaliacao.id.desc()).limit(limite)
+
+
+def cursor_data_id(data, id_):
+    """Cursor (data, id) com a data em microssegundos desde 1970 (inteiro, sem perda)"""
+    return codificar_cursor([(data - EPOCA) // timedelta(microseconds=1), id_])
+
+
+def posicao_cursor_data_id(cursor):
+    """(data, id) de um cursor de cursor_data_id já decodificado. Levanta ValueError fora do intervalo de datas"""
+    if not cursor:
+        return None
+    try:
+        return EPOCA + timedelta(microseconds=cursor[0]), cursor[1]
+    except OverflowError as erro:  # data fora do intervalo do datetime
+        raise ValueError('cursor inválido') from erro
+
+
+def pagina_avaliacoes(contador_id, limite, cursor=None):
+    """Avaliações mais recentes do contador e o cursor da próxima página"""
+    avaliacoes = db.session.execute(
+        consulta_avaliacoes(contador_id, limite + 1, posicao_cursor_data_id(cursor))).scalars().all()
+    proximo = None
+    if len(avaliacoes) > limite:
+        ultima = avaliacoes[limite - 1]
+        proximo = cursor_data_id(ultima.data_avaliacao, ultima.id)
+    return avaliacoes[:limite], proximo
+
+
+def avaliacao_para_dict(avaliacao):
+    return {
+        "id": avaliacao.id,
+        "nome": avaliacao.usuario.nome,
+        "foto": url_foto(avaliacao.usuario.foto, 'avatar'),
+        "nota": avaliacao.nota,
+        "comentario": avaliacao.comentario,
+        "data": avaliacao.data_avaliacao.isoformat()
     }
 
+
+@app.route('/perfil_contador/<int:contador_id>')
+@somente_leitura
+@condicional(etag_perfil_contador)
+def perfil_contador(contador_id):
+    perfil = fragmentos_perfil(contador_id)
+    if perfil is None:
+        abort(404)
+    avaliacoes, proximo = pagina_avaliacoes(contador_id, app.config['AVALIACOES_POR_PAGINA'])
+
     return render_template('perfil_contador.html',
-                           contador=contador_data,
+                           perfil=perfil,
                            avaliacoes=avaliacoes,
+                           proximo_cursor=proximo,
                            usuario_logado='usuario_id' in session)
 
 
+def etag_avaliacoes(contador_id):
+    versao = versao_contador(contador_id)
+    if versao is None:
+        return None  # 404
+    return [versao, sorted(request.args.items(multi=True))]
+
+
+@app.route('/perfil_contador/<int:contador_id>/avaliacoes')
+@somente_leitura
+@condicional(etag_avaliacoes, publico=True)
+def avaliacoes_contador(contador_id):
+    if versao_contador(contador_id) is None:
+        return jsonify({"success": False, "message": "Contador não encontrado!"}), 404
+    try:
+        limite = int(request.args.get('limit', app.config['AVALIACOES_POR_PAGINA']))
+        limite = max(1, min(limite, app.config['PAGINA_LIMITE_MAXIMO']))
+        avaliacoes, proximo = pagina_avaliacoes(contador_id, limite, decodificar_cursor(request.args.get('cursor')))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Parâmetros de paginação inválidos!"}), 400
+
+    return jsonify({
+        "success": True,
+        "avaliacoes": [avaliacao_para_dict(avaliacao) for avaliacao in avaliacoes],
+        "html": ''.join(render_template('_avaliacao.html', avaliacao=avaliacao) for avaliacao in avaliacoes),
+        "next": proximo
+    })
+
+
 # Rota Corrigida - Editar Perfil
 @app.route('/editar_perfil', methods=['GET', 'POST'])
 def editar_perfil():
-    if 'usuario_id' not in session:
+    identidade = usuario_atual()
+    if identidade is None:
         return redirect(url_for('login'))
 
-    usuario = Usuario.query.get(session['usuario_id'])
+    usuario = db.session.get(Usuario, identidade.id)
+    contador = db.session.get(Contador, identidade.contador_id) if identidade.contador_id else None
 
     if request.method == 'POST':
         # Processar upload de arquivo
+        nome_anterior = usuario.nome
+        foto_anterior = usuario.foto
         foto_url = usuario.foto
         if 'foto' in request.files:
             file = request.files['foto']
@@ -533,6 +3990,8 @@ def editar_perfil():
                 nova_foto = salvar_arquivo(file)
                 if nova_foto:
                     foto_url = nova_foto
+                else:
+                    flash('Arquivo de imagem inválido.', 'error')
 
         # Atualizar dados básicos do usuário
         usuario.nome = request.form.get('nome', usuario.nome)
@@ -543,7 +4002,6 @@ def editar_perfil():
 
         # Se for contador, atualizar também o perfil do contador
         if usuario.tipo == 'contador':
-            contador = Contador.query.filter_by(usuario_id=usuario.id).first()
             if contador:
                 contador.nome = request.form.get('nome', usuario.nome)
                 contador.especialidade = request.form.get('especialidade', contador.especialidade)
@@ -554,88 +4012,174 @@ def editar_perfil():
                 contador.experiencia = request.form.get('experiencia', contador.experiencia)
                 contador.formacao = request.form.get('formacao', contador.formacao)
 
-                tags = request.form.getlist('tags')
-                contador.tags = json.dumps(tags)
+                definir_tags(contador, request.form.getlist('tags'))
+                nova_versao(contador)
+                indexar_contador(contador)
+                invalidar_diretorio()
 
-        db.session.commit()
+        # Nome e foto do usuário aparecem nas avaliações que ele escreveu
+        if usuario.nome != nome_anterior or foto_url != foto_anterior:
+            tocar_perfis_avaliados(usuario.id)
 
-        # Atualizar a sessão
-        session['usuario_nome'] = usuario.nome
-        session['usuario_email'] = usuario.email
-        session['usuario_foto'] = usuario.foto
+        if foto_anterior != foto_url and RE_FOTO_ENVIADA.match(foto_anterior or ''):
+            enfileirar('remover_foto', prioridade='baixa', url=foto_anterior)
+        auditar('Atualizou o perfil')
+        db.session.commit()
+        esquecer_identidade(usuario.id)
 
         flash('Perfil atualizado com sucesso!', 'success')
         return redirect(url_for('editar_perfil'))
 
-    contador = None
-    if usuario.tipo == 'contador':
-        contador = Contador.query.filter_by(usuario_id=usuario.id).first()
-
     return render_template('editar_perfil.html', usuario=usuario, contador=contador)
 
 
+def consulta_estatisticas_propostas(filtro, data_limite):
+    def contar(condicao):
+        return db.func.coalesce(db.func.sum(db.case((condicao, 1), else_=0)), 0)
+
+    return db.select(
+        db.func.count(Proposta.id).label('total'),
+        contar(Proposta.status == 'pendente').label('pendentes'),
+        contar(Proposta.status == 'aceita').label('aceitas'),
+        contar(Proposta.status == 'recusada').label('recusadas'),
+        contar(Proposta.data_envio >= data_limite).label('recentes')
+    ).where(filtro)
+
+
+def estatisticas_propostas(filtro, dias_recentes=30):
+    """Contagens de propostas por status e dos últimos dias, em uma única consulta agregada"""
+    data_limite = datetime.utcnow() - timedelta(days=dias_recentes)
+    linha = db.session.execute(consulta_estatisticas_propostas(filtro, data_limite)).one()
+
+    estatisticas = dict(linha._mapping)
+    total = estatisticas['total']
+    estatisticas['taxa_aceitacao'] = round(estatisticas['aceitas'] / total * 100) if total else 0
+    estatisticas['taxa_pendentes'] = round(estatisticas['pendentes'] / total * 100) if total else 0
+    return estatisticas
+
+
+STATUS_PROPOSTA = ('pendente',) + STATUS_RESPONDIDOS
+
+
+def consulta_propostas(lado, dono_id, limite, status=None, depois_de=None):
+    """Propostas mais recentes do cliente (lado='cliente') ou do contador, com a outra parte já carregada"""
+    if lado == 'cliente':
+        consulta = db.select(Proposta).join(Contador, Proposta.contador_id == Contador.id) \
+            .options(db.contains_eager(Proposta.contador)) \
+            .where(Proposta.cliente_id == dono_id)
+    else:
+        consulta = db.select(Proposta).join(Usuario, Proposta.cliente_id == Usuario.id) \
+            .options(db.contains_eager(Proposta.cliente)) \
+            .where(Proposta.contador_id == dono_id)
+    if status:
+        consulta = consulta.where(Proposta.status == status)
+    if depois_de:
+        consulta = consulta.where(db.tuple_(Proposta.data_envio, Proposta.id) < depois_de)
+    return consulta.order_by(Proposta.data_envio.desc(), Proposta.id.desc()).limit(limite)
+
+
+def pagina_propostas(lado, dono_id, limite, status=None, cursor=None):
+    """Uma página das propostas do painel e o cursor da próxima; o total fica em estatisticas_propostas"""
+    propostas = db.session.execute(
+        consulta_propostas(lado, dono_id, limite + 1, status, posicao_cursor_data_id(cursor))).scalars().all()
+    proximo = None
+    if len(propostas) > limite:
+        ultima = propostas[limite - 1]
+        proximo = cursor_data_id(ultima.data_envio, ultima.id)
+    return propostas[:limite], proximo
+
+
+def responder_pagina_propostas(lado, dono_id, template):
+    """JSON com os cards de uma página de propostas (carregar mais e filtros por status)"""
+    status = request.args.get('status') or None
+    if status is not None and status not in STATUS_PROPOSTA:
+        return jsonify({"success": False, "message": "Status inválido!"}), 400
+    try:
+        limite = int(request.args.get('limit', app.config['PROPOSTAS_POR_PAGINA']))
+        limite = max(1, min(limite, app.config['PAGINA_LIMITE_MAXIMO']))
+        propostas, proximo = pagina_propostas(lado, dono_id, limite, status,
+                                              decodificar_cursor(request.args.get('cursor')))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Parâmetros de paginação inválidos!"}), 400
+
+    return jsonify({
+        "success": True,
+        "html": ''.join(render_template(template, proposta=proposta) for proposta in propostas),
+        "next": proximo
+    })
+
+
 # Adicione esta nova rota para Minhas Solicitações
 @app.route('/minhas_solicitacoes')
+@somente_leitura
 def minhas_solicitacoes():
     if 'usuario_id' not in session:
         return redirect(url_for('login'))
 
     usuario_id = session['usuario_id']
 
-    # Buscar propostas enviadas pelo usuário
-    propostas = Proposta.query.filter_by(cliente_id=usuario_id) \
-        .join(Contador) \
-        .order_by(Proposta.data_envio.desc()) \
-        .all()
-
-    # Calcular data limite para "solicitações recentes" (últimos 30 dias)
-    from datetime import datetime, timedelta
-    data_limite = datetime.utcnow() - timedelta(days=30)
+    # Só a primeira página; as contagens vêm da consulta agregada
+    propostas, proximo = pagina_propostas('cliente', usuario_id, app.config['PROPOSTAS_POR_PAGINA'])
 
     return render_template('solicitacoes.html',
                            propostas=propostas,
-                           data_limite=data_limite)
+                           proximo_cursor=proximo,
+                           estatisticas=estatisticas_propostas(Proposta.cliente_id == usuario_id))
+
+
+@app.route('/minhas_solicitacoes/propostas')
+@somente_leitura
+def propostas_cliente():
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+    return responder_pagina_propostas('cliente', session['usuario_id'], '_proposta_cliente.html')
 
 
 # Nova rota para Solicitações do Contador
 @app.route('/solicitacoes_contador')
+@somente_leitura
 def solicitacoes_contador():
-    if 'usuario_id' not in session:
+    usuario = usuario_atual()
+    if usuario is None:
         return redirect(url_for('login'))
 
-    usuario = Usuario.query.get(session['usuario_id'])
     if usuario.tipo != 'contador':
         flash('Acesso restrito a contadores!', 'error')
         return redirect(url_for('index'))
 
-    contador = Contador.query.filter_by(usuario_id=usuario.id).first()
+    contador = db.session.get(Contador, usuario.contador_id) if usuario.contador_id else None
     if not contador:
         flash('Perfil de contador não encontrado!', 'error')
         return redirect(url_for('index'))
 
-    # Buscar propostas recebidas pelo contador
-    propostas = Proposta.query.filter_by(contador_id=contador.id) \
-        .join(Usuario, Proposta.cliente_id == Usuario.id) \
-        .order_by(Proposta.data_envio.desc()) \
-        .all()
-
-    # Calcular data limite para "solicitações recentes"
-    from datetime import datetime, timedelta
-    data_limite = datetime.utcnow() - timedelta(days=30)
+    # Só a primeira página; as contagens vêm da consulta agregada
+    propostas, proximo = pagina_propostas('contador', contador.id, app.config['PROPOSTAS_POR_PAGINA'])
 
     return render_template('solicitacoes_contador.html',
                            propostas=propostas,
+                           proximo_cursor=proximo,
                            contador=contador,
-                           data_limite=data_limite)
+                           estatisticas=estatisticas_propostas(Proposta.contador_id == contador.id))
+
+
+@app.route('/solicitacoes_contador/propostas')
+@somente_leitura
+def propostas_contador():
+    usuario = usuario_atual()
+    if usuario is None:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+    if usuario.tipo != 'contador' or usuario.contador_id is None:
+        return jsonify({"success": False, "message": "Acesso restrito a contadores!"}), 403
+    return responder_pagina_propostas('contador', usuario.contador_id, '_proposta_contador.html')
 
 
 # Rota para responder proposta
 @app.route('/responder_proposta', methods=['POST'])
 def responder_proposta():
-    if 'usuario_id' not in session:
+    usuario = usuario_atual()
+    if usuario is None:
         return jsonify({"success": False, "message": "Usuário não logado!"})
 
-    usuario = Usuario.query.get(session['usuario_id'])
     if usuario.tipo != 'contador':
         return jsonify({"success": False, "message": "Acesso restrito a contadores!"})
 
@@ -644,22 +4188,319 @@ def responder_proposta():
     status = dados.get('status')
     mensagem_resposta = dados.get('mensagem_resposta', '')
 
+    # O status vai para o banco, para a auditoria e para os contadores do ranking
+    if status not in STATUS_PROPOSTA:
+        return jsonify({"success": False, "message": "Status inválido!"}), 400
+
     proposta = Proposta.query.get_or_404(proposta_id)
 
     # Verificar se a proposta pertence ao contador
-    contador = Contador.query.filter_by(usuario_id=usuario.id).first()
-    if proposta.contador_id != contador.id:
+    if usuario.contador_id is None or proposta.contador_id != usuario.contador_id:
         return jsonify({"success": False, "message": "Proposta não encontrada!"})
 
+    status_anterior = proposta.status
     proposta.status = status
     # Podemos adicionar a mensagem de resposta se quiser armazenar
     # proposta.resposta = mensagem_resposta
 
+    if registrar_resposta_proposta(usuario.contador_id, status_anterior, status):
+        invalidar_diretorio()
+    auditar(f"Marcou a proposta {proposta.id} como {status}")
     db.session.commit()
+    publicar_proposta(proposta)
 
     return jsonify({"success": True, "message": f"Proposta {status} com sucesso!"})
 
 
+# Eventos em tempo real
+# Central de publicação/assinatura em memória: cada conexão aberta em /eventos
+# tem uma fila, e publicar() entrega o evento às filas do usuário sem passar
+# pelo banco. Vale dentro de um processo; cada conexão SSE ocupa uma thread.
+# Os últimos eventos de cada usuário ficam num buffer circular: ao reconectar,
+# o navegador manda o Last-Event-ID e recebe o que perdeu. Os ids levam um
+# prefixo do processo; se o id é de outro processo ou já saiu do buffer, o
+# cliente recebe 'recarregar' e busca a página inteira.
+class ConexoesExcedidas(Exception):
+    """Usuário já está no limite de conexões SSE"""
+
+
+class CentralEventos:
+    def __init__(self, tamanho_historico, max_usuarios, max_conexoes):
+        self._assinantes = {}  # usuario_id -> filas das conexões abertas
+        self._historico = OrderedDict()  # usuario_id -> deque de (sequencia, tipo, dados)
+        self._descartado = {}  # usuario_id -> sequência do último evento que saiu do buffer
+        self._descartado_geral = 0  # última sequência de históricos removidos inteiros
+        self._tamanho_historico = tamanho_historico
+        self._max_usuarios = max_usuarios
+        self._max_conexoes = max_conexoes
+        self._prefixo = uuid.uuid4().hex[:8]
+        self._sequencia = 0
+        self._lock = threading.Lock()
+
+    def id_evento(self, sequencia):
+        return f"{self._prefixo}-{sequencia}"
+
+    def assinar(self, usuario_id, ultimo_id=None):
+        """Registra a conexão. Retorna (fila, eventos perdidos ou None se não há como repor)"""
+        fila = queue.SimpleQueue()
+        with self._lock:
+            filas = self._assinantes.setdefault(usuario_id, set())
+            if len(filas) >= self._max_conexoes:
+                raise ConexoesExcedidas()
+            filas.add(fila)
+            return fila, self._perdidos(usuario_id, ultimo_id)
+
+    def _perdidos(self, usuario_id, ultimo_id):
+        if not ultimo_id:
+            return []
+        prefixo, _, sequencia = ultimo_id.partition('-')
+        if prefixo != self._prefixo or not sequencia.isdigit():
+            return None
+        sequencia = int(sequencia)
+        # Se o buffer já descartou eventos posteriores ao último visto, há um buraco
+        if sequencia < max(self._descartado.get(usuario_id, 0), self._descartado_geral):
+            return None
+        return [evento for evento in self._historico.get(usuario_id, ()) if evento[0] > sequencia]
+
+    def cancelar(self, usuario_id, fila):
+        with self._lock:
+            filas = self._assinantes.get(usuario_id)
+            if filas is not None:
+                filas.discard(fila)
+                if not filas:
+                    del self._assinantes[usuario_id]
+
+    def publicar(self, usuario_id, tipo, dados):
+        """Entrega o evento às conexões do usuário (chamar depois do commit)"""
+        with self._lock:
+            self._sequencia += 1
+            evento = (self._sequencia, tipo, dados)
+            historico = self._historico.get(usuario_id)
+            if historico is None:
+                historico = self._historico[usuario_id] = deque(maxlen=self._tamanho_historico)
+                while len(self._historico) > self._max_usuarios:
+                    removido, _ = self._historico.popitem(last=False)
+                    self._descartado.pop(removido, None)
+                    self._descartado_geral = self._sequencia
+            else:
+                self._historico.move_to_end(usuario_id)
+            if len(historico) == historico.maxlen:
+                self._descartado[usuario_id] = historico[0][0]
+            historico.append(evento)
+            filas = list(self._assinantes.get(usuario_id, ()))
+        for fila in filas:
+            fila.put(evento)
+
+
+central_eventos = CentralEventos(app.config['EVENTOS_HISTORICO'], app.config['EVENTOS_HISTORICO_USUARIOS'],
+                                 app.config['EVENTOS_MAX_CONEXOES'])
+
+
+@app.route('/eventos')
+def eventos():
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+
+    usuario_id = session['usuario_id']
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    try:
+        fila, perdidos = central_eventos.assinar(usuario_id, ultimo_id)
+    except ConexoesExcedidas:
+        return jsonify({"success": False, "message": "Muitas conexões abertas!"}), 429
+
+    def formatar(evento):
+        sequencia, tipo, dados = evento
+        return f"id: {central_eventos.id_evento(sequencia)}\nevent: {tipo}\n" \
+               f"data: {codificar_json(dados).decode('utf-8')}\n\n"
+
+    def transmitir():
+        try:
+            yield 'retry: 3000\n\n'
+            if perdidos is None:
+                yield 'event: recarregar\ndata: {}\n\n'
+            else:
+                for evento in perdidos:
+                    yield formatar(evento)
+            while True:
+                try:
+                    evento = fila.get(timeout=app.config['EVENTOS_HEARTBEAT'])
+                except queue.Empty:
+                    # Mantém proxies abertos e revela conexões já fechadas
+                    yield ': ping\n\n'
+                    continue
+                yield formatar(evento)
+        finally:
+            central_eventos.cancelar(usuario_id, fila)
+
+    return app.response_class(transmitir(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def publicar_proposta(proposta):
+    """Envia aos painéis abertos do cliente e do contador o card da proposta e os novos contadores"""
+    central_eventos.publicar(proposta.contador.usuario_id, 'proposta', {
+        "id": proposta.id,
+        "status": proposta.status,
+        "html": render_template('_proposta_contador.html', proposta=proposta),
+        "estatisticas": estatisticas_propostas(Proposta.contador_id == proposta.contador_id)
+    })
+    central_eventos.publicar(proposta.cliente_id, 'proposta', {
+        "id": proposta.id,
+        "status": proposta.status,
+        "html": render_template('_proposta_cliente.html', proposta=proposta),
+        "estatisticas": estatisticas_propostas(Proposta.cliente_id == proposta.cliente_id)
+    })
+
+
+# Mensagens
+# Cliente e contador conversam depois de uma proposta. O histórico é paginado
+# por cursor (id decrescente) e a contagem de não lidas usa o índice
+# (destinatario_id, lida). Mensagens novas e confirmações de leitura chegam
+# à outra parte pelo /eventos.
+def pode_conversar(usuario_id, outro_id):
+    """Há uma proposta ligando os dois usuários (cliente e contador)?"""
+    return db.session.query(
+        db.select(Proposta.id).join(Contador, Contador.id == Proposta.contador_id)
+        .where(((Proposta.cliente_id == usuario_id) & (Contador.usuario_id == outro_id)) |
+               ((Proposta.cliente_id == outro_id) & (Contador.usuario_id == usuario_id)))
+        .exists()
+    ).scalar()
+
+
+def filtro_conversa(usuario_id, outro_id):
+    return ((Mensagem.remetente_id == usuario_id) & (Mensagem.destinatario_id == outro_id)) | \
+        ((Mensagem.remetente_id == outro_id) & (Mensagem.destinatario_id == usuario_id))
+
+
+def consulta_conversas(usuario_id):
+    """Última mensagem e não lidas de cada conversa do usuário"""
+    outro = db.case((Mensagem.remetente_id == usuario_id, Mensagem.destinatario_id), else_=Mensagem.remetente_id)
+    nao_lida = (Mensagem.destinatario_id == usuario_id) & Mensagem.lida.is_(False)
+    resumo = db.select(
+        outro.label('usuario_id'),
+        db.func.max(Mensagem.id).label('ultima_id'),
+        db.func.sum(db.case((nao_lida, 1), else_=0)).label('nao_lidas')
+    ).where((Mensagem.remetente_id == usuario_id) | (Mensagem.destinatario_id == usuario_id)) \
+        .group_by(outro).subquery()
+    return db.select(Mensagem, Usuario, resumo.c.nao_lidas) \
+        .join(resumo, resumo.c.ultima_id == Mensagem.id) \
+        .join(Usuario, Usuario.id == resumo.c.usuario_id) \
+        .order_by(Mensagem.id.desc())
+
+
+def contar_nao_lidas(usuario_id):
+    return db.session.execute(
+        db.select(db.func.count(Mensagem.id))
+        .where(Mensagem.destinatario_id == usuario_id, Mensagem.lida.is_(False))
+    ).scalar()
+
+
+def mensagem_para_dict(mensagem):
+    return {
+        "id": mensagem.id,
+        "remetente_id": mensagem.remetente_id,
+        "destinatario_id": mensagem.destinatario_id,
+        "conteudo": mensagem.conteudo,
+        "lida": bool(mensagem.lida),
+        "data_envio": mensagem.data_envio.isoformat()
+    }
+
+
+@app.route('/mensagens')
+@somente_leitura
+def conversas():
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+
+    linhas = db.session.execute(consulta_conversas(session['usuario_id'])).all()
+    return jsonify({
+        "conversas": [{
+            "usuario": {"id": usuario.id, "nome": usuario.nome, "foto": url_foto(usuario.foto, 'avatar')},
+            "ultima_mensagem": mensagem_para_dict(mensagem),
+            "nao_lidas": nao_lidas
+        } for mensagem, usuario, nao_lidas in linhas],
+        "nao_lidas": sum(nao_lidas for _, _, nao_lidas in linhas)
+    })
+
+
+@app.route('/mensagens/nao_lidas')
+@somente_leitura
+def mensagens_nao_lidas():
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+
+    return jsonify({"nao_lidas": contar_nao_lidas(session['usuario_id'])})
+
+
+@app.route('/mensagens/<int:usuario_id>', methods=['GET', 'POST'])
+def conversa(usuario_id):
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+
+    eu = session['usuario_id']
+    if usuario_id == eu or not pode_conversar(eu, usuario_id):
+        return jsonify({"success": False, "message": "Conversa não encontrada!"}), 404
+
+    if request.method == 'POST':
+        conteudo = ((request.get_json(silent=True) or {}).get('conteudo') or '').strip()
+        if not conteudo or len(conteudo) > app.config['MENSAGEM_TAMANHO_MAXIMO']:
+            return jsonify({"success": False, "message": "Mensagem vazia ou longa demais!"}), 400
+
+        mensagem = Mensagem(remetente_id=eu, destinatario_id=usuario_id, conteudo=conteudo)
+        db.session.add(mensagem)
+        db.session.commit()
+
+        dados = mensagem_para_dict(mensagem)
+        central_eventos.publicar(usuario_id, 'mensagem', {**dados, "nao_lidas": contar_nao_lidas(usuario_id)})
+        central_eventos.publicar(eu, 'mensagem', dados)  # outras abas do remetente
+        return jsonify({"success": True, "mensagem": dados})
+
+    try:
+        limite = int(request.args.get('limit', app.config['PAGINA_LIMITE_PADRAO']))
+        limite = max(1, min(limite, app.config['PAGINA_LIMITE_MAXIMO']))
+        cursor = decodificar_cursor(request.args.get('cursor'))
+        if cursor is not None and len(cursor) != 1:
+            raise ValueError('cursor inválido')
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Parâmetros de paginação inválidos!"}), 400
+
+    query = Mensagem.query.filter(filtro_conversa(eu, usuario_id))
+    if cursor:
+        query = query.filter(Mensagem.id < cursor[0])
+    mensagens = query.order_by(Mensagem.id.desc()).limit(limite + 1).all()
+
+    proximo = codificar_cursor([mensagens[limite - 1].id]) if len(mensagens) > limite else None
+    return jsonify({"mensagens": [mensagem_para_dict(m) for m in mensagens[:limite]], "next": proximo})
+
+
+@app.route('/mensagens/<int:usuario_id>/lidas', methods=['POST'])
+def marcar_mensagens_lidas(usuario_id):
+    if 'usuario_id' not in session:
+        return jsonify({"success": False, "message": "Usuário não logado!"}), 401
+
+    eu = session['usuario_id']
+    ate_id = (request.get_json(silent=True) or {}).get('ate_id')
+    if ate_id is not None and not isinstance(ate_id, int):
+        return jsonify({"success": False, "message": "ate_id inválido!"}), 400
+
+    # Um único UPDATE para todas as mensagens recebidas do outro usuário
+    query = db.update(Mensagem).where(
+        Mensagem.destinatario_id == eu,
+        Mensagem.remetente_id == usuario_id,
+        Mensagem.lida.is_(False)
+    )
+    if ate_id is not None:
+        query = query.where(Mensagem.id <= ate_id)
+    atualizadas = db.session.execute(query.values(lida=True).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+
+    nao_lidas = contar_nao_lidas(eu)
+    if atualizadas:
+        central_eventos.publicar(usuario_id, 'mensagens_lidas', {"usuario_id": eu, "ate_id": ate_id})
+        central_eventos.publicar(eu, 'nao_lidas', {"nao_lidas": nao_lidas})
+    return jsonify({"success": True, "atualizadas": atualizadas, "nao_lidas": nao_lidas})
+
+
 if __name__ == '__main__':
     # init_db()  # COMENTE esta linha
     port = int(os.environ.get('PORT', 5000))
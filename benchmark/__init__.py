@@ -0,0 +1,12 @@
+"""Benchmarks do marketplace com dados sintéticos.
+
+Uso (na raiz do repositório):
+
+    python -m benchmark gerar --usuarios 100000 --contadores 20000 --propostas 1000000 --avaliacoes 500000
+    python -m benchmark executar --modo cliente --requisicoes 200
+    python -m benchmark executar --modo http --threads 8 --saida resultado.json
+    python -m benchmark comparar antes.json depois.json
+
+Por padrão o banco usado é instance/benchmark.db (variável BENCH_DATABASE_URL),
+separado do banco da aplicação.
+"""
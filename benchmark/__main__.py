@@ -0,0 +1,75 @@
+import json
+import os
+
+import click
+
+# O app lê DATABASE_URL ao ser importado: aponta para o banco de benchmark antes
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///benchmark.db')
+
+
+@click.group()
+def cli():
+    """Gerador de dados, carga nas rotas e comparação de resultados."""
+
+
+@cli.command()
+@click.option('--usuarios', default=5000, help='Total de usuários (contadores incluídos).')
+@click.option('--contadores', default=1000)
+@click.option('--propostas', default=50000)
+@click.option('--avaliacoes', default=25000)
+@click.option('--mensagens', default=10000)
+@click.option('--semente', default=42, help='Semente do gerador (dados reproduzíveis).')
+@click.option('--recriar', is_flag=True, help='Apaga o banco de benchmark antes.')
+def gerar(usuarios, contadores, propostas, avaliacoes, mensagens, semente, recriar):
+    """Popula o banco de benchmark com dados sintéticos."""
+    from app import app, db
+    from .gerador import gerar as gerar_dados
+
+    if recriar:
+        with app.app_context():
+            caminho = db.engine.url.database
+            db.engine.dispose()
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
+    gerar_dados(usuarios, contadores, propostas, avaliacoes, mensagens, semente, eco=click.echo)
+
+
+@cli.command()
+@click.option('--modo', type=click.Choice(['cliente', 'http']), default='cliente')
+@click.option('--threads', default=1, help='Usuários simultâneos por rota.')
+@click.option('--requisicoes', default=200, help='Requisições por rota.')
+@click.option('--rota', 'rotas', multiple=True, help='Limita às rotas informadas (repetível).')
+@click.option('--url', default=None, help='Servidor já em execução (modo http).')
+@click.option('--saida', type=click.Path(dir_okay=False), default=None, help='Grava o relatório em JSON.')
+def executar(modo, threads, requisicoes, rotas, url, saida):
+    """Mede p50/p95/p99, vazão e consultas SQL por rota."""
+    from .carga import executar as executar_carga
+
+    relatorio = executar_carga(modo, threads, requisicoes, rotas or None, url, eco=click.echo)
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+        click.echo(f"relatório salvo em {saida}")
+
+
+@cli.command()
+@click.argument('anterior', type=click.File(encoding='utf-8'))
+@click.argument('atual', type=click.File(encoding='utf-8'))
+@click.option('--limiar', default=0.10, help='Aumento de p95 considerado regressão (0.10 = 10%).')
+def comparar(anterior, atual, limiar):
+    """Compara o p95 de dois relatórios; sai com código 1 se alguma rota regrediu."""
+    from .carga import comparar as comparar_relatorios
+
+    linhas = comparar_relatorios(json.load(anterior), json.load(atual), limiar)
+    regressoes = 0
+    for rota, antes, depois, variacao, regrediu in linhas:
+        marca = '⚠️ ' if regrediu else '   '
+        texto = f"{variacao:+.1%}" if variacao is not None else 'n/d'
+        click.echo(f"{marca}{rota:<24} p95 {antes} -> {depois} ms ({texto})")
+        regressoes += regrediu
+    if regressoes:
+        raise SystemExit(1)
+
+
+cli(prog_name='python -m benchmark')
@@ -0,0 +1,309 @@
+"""Execução das rotas sob carga e relatório de latência.
+
+Dois modos:
+  * cliente: Flask test client, uma instância por thread. Com uma thread conta
+    também as consultas SQL de cada requisição.
+  * http: sobe o app num servidor WSGI com threads (ou usa --url) e faz as
+    requisições por HTTP de verdade, com sessões obtidas pelo /login.
+"""
+import http.cookiejar
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import app, db, central_eventos, contar_consultas, ORDENACOES, Usuario, Contador, Proposta
+
+from .gerador import SENHA_PADRAO
+
+TERMOS_BUSCA = ['mei', 'tributário', 'imposto', 'empresa', 'folha', 'são paulo', 'startups', 'consultoria']
+TAGS_BUSCA = [['MEI'], ['Pequenas Empresas'], ['MEI', 'Consultoria'], ['Imposto de Renda'], ['eSocial']]
+UFS_BUSCA = ['SP', 'RJ', 'MG', 'PR', 'RS']
+# Centros da busca por raio (latitude, longitude): não depende da tabela de municípios
+CENTROS_BUSCA = [(-23.55, -46.63), (-22.91, -43.17), (-19.92, -43.94)]
+
+
+class Amostra:
+    """Dados do banco usados para montar as requisições"""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        with app.app_context():
+            ids = db.session.execute(db.select(Contador.id, Contador.usuario_id).order_by(Contador.id)).all()
+            self.contadores = [contador_id for contador_id, _ in ids]
+            # Os contadores com mais propostas: painéis mais pesados
+            self.contadores_populares = [
+                usuario_id for usuario_id, in db.session.execute(
+                    db.select(Contador.usuario_id)
+                    .join(Proposta, Proposta.contador_id == Contador.id)
+                    .group_by(Contador.id).order_by(db.func.count().desc()).limit(20)
+                )
+            ]
+            self.clientes = [
+                usuario_id for usuario_id, in db.session.execute(
+                    db.select(Proposta.cliente_id).distinct().limit(200)
+                )
+            ] or [usuario_id for usuario_id, in db.session.execute(
+                db.select(Usuario.id).where(Usuario.tipo == 'cliente').limit(200))]
+            self.emails = dict(db.session.execute(
+                db.select(Usuario.id, Usuario.email)
+                .where(Usuario.id.in_(self.contadores_populares + self.clientes))
+            ).all())
+            # Propostas recebidas pelo contador mais popular: ele responde em 'responder_proposta'
+            self.propostas_populares = [
+                proposta_id for proposta_id, in db.session.execute(
+                    db.select(Proposta.id).join(Contador, Proposta.contador_id == Contador.id)
+                    .where(Contador.usuario_id == self.contadores_populares[0]).limit(200)
+                )
+            ] if self.contadores_populares else []
+
+    def contador(self):
+        return self.rnd.choice(self.contadores)
+
+
+def rotas_padrao(amostra, cursor_pagina_2):
+    """nome -> (perfil da sessão, função que devolve (método, url, json))"""
+    rnd = amostra.rnd
+
+    def filtrar_tags():
+        return 'GET', '/filtrar?' + urllib.parse.urlencode([('tags', tag) for tag in rnd.choice(TAGS_BUSCA)]), None
+
+    def filtrar(**parametros):
+        return 'GET', '/filtrar?' + urllib.parse.urlencode(parametros), None
+
+    def filtrar_raio():
+        latitude, longitude = rnd.choice(CENTROS_BUSCA)
+        return filtrar(latitude=latitude, longitude=longitude, raio_km=rnd.choice([10, 50, 200]))
+
+    def sugestoes():
+        # Prefixos de 1 a 4 letras, como enquanto o usuário digita
+        prefixo = rnd.choice(TERMOS_BUSCA)[:rnd.randint(1, 4)]
+        return 'GET', '/sugestoes?' + urllib.parse.urlencode({'q': prefixo}), None
+
+    return {
+        'index': (None, lambda: ('GET', '/', None)),
+        'filtrar (texto)': (None, lambda: ('GET', '/filtrar?' + urllib.parse.urlencode({'q': rnd.choice(TERMOS_BUSCA)}), None)),
+        'filtrar (tags)': (None, filtrar_tags),
+        'filtrar (página 2)': (None, lambda: ('GET', '/filtrar?' + urllib.parse.urlencode({'cursor': cursor_pagina_2}), None)),
+        'filtrar (ordem)': (None, lambda: filtrar(ordem=rnd.choice(list(ORDENACOES)))),
+        'filtrar (uf)': (None, lambda: filtrar(uf=rnd.choice(UFS_BUSCA))),
+        'filtrar (raio)': (None, filtrar_raio),
+        'sugestoes': (None, sugestoes),
+        'perfil_contador': (None, lambda: ('GET', f'/perfil_contador/{amostra.contador()}', None)),
+        'perfil_contador (avaliações)': (None, lambda: (
+            'GET', f'/perfil_contador/{amostra.contador()}/avaliacoes', None)),
+        'solicitacoes_contador': ('contador', lambda: ('GET', '/solicitacoes_contador', None)),
+        'minhas_solicitacoes': ('cliente', lambda: ('GET', '/minhas_solicitacoes', None)),
+        'mensagens': ('cliente', lambda: ('GET', '/mensagens', None)),
+        'eventos': ('cliente', lambda: ('GET', '/eventos', None)),
+        'avaliar_contador': ('cliente', lambda: ('POST', '/avaliar_contador', {
+            'contador_id': amostra.contador(), 'nota': rnd.randint(1, 5), 'comentario': 'benchmark'})),
+        'enviar_proposta': ('cliente', lambda: ('POST', '/enviar_proposta', {
+            'contador_id': amostra.contador(), 'mensagem': 'benchmark'})),
+        'responder_proposta': ('contador_popular', lambda: ('POST', '/responder_proposta', {
+            'proposta_id': rnd.choice(amostra.propostas_populares),
+            'status': rnd.choice(['aceita', 'recusada'])})),
+    }
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def resumir(tempos, erros, consultas, duracao):
+    resumo = {
+        "requisicoes": len(tempos),
+        "erros": erros,
+        "rps": round(len(tempos) / duracao, 1) if duracao else None,
+        "media_ms": round(statistics.fmean(tempos), 2) if tempos else None,
+    }
+    for p in (50, 95, 99):
+        valor = percentil(tempos, p)
+        resumo[f"p{p}_ms"] = round(valor, 2) if valor is not None else None
+    resumo["consultas_media"] = round(statistics.fmean(consultas), 1) if consultas else None
+    resumo["consultas_max"] = max(consultas) if consultas else None
+    return resumo
+
+
+# Sessões
+class SessaoCliente:
+    """Usuário virtual sobre o Flask test client"""
+
+    def __init__(self, email):
+        self.cliente = app.test_client()
+        if email:
+            self.cliente.post('/login', data={'email': email, 'senha': SENHA_PADRAO})
+
+    def requisitar(self, metodo, url, corpo):
+        resposta = self.cliente.open(url, method=metodo, json=corpo)
+        resposta.close()
+        return resposta.status_code
+
+
+class SessaoHttp:
+    """Usuário virtual por HTTP, com cookie jar próprio"""
+
+    def __init__(self, base, email):
+        self.base = base
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            SemRedirecionamento)
+        if email:
+            self.requisitar('POST', '/login', urllib.parse.urlencode({'email': email, 'senha': SENHA_PADRAO}),
+                            tipo='application/x-www-form-urlencoded')
+
+    def requisitar(self, metodo, url, corpo, tipo='application/json'):
+        dados = None
+        if corpo is not None:
+            dados = (corpo if isinstance(corpo, str) else json.dumps(corpo)).encode('utf-8')
+        pedido = urllib.request.Request(self.base + url, data=dados, method=metodo,
+                                        headers={'Content-Type': tipo} if dados else {})
+        try:
+            with self.abridor.open(pedido, timeout=30) as resposta:
+                # O /eventos não termina: basta a primeira linha do stream
+                if resposta.headers.get_content_type() == 'text/event-stream':
+                    resposta.readline()
+                else:
+                    resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as erro:
+            return erro.code
+
+
+class SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HandlerSilencioso(WSGIRequestHandler):
+    """Sem uma linha de log por requisição no meio do relatório"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def executar(modo='cliente', threads=1, requisicoes=200, rotas=None, url=None, semente=1, eco=print):
+    """Roda cada rota `requisicoes` vezes, dividido entre `threads`. Retorna o relatório"""
+    rnd = random.Random(semente)
+    amostra = Amostra(rnd)
+    if not amostra.contadores:
+        raise RuntimeError('Banco sem contadores: rode "python -m benchmark gerar" antes')
+
+    # O login é limitado por IP; num benchmark todas as sessões saem do mesmo endereço
+    app.config['LIMITE_TENTATIVAS_IP'] = (10 ** 9, 1)
+    # Idem para as conexões SSE por usuário: no modo http uma conexão fechada
+    # só sai da central no próximo keep-alive
+    central_eventos._max_conexoes = 10 ** 9
+
+    servidor = None
+    if modo == 'http' and url is None:
+        servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=HandlerSilencioso)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{servidor.server_port}"
+
+    def nova_sessao(perfil, indice):
+        email = None
+        if perfil == 'contador':
+            email = amostra.emails[amostra.contadores_populares[indice % len(amostra.contadores_populares)]]
+        elif perfil == 'contador_popular':
+            # Todas as sessões no mesmo contador: as propostas sorteadas são dele
+            email = amostra.emails[amostra.contadores_populares[0]]
+        elif perfil == 'cliente':
+            email = amostra.emails[amostra.clientes[indice % len(amostra.clientes)]]
+        return SessaoHttp(url, email) if modo == 'http' else SessaoCliente(email)
+
+    pagina = app.test_client().get('/filtrar?limit=20').get_json()
+    todas = rotas_padrao(amostra, pagina.get('next') or '')
+    selecionadas = {nome: todas[nome] for nome in (rotas or todas)}
+    contar = modo == 'cliente' and threads == 1
+
+    resultado = {}
+    try:
+        for nome, (perfil, gerar_requisicao) in selecionadas.items():
+            sessoes = [nova_sessao(perfil, indice) for indice in range(threads)]
+            # Aquecimento: caches, conexões e templates compilados
+            sessoes[0].requisitar(*gerar_requisicao())
+
+            tempos, consultas, erros = [], [], [0]
+            lock = threading.Lock()
+            por_thread = [requisicoes // threads + (1 if i < requisicoes % threads else 0) for i in range(threads)]
+
+            def trabalhar(sessao, quantidade):
+                for _ in range(quantidade):
+                    with lock:
+                        metodo, caminho, corpo = gerar_requisicao()
+                    inicio = time.perf_counter()
+                    if contar:
+                        with app.app_context(), contar_consultas() as contagem:
+                            status = sessao.requisitar(metodo, caminho, corpo)
+                        consultas.append(contagem["total"])
+                    else:
+                        status = sessao.requisitar(metodo, caminho, corpo)
+                    decorrido = (time.perf_counter() - inicio) * 1000
+                    with lock:
+                        tempos.append(decorrido)
+                        if status >= 400:
+                            erros[0] += 1
+
+            inicio_rota = time.perf_counter()
+            trabalhadores = [threading.Thread(target=trabalhar, args=(sessao, quantidade))
+                             for sessao, quantidade in zip(sessoes, por_thread)]
+            for trabalhador in trabalhadores:
+                trabalhador.start()
+            for trabalhador in trabalhadores:
+                trabalhador.join()
+            resultado[nome] = resumir(tempos, erros[0], consultas, time.perf_counter() - inicio_rota)
+            eco(f"{nome:<24} p50 {resultado[nome]['p50_ms']:>8} ms  p95 {resultado[nome]['p95_ms']:>8} ms  "
+                f"p99 {resultado[nome]['p99_ms']:>8} ms  {resultado[nome]['rps']:>8} req/s"
+                + (f"  {resultado[nome]['consultas_media']} consultas" if contar else ''))
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+
+    with app.app_context():
+        tamanhos = {tabela: db.session.execute(db.text(f'SELECT COUNT(*) FROM "{tabela}"')).scalar()
+                    for tabela in ('usuario', 'contador', 'proposta', 'avaliacao', 'mensagem')}
+
+    return {
+        "versao": versao_codigo(),
+        "data": datetime.now().isoformat(timespec='seconds'),
+        "modo": modo,
+        "threads": threads,
+        "requisicoes_por_rota": requisicoes,
+        "dados": tamanhos,
+        "rotas": resultado,
+    }
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(anterior, atual, limiar=0.10):
+    """Linhas (rota, p95 antes, p95 depois, variação, regrediu?) entre dois relatórios"""
+    linhas = []
+    for rota, dados in atual["rotas"].items():
+        antes = anterior["rotas"].get(rota, {}).get("p95_ms")
+        depois = dados.get("p95_ms")
+        if antes is None or depois is None:
+            linhas.append((rota, antes, depois, None, False))
+            continue
+        variacao = (depois - antes) / antes if antes else 0.0
+        linhas.append((rota, antes, depois, variacao, variacao > limiar))
+    return linhas
@@ -0,0 +1,215 @@
+"""Gerador de dados sintéticos do marketplace.
+
+Insere em lote (executemany, em blocos) usuários, contadores com tags e
+localização, propostas, avaliações e mensagens. As distribuições imitam um
+marketplace real: poucas tags e cidades concentram a maior parte dos
+contadores, e alguns contadores recebem muito mais propostas e avaliações que
+os outros (pesos do tipo Zipf), o que expõe os painéis "quentes".
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import (app, db, migrar, recalcular_avaliacoes, recalcular_ranking, reconstruir_indice_busca,
+                 invalidar_diretorio, atualizar_localizacoes,
+                 Usuario, Contador, Tag, contador_tag, Proposta, Avaliacao, Mensagem)
+
+SENHA_PADRAO = 'senha123'
+BLOCO = 20000
+
+TAGS = [
+    ('MEI', 30), ('Pequenas Empresas', 25), ('Imposto de Renda', 22), ('Consultoria', 18),
+    ('Simples Nacional', 16), ('Abertura de Empresa', 14), ('Folha de Pagamento', 12), ('eSocial', 10),
+    ('Lucro Presumido', 8), ('Lucro Real', 6), ('Planejamento Tributário', 6), ('Startups', 5),
+    ('E-commerce', 5), ('Terceiro Setor', 3), ('Agronegócio', 3), ('Auditoria', 2),
+    ('Perícia Contábil', 2), ('Holding Familiar', 1), ('Comércio Exterior', 1), ('Criptoativos', 1),
+]
+CIDADES = [
+    ('São Paulo', 'SP', 30), ('Rio de Janeiro', 'RJ', 14), ('Belo Horizonte', 'MG', 7),
+    ('Brasília', 'DF', 6), ('Curitiba', 'PR', 5), ('Porto Alegre', 'RS', 5), ('Salvador', 'BA', 5),
+    ('Recife', 'PE', 4), ('Fortaleza', 'CE', 4), ('Campinas', 'SP', 3), ('Goiânia', 'GO', 3),
+    ('Florianópolis', 'SC', 2), ('Manaus', 'AM', 2), ('Belém', 'PA', 2), ('Vitória', 'ES', 1),
+    ('Natal', 'RN', 1), ('Campo Grande', 'MS', 1), ('Cuiabá', 'MT', 1), ('São Luís', 'MA', 1),
+    ('Ribeirão Preto', 'SP', 1),
+]
+ESPECIALIDADES = [
+    'Especialista em Tributário e MEI', 'Contabilidade para Pequenas Empresas', 'Imposto de Renda Pessoa Física',
+    'Departamento Pessoal e eSocial', 'Abertura e Regularização de Empresas', 'Planejamento Tributário',
+    'Contabilidade para Startups', 'Auditoria e Perícia Contábil',
+]
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'William']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes']
+TEMPOS_RESPOSTA = ['1 hora', '2 horas', '4 horas', '1 dia', '2 dias']
+NOTAS = [1, 2, 3, 4, 5]
+PESOS_NOTAS = [3, 4, 12, 35, 46]
+STATUS_PROPOSTA = ['pendente', 'aceita', 'recusada']
+PESOS_STATUS = [30, 50, 20]
+
+
+def pesos_zipf(quantidade, expoente=0.9):
+    """Pesos acumulados 1/rank^s, para sortear com random.choices(cum_weights=...)"""
+    acumulado, total = [], 0.0
+    for rank in range(1, quantidade + 1):
+        total += 1.0 / rank ** expoente
+        acumulado.append(total)
+    return acumulado
+
+
+def inserir(tabela, linhas):
+    """executemany em blocos; `linhas` pode ser um gerador de dicionários"""
+    bloco, total = [], 0
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= BLOCO:
+            db.session.execute(tabela.insert(), bloco)
+            total += len(bloco)
+            bloco = []
+    if bloco:
+        db.session.execute(tabela.insert(), bloco)
+        total += len(bloco)
+    return total
+
+
+def data_aleatoria(rnd, agora, dias=730):
+    return agora - timedelta(seconds=rnd.randrange(dias * 86400))
+
+
+def gerar(usuarios, contadores, propostas, avaliacoes, mensagens, semente=42, eco=print):
+    """Popula um banco vazio. Retorna a quantidade de linhas por tabela"""
+    if contadores > usuarios:
+        raise ValueError('É preciso ao menos um usuário por contador')
+    rnd = random.Random(semente)
+    agora = datetime.utcnow()
+    inicio = time.perf_counter()
+
+    with app.app_context():
+        migrar()
+        if db.session.query(Usuario.id).first() is not None:
+            raise RuntimeError('O banco de benchmark já tem dados (use --recriar)')
+        # Carga em lote: a durabilidade de cada transação não importa aqui
+        db.session.execute(db.text('PRAGMA synchronous = OFF'))
+
+        senha = generate_password_hash(SENHA_PADRAO, method=app.config['SENHA_METODO'])
+        contagem = {}
+
+        # Os primeiros `contadores` usuários são contadores; o resto, clientes
+        contagem['usuario'] = inserir(Usuario.__table__, ({
+            'id': i,
+            'nome': f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}",
+            'email': f"{'contador' if i <= contadores else 'cliente'}{i}@bench.local",
+            'senha': senha,
+            'tipo': 'contador' if i <= contadores else 'cliente',
+            'foto': f"https://i.pravatar.cc/150?img={i % 70}",
+            'data_criacao': data_aleatoria(rnd, agora),
+        } for i in range(1, usuarios + 1)))
+        eco(f"usuario: {contagem['usuario']}")
+
+        nomes_tags = [nome for nome, _ in TAGS]
+        pesos_tags = [peso for _, peso in TAGS]
+        contagem['tag'] = inserir(Tag.__table__, ({'id': i, 'nome': nome} for i, nome in enumerate(nomes_tags, 1)))
+
+        def linhas_contador():
+            for i in range(1, contadores + 1):
+                cidade, uf, _ = rnd.choices(CIDADES, weights=[peso for *_, peso in CIDADES])[0]
+                yield {
+                    'id': i,
+                    'usuario_id': i,
+                    'nome': f"{rnd.choice(['Dr.', 'Dra.', ''])} {rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}".strip(),
+                    'especialidade': rnd.choice(ESPECIALIDADES),
+                    'nota': 0.0,
+                    'avaliacoes_count': 0,
+                    'foto': f"https://i.pravatar.cc/150?img={i % 70}",
+                    'tempo_resposta': rnd.choice(TEMPOS_RESPOSTA),
+                    'localizacao': f"{cidade}, {uf}",
+                    'descricao': f"Atendimento em {cidade} com {rnd.randint(1, 30)} anos de experiência.",
+                    'verificado': rnd.random() < 0.4,
+                    'ativo': rnd.random() < 0.95,
+                    'experiencia': f"{rnd.randint(1, 30)} anos",
+                    'formacao': 'Ciências Contábeis',
+                }
+        contagem['contador'] = inserir(Contador.__table__, linhas_contador())
+
+        def linhas_contador_tag():
+            for contador_id in range(1, contadores + 1):
+                escolhidas = set()
+                for _ in range(rnd.randint(1, 4)):
+                    escolhidas.add(rnd.choices(range(1, len(TAGS) + 1), weights=pesos_tags)[0])
+                for tag_id in escolhidas:
+                    yield {'contador_id': contador_id, 'tag_id': tag_id}
+        contagem['contador_tag'] = inserir(contador_tag, linhas_contador_tag())
+        eco(f"contador: {contagem['contador']} (tags: {contagem['contador_tag']})")
+
+        # Contadores "populares" concentram propostas e avaliações
+        populares = pesos_zipf(contadores)
+        ids_contador = range(1, contadores + 1)
+        clientes = range(contadores + 1, usuarios + 1)
+
+        def linhas_proposta():
+            for i in range(1, propostas + 1):
+                yield {
+                    'id': i,
+                    'contador_id': rnd.choices(ids_contador, cum_weights=populares)[0],
+                    'cliente_id': rnd.choice(clientes),
+                    'mensagem': 'Preciso de ajuda com a contabilidade da minha empresa.',
+                    'status': rnd.choices(STATUS_PROPOSTA, weights=PESOS_STATUS)[0],
+                    'data_envio': data_aleatoria(rnd, agora),
+                }
+        contagem['proposta'] = inserir(Proposta.__table__, linhas_proposta()) if clientes else 0
+        eco(f"proposta: {contagem['proposta']}")
+
+        def linhas_avaliacao():
+            vistos = set()
+            tentativas = 0
+            while len(vistos) < avaliacoes and tentativas < avaliacoes * 3:
+                tentativas += 1
+                par = (rnd.choices(ids_contador, cum_weights=populares)[0], rnd.choice(clientes))
+                if par in vistos:
+                    continue
+                vistos.add(par)
+                yield {
+                    'id': len(vistos),
+                    'contador_id': par[0],
+                    'usuario_id': par[1],
+                    'nota': float(rnd.choices(NOTAS, weights=PESOS_NOTAS)[0]),
+                    'comentario': 'Ótimo atendimento.',
+                    'data_avaliacao': data_aleatoria(rnd, agora),
+                }
+        contagem['avaliacao'] = inserir(Avaliacao.__table__, linhas_avaliacao()) if clientes else 0
+        eco(f"avaliacao: {contagem['avaliacao']}")
+
+        def linhas_mensagem():
+            # Conversas entre as partes de propostas já sorteadas
+            pares = db.session.execute(
+                db.select(Proposta.cliente_id, Proposta.contador_id).limit(max(1, mensagens // 10))
+            ).all()
+            for i in range(1, mensagens + 1):
+                cliente_id, contador_id = rnd.choice(pares)
+                do_cliente = rnd.random() < 0.5
+                yield {
+                    'id': i,
+                    'remetente_id': cliente_id if do_cliente else contador_id,
+                    'destinatario_id': contador_id if do_cliente else cliente_id,
+                    'conteudo': 'Olá! Podemos conversar sobre a proposta?',
+                    'lida': rnd.random() < 0.7,
+                    'data_envio': data_aleatoria(rnd, agora, dias=90),
+                }
+        contagem['mensagem'] = inserir(Mensagem.__table__, linhas_mensagem()) if mensagens and contagem['proposta'] else 0
+        eco(f"mensagem: {contagem['mensagem']}")
+
+        db.session.commit()
+        # Agregados, índice de busca e caches a partir das linhas inseridas
+        recalcular_avaliacoes()
+        recalcular_ranking()
+        atualizar_localizacoes()
+        reconstruir_indice_busca()
+        invalidar_diretorio()
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    eco(f"gerado em {time.perf_counter() - inicio:.1f}s")
+    return contagem
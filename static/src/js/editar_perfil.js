@@ -0,0 +1,133 @@
+// Sistema de abas
+function abrirTab(tabName) {
+    // Esconder todas as abas
+    document.querySelectorAll('.tab-content').forEach(tab => {
+        tab.classList.remove('active');
+    });
+
+    // Remover classe active de todas as tabs
+    document.querySelectorAll('.tab').forEach(tab => {
+        tab.classList.remove('active');
+    });
+
+    // Mostrar a aba selecionada
+    document.getElementById(tabName).classList.add('active');
+
+    // Ativar a tab selecionada
+    event.currentTarget.classList.add('active');
+}
+
+// Preview da imagem selecionada
+function previewImage(input) {
+    const preview = document.getElementById('avatarPreview');
+    const currentPhoto = document.getElementById('currentPhoto');
+
+    if (input.files && input.files[0]) {
+        const reader = new FileReader();
+
+        reader.onload = function(e) {
+            preview.src = e.target.result;
+            currentPhoto.src = e.target.result;
+        }
+
+        reader.readAsDataURL(input.files[0]);
+
+        // Mostrar feedback visual
+        const label = input.nextElementSibling;
+        label.innerHTML = `<i class="fas fa-check"></i> Arquivo selecionado: ${input.files[0].name}`;
+        label.style.borderColor = 'var(--success)';
+        label.style.background = '#dcfce7';
+    }
+}
+
+// Validação do formulário
+document.querySelector('form').addEventListener('submit', function(e) {
+    const nome = document.getElementById('nome').value;
+    const email = document.getElementById('email').value;
+
+    if (!nome || !email) {
+        e.preventDefault();
+        alert('Por favor, preencha todos os campos obrigatórios.');
+        return;
+    }
+
+    // Validação de email básica
+    const emailRegex = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
+    if (!emailRegex.test(email)) {
+        e.preventDefault();
+        alert('Por favor, insira um email válido.');
+        return;
+    }
+
+    // Validação de arquivo (se houver)
+    const fileInput = document.getElementById('foto');
+    if (fileInput.files.length > 0) {
+        const file = fileInput.files[0];
+        const validTypes = ['image/jpeg', 'image/png', 'image/gif'];
+        const maxSize = 5 * 1024 * 1024; // 5MB
+
+        if (!validTypes.includes(file.type)) {
+            e.preventDefault();
+            alert('Por favor, selecione apenas imagens nos formatos JPG, PNG ou GIF.');
+            return;
+        }
+
+        if (file.size > maxSize) {
+            e.preventDefault();
+            alert('A imagem selecionada é muito grande. O tamanho máximo permitido é 5MB.');
+            return;
+        }
+    }
+});
+
+// Feedback visual para campos obrigatórios
+document.querySelectorAll('input[required], select[required], textarea[required]').forEach(field => {
+    field.addEventListener('blur', function() {
+        if (!this.value) {
+            this.style.borderColor = 'var(--warning)';
+        } else {
+            this.style.borderColor = 'var(--gray-300)';
+        }
+    });
+});
+
+// Máscara para telefone
+document.getElementById('telefone')?.addEventListener('input', function(e) {
+    let value = e.target.value.replace(/\D/g, '');
+
+    if (value.length <= 11) {
+        value = value.replace(/^(\d{2})(\d)/g, '($1) $2');
+        value = value.replace(/(\d)(\d{4})$/, '$1-$2');
+        e.target.value = value;
+    }
+});
+
+// Auto-salvar rascunho (opcional)
+let autoSaveTimer;
+document.querySelectorAll('input, textarea, select').forEach(field => {
+    field.addEventListener('input', function() {
+        clearTimeout(autoSaveTimer);
+        autoSaveTimer = setTimeout(() => {
+            // Poderia implementar auto-save aqui
+            console.log('Mudanças detectadas - pronto para auto-save');
+        }, 2000);
+    });
+});
+
+// Confirmação antes de sair da página se houver mudanças
+let hasChanges = false;
+document.querySelectorAll('input, textarea, select').forEach(field => {
+    field.addEventListener('input', () => hasChanges = true);
+});
+
+window.addEventListener('beforeunload', function(e) {
+    if (hasChanges) {
+        e.preventDefault();
+        e.returnValue = '';
+    }
+});
+
+// Focar no primeiro campo ao carregar a página
+window.addEventListener('load', function() {
+    document.getElementById('nome').focus();
+});
@@ -0,0 +1,416 @@
+// Elementos DOM
+const searchInput = document.getElementById('search-input');
+const filterTags = document.querySelectorAll('.filter-tag');
+const ordemSelect = document.getElementById('ordem-select');
+const ufSelect = document.getElementById('uf-select');
+const cidadeInput = document.getElementById('cidade-input');
+const raioSelect = document.getElementById('raio-select');
+const contadoresList = document.getElementById('contadores-list');
+const sentinela = document.getElementById('contadores-sentinela');
+const listaSugestoes = document.getElementById('sugestoes-lista');
+
+// Paginação: cada resposta traz uma página e o cursor da próxima
+let filtroAtual = { q: '', tags: [], ordem: 'relevancia', local: {} };
+let requisicaoAtual = 0;
+let carregando = false;
+let controleFiltro = null;
+
+function buscarPagina(cursor, signal) {
+    // GET para o navegador reaproveitar respostas já recebidas (ETag/304)
+    const params = new URLSearchParams({ q: filtroAtual.q, ordem: filtroAtual.ordem });
+    filtroAtual.tags.forEach(tag => params.append('tags', tag));
+    Object.entries(filtroAtual.local).forEach(([chave, valor]) => params.set(chave, valor));
+    if (cursor) params.set('cursor', cursor);
+    return fetch('/filtrar?' + params.toString(), { signal })
+        .then(response => response.json());
+}
+
+// Filtrar contadores
+// uf, cidade e raio (o raio só vale a partir de uma cidade)
+function filtroLocalizacao() {
+    const local = {};
+    const cidade = cidadeInput.value.trim();
+    if (ufSelect.value) local.uf = ufSelect.value;
+    if (cidade) local.cidade = cidade;
+    if (cidade && raioSelect.value) local.raio_km = raioSelect.value;
+    return local;
+}
+
+function filtrarContadores() {
+    const q = searchInput.value;
+    const tagsSelecionadas = Array.from(document.querySelectorAll('.filter-tag:checked'))
+        .map(cb => cb.value);
+
+    filtroAtual = { q, tags: tagsSelecionadas, ordem: ordemSelect.value, local: filtroLocalizacao() };
+    const requisicao = ++requisicaoAtual;
+    // Cancela a busca anterior ainda em andamento
+    if (controleFiltro) controleFiltro.abort();
+    controleFiltro = new AbortController();
+
+    buscarPagina(null, controleFiltro.signal)
+    .then(pagina => {
+        // Ignora respostas de buscas já substituídas por outra digitação
+        if (requisicao !== requisicaoAtual) return;
+        proximoCursor = pagina.next;
+        exibirContadores(pagina.contadores);
+    })
+    .catch(error => {
+        if (error.name !== 'AbortError') console.error('Erro ao filtrar:', error);
+    });
+}
+
+// Carregar a próxima página ao rolar até o fim da lista
+function carregarMais() {
+    if (!proximoCursor || carregando) return;
+    carregando = true;
+    const requisicao = requisicaoAtual;
+
+    buscarPagina(proximoCursor)
+    .then(pagina => {
+        if (requisicao !== requisicaoAtual) return;
+        proximoCursor = pagina.next;
+        exibirContadores(pagina.contadores, true);
+    })
+    .catch(error => {
+        console.error('Erro ao carregar mais contadores:', error);
+    })
+    .finally(() => {
+        carregando = false;
+    });
+}
+
+new IntersectionObserver(entries => {
+    if (entries.some(entry => entry.isIntersecting)) carregarMais();
+}, { rootMargin: '400px' }).observe(sentinela);
+
+// Exibir contadores na lista (anexar = acrescentar ao final)
+function exibirContadores(contadores, anexar = false) {
+    if (anexar) {
+        contadoresList.insertAdjacentHTML('beforeend', contadores.map(cardContador).join(''));
+        return;
+    }
+
+    if (contadores.length === 0) {
+        contadoresList.innerHTML = `
+            <div class="card text-center">
+                <p>🔍 Nenhum contador encontrado. Tente ajustar os filtros.</p>
+            </div>
+        `;
+        return;
+    }
+
+    contadoresList.innerHTML = contadores.map(cardContador).join('');
+}
+
+function cardContador(contador) {
+    return `
+        <div class="card">
+            <div class="flex items-center gap-4">
+                <img src="${contador.foto}" alt="${contador.nome}" style="width: 90px; height: 90px; border-radius: 12px;">
+                <div style="flex: 1;">
+                    <h4 style="font-weight: 600; margin-bottom: 4px;">
+                        ${contador.nome} ${contador.verificado ? '✅' : ''}
+                    </h4>
+                    <p style="color: var(--gray-500); font-size: 14px; margin-bottom: 8px;">${contador.especialidade}</p>
+
+                    <div class="row" style="margin-bottom: 12px;">
+                        <div class="col-3">
+                            <span class="rating-stars">${'⭐'.repeat(Math.round(contador.nota))}</span>
+                            <span style="color: var(--gray-500); font-size: 13px;">(${contador.avaliacoes_count} avaliações)</span>
+                        </div>
+                        <div class="col-3">
+                            <span style="color: var(--gray-500); font-size: 13px;">⏱️ ${contador.tempo_resposta}</span>
+                        </div>
+                        <div class="col-3">
+                            <span style="color: var(--gray-500); font-size: 13px;">📍 ${contador.localizacao}</span>
+                        </div>
+                    </div>
+
+                    <div>
+                        ${contador.tags.map(tag => `<span class="professional-tag">${tag}</span>`).join('')}
+                    </div>
+                </div>
+            </div>
+
+            <div class="flex gap-4 mt-4">
+                <button class="btn btn-primary" onclick="abrirModalProposta(${contador.id}, '${contador.nome}')">
+                    <i class="fas fa-briefcase"></i> Solicitar Proposta
+                </button>
+                ${usuarioLogado && usuarioTipo === 'cliente' ?
+                    `<button class="btn btn-secondary" onclick="abrirModalAvaliacao(${contador.id}, '${contador.nome}')">
+                        <i class="fas fa-star"></i> Avaliar
+                    </button>` : ''
+                }
+                <a href="/perfil_contador/${contador.id}" class="btn btn-secondary" target="_blank">
+                    <i class="fas fa-eye"></i> Ver Perfil
+                </a>
+            </div>
+        </div>
+    `;
+}
+
+// Executa `funcao` só depois de `espera` ms sem novas chamadas
+function debounce(funcao, espera) {
+    let temporizador = null;
+    return (...args) => {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(() => funcao(...args), espera);
+    };
+}
+
+// Sugestões enquanto digita (/sugestoes), com a requisição anterior cancelada
+let controleSugestoes = null;
+
+function buscarSugestoes() {
+    const q = searchInput.value.trim();
+    if (controleSugestoes) controleSugestoes.abort();
+    if (!q) {
+        esconderSugestoes();
+        return;
+    }
+    controleSugestoes = new AbortController();
+    fetch('/sugestoes?' + new URLSearchParams({ q }).toString(), { signal: controleSugestoes.signal })
+    .then(response => response.json())
+    .then(dados => exibirSugestoes(dados.sugestoes || []))
+    .catch(error => {
+        if (error.name !== 'AbortError') console.error('Erro ao buscar sugestões:', error);
+    });
+}
+
+const ICONES_SUGESTAO = {
+    contador: 'fa-user-tie', tag: 'fa-tag', especialidade: 'fa-briefcase', cidade: 'fa-map-marker-alt'
+};
+
+function exibirSugestoes(sugestoes) {
+    listaSugestoes.replaceChildren(...sugestoes.map(sugestao => {
+        const item = document.createElement('li');
+        item.className = 'sugestao-item';
+        item.setAttribute('role', 'option');
+        const icone = document.createElement('i');
+        icone.className = `fas ${ICONES_SUGESTAO[sugestao.tipo] || 'fa-search'}`;
+        item.append(icone, ' ', sugestao.texto);
+        // mousedown: escolhe antes do blur do campo esconder a lista
+        item.addEventListener('mousedown', evento => {
+            evento.preventDefault();
+            escolherSugestao(sugestao);
+        });
+        return item;
+    }));
+    listaSugestoes.hidden = sugestoes.length === 0;
+}
+
+function esconderSugestoes() {
+    listaSugestoes.hidden = true;
+}
+
+function escolherSugestao(sugestao) {
+    esconderSugestoes();
+    if (sugestao.tipo === 'contador') {
+        window.location.href = `/perfil_contador/${sugestao.contador_id}`;
+        return;
+    }
+    const filtroTag = sugestao.tipo === 'tag' &&
+        Array.from(filterTags).find(checkbox => checkbox.value === sugestao.texto);
+    if (filtroTag) {
+        filtroTag.checked = true;
+        searchInput.value = '';
+    } else {
+        searchInput.value = sugestao.texto;
+    }
+    filtrarContadores();
+}
+
+// Event listeners para filtros
+searchInput.addEventListener('input', debounce(buscarSugestoes, 120));
+searchInput.addEventListener('input', debounce(filtrarContadores, 350));
+searchInput.addEventListener('blur', esconderSugestoes);
+searchInput.addEventListener('keydown', evento => {
+    if (evento.key === 'Escape') esconderSugestoes();
+});
+ordemSelect.addEventListener('change', filtrarContadores);
+ufSelect.addEventListener('change', filtrarContadores);
+raioSelect.addEventListener('change', filtrarContadores);
+cidadeInput.addEventListener('input', debounce(filtrarContadores, 350));
+filterTags.forEach(tag => {
+    tag.addEventListener('change', filtrarContadores);
+});
+
+// Inicializar a lista de contadores
+exibirContadores(contadores);
+
+// Controle do Menu Lateral
+const menuToggle = document.getElementById('menuToggle');
+const sidebar = document.getElementById('sidebar');
+const sidebarOverlay = document.getElementById('sidebarOverlay');
+const closeSidebar = document.getElementById('closeSidebar');
+
+menuToggle.addEventListener('click', () => {
+    sidebar.classList.add('active');
+    sidebarOverlay.classList.add('active');
+});
+
+closeSidebar.addEventListener('click', fecharMenu);
+sidebarOverlay.addEventListener('click', fecharMenu);
+
+function fecharMenu() {
+    sidebar.classList.remove('active');
+    sidebarOverlay.classList.remove('active');
+}
+
+// Modal de Proposta
+function abrirModalProposta(contadorId, contadorNome) {
+    if (!usuarioLogado) {
+        alert('Por favor, faça login para enviar uma proposta.');
+        abrirMenuLogin();
+        return;
+    }
+
+    const modal = document.createElement('div');
+    modal.className = 'modal active';
+    modal.innerHTML = `
+        <div class="modal-content">
+            <h3>Enviar Proposta para ${contadorNome}</h3>
+            <form id="form-proposta">
+                <div class="form-group">
+                    <label class="form-label">Mensagem</label>
+                    <textarea class="form-control" rows="4" placeholder="Descreva sua necessidade..." required></textarea>
+                </div>
+                <div class="flex gap-4 mt-4">
+                    <button type="submit" class="btn btn-primary">
+                        <i class="fas fa-paper-plane"></i> Enviar Proposta
+                    </button>
+                    <button type="button" class="btn btn-secondary" onclick="fecharModal(this)">
+                        <i class="fas fa-times"></i> Cancelar
+                    </button>
+                </div>
+            </form>
+        </div>
+    `;
+    document.body.appendChild(modal);
+
+    modal.querySelector('#form-proposta').addEventListener('submit', async (e) => {
+        e.preventDefault();
+        await enviarProposta(contadorId, modal.querySelector('textarea').value);
+    });
+}
+
+async function enviarProposta(contadorId, mensagem) {
+    try {
+        const response = await fetch('/enviar_proposta', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                contador_id: contadorId,
+                mensagem: mensagem
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            fecharModal(document.querySelector('.modal.active .btn-secondary'));
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao enviar proposta. Tente novamente.');
+    }
+}
+
+// Modal de Avaliação
+function abrirModalAvaliacao(contadorId, contadorNome) {
+    if (!usuarioLogado) {
+        alert('Por favor, faça login para avaliar um contador.');
+        abrirMenuLogin();
+        return;
+    }
+
+    const modal = document.createElement('div');
+    modal.className = 'modal active';
+    modal.innerHTML = `
+        <div class="modal-content">
+            <h3>Avaliar ${contadorNome}</h3>
+            <div class="rating-stars-input">
+                ${[1,2,3,4,5].map(i => `<span class="rating-star" data-rating="${i}">⭐</span>`).join('')}
+            </div>
+            <textarea class="form-control" placeholder="Deixe um comentário (opcional)" rows="3"></textarea>
+            <div class="flex gap-4 mt-4">
+                <button class="btn btn-primary" onclick="enviarAvaliacao(${contadorId})">
+                    <i class="fas fa-paper-plane"></i> Enviar Avaliação
+                </button>
+                <button class="btn btn-secondary" onclick="fecharModal(this)">
+                    <i class="fas fa-times"></i> Cancelar
+                </button>
+            </div>
+        </div>
+    `;
+    document.body.appendChild(modal);
+
+    // Adicionar eventos às estrelas
+    modal.querySelectorAll('.rating-star').forEach(star => {
+        star.addEventListener('click', function() {
+            const rating = parseInt(this.getAttribute('data-rating'));
+            modal.querySelectorAll('.rating-star').forEach(s => {
+                s.classList.toggle('active', parseInt(s.getAttribute('data-rating')) <= rating);
+            });
+        });
+    });
+}
+
+function fecharModal(btn) {
+    btn.closest('.modal').remove();
+}
+
+async function enviarAvaliacao(contadorId) {
+    const modal = document.querySelector('.modal.active');
+    const stars = modal.querySelectorAll('.rating-star');
+    const rating = Array.from(stars).findIndex(star => star.classList.contains('active')) + 1;
+    const comentario = modal.querySelector('textarea').value;
+
+    if (rating === 0) {
+        alert('Por favor, selecione uma avaliação com as estrelas!');
+        return;
+    }
+
+    try {
+        const response = await fetch('/avaliar_contador', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                contador_id: contadorId,
+                nota: rating,
+                comentario: comentario
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            fecharModal(modal.querySelector('.btn-secondary'));
+            window.location.reload();
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao enviar avaliação. Tente novamente.');
+    }
+}
+
+function abrirMenuLogin() {
+    sidebar.classList.add('active');
+    sidebarOverlay.classList.add('active');
+}
+
+// CTA Bottom click
+document.querySelector('.cta-bottom').addEventListener('click', () => {
+    searchInput.scrollIntoView({ behavior: 'smooth' });
+    searchInput.focus();
+});
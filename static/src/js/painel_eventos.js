@@ -0,0 +1,37 @@
+// Atualizações em tempo real dos painéis de solicitações
+// O servidor manda, a cada proposta nova ou respondida, o card já renderizado
+// e os contadores; o card é trocado (ou inserido no topo) sem recarregar a página.
+let eventosConectados = false;
+
+function atualizarEstatisticas(estatisticas) {
+    document.querySelectorAll('[data-estatistica]').forEach(elemento => {
+        const valor = estatisticas[elemento.getAttribute('data-estatistica')];
+        if (valor !== undefined) elemento.textContent = valor;
+    });
+}
+
+function aplicarProposta(evento) {
+    const modelo = document.createElement('template');
+    modelo.innerHTML = evento.html.trim();
+    const card = modelo.content.firstElementChild;
+
+    const atual = document.getElementById(`proposta-${evento.id}`);
+    if (atual) {
+        atual.replaceWith(card);
+    } else {
+        const lista = document.getElementById('lista-propostas');
+        const vazio = lista.querySelector('.empty-state');
+        if (vazio) vazio.remove();
+        lista.prepend(card);
+    }
+    atualizarEstatisticas(evento.estatisticas);
+}
+
+if (window.EventSource) {
+    const fonte = new EventSource('/eventos');
+    fonte.onopen = () => { eventosConectados = true; };
+    fonte.onerror = () => { eventosConectados = false; };
+    fonte.addEventListener('proposta', e => aplicarProposta(JSON.parse(e.data)));
+    // Eventos perdidos que o servidor não tem mais: recarrega a página inteira
+    fonte.addEventListener('recarregar', () => window.location.reload());
+}
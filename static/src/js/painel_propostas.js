@@ -0,0 +1,55 @@
+// Lista paginada dos painéis de solicitações
+// A primeira página vem renderizada; as seguintes e os filtros por status são
+// pedidos ao servidor, que devolve os cards prontos e o cursor da próxima página.
+const listaPropostas = document.getElementById('lista-propostas');
+const botaoMaisPropostas = document.getElementById('carregar-propostas');
+let filtroPropostas = 'todas';
+
+async function buscarPropostas(cursor) {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    if (filtroPropostas !== 'todas') params.set('status', filtroPropostas);
+
+    const response = await fetch(`${listaPropostas.dataset.url}?${params}`);
+    const pagina = await response.json();
+    if (!response.ok || !pagina.success) throw new Error(pagina.message);
+    return pagina;
+}
+
+function atualizarBotaoMais(proximo) {
+    botaoMaisPropostas.dataset.cursor = proximo || '';
+    botaoMaisPropostas.style.display = proximo ? '' : 'none';
+    botaoMaisPropostas.disabled = false;
+}
+
+botaoMaisPropostas.addEventListener('click', async () => {
+    botaoMaisPropostas.disabled = true;
+    try {
+        const pagina = await buscarPropostas(botaoMaisPropostas.dataset.cursor);
+        listaPropostas.insertAdjacentHTML('beforeend', pagina.html);
+        atualizarBotaoMais(pagina.next);
+    } catch (error) {
+        console.error('Erro ao carregar solicitações:', error);
+        botaoMaisPropostas.disabled = false;
+    }
+});
+
+// Filtros de solicitações: a lista é refeita pelo servidor só com o status escolhido
+async function filtrarSolicitacoes(filtro) {
+    document.querySelectorAll('.filter-btn').forEach(btn => {
+        btn.classList.toggle('active', btn.dataset.filtro === filtro);
+    });
+    filtroPropostas = filtro;
+
+    try {
+        const pagina = await buscarPropostas();
+        listaPropostas.innerHTML = pagina.html || `
+            <div class="empty-state">
+                <i class="fas fa-inbox"></i>
+                <p>Nenhuma solicitação com este status.</p>
+            </div>`;
+        atualizarBotaoMais(pagina.next);
+    } catch (error) {
+        console.error('Erro ao filtrar solicitações:', error);
+    }
+}
@@ -0,0 +1,154 @@
+let contadorAtualId = null;
+let contadorAtualNome = null;
+let avaliacaoAtual = 0;
+
+// Modal de Proposta
+function abrirModalProposta(contadorId, contadorNome) {
+    contadorAtualId = contadorId;
+    contadorAtualNome = contadorNome;
+
+    document.getElementById('modalPropostaTitle').textContent = `Enviar Proposta para ${contadorNome}`;
+    document.getElementById('modalProposta').classList.add('active');
+}
+
+// Modal de Avaliação
+function abrirModalAvaliacao(contadorId, contadorNome) {
+    contadorAtualId = contadorId;
+    contadorAtualNome = contadorNome;
+    avaliacaoAtual = 0;
+
+    // Resetar estrelas
+    document.querySelectorAll('#ratingStars .rating-star').forEach(star => {
+        star.classList.remove('active');
+    });
+
+    document.getElementById('modalAvaliacaoTitle').textContent = `Avaliar ${contadorNome}`;
+    document.getElementById('modalAvaliacao').classList.add('active');
+}
+
+// Modal de Login
+function abrirModalLogin() {
+    document.getElementById('modalLogin').classList.add('active');
+}
+
+function fecharModal(modalId) {
+    document.getElementById(modalId).classList.remove('active');
+}
+
+// Configurar estrelas de avaliação
+document.querySelectorAll('#ratingStars .rating-star').forEach(star => {
+    star.addEventListener('click', function() {
+        const rating = parseInt(this.getAttribute('data-rating'));
+        avaliacaoAtual = rating;
+
+        // Atualizar visual das estrelas
+        document.querySelectorAll('#ratingStars .rating-star').forEach(s => {
+            s.classList.toggle('active', parseInt(s.getAttribute('data-rating')) <= rating);
+        });
+    });
+});
+
+// Enviar proposta
+document.getElementById('form-proposta').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const mensagem = e.target.querySelector('textarea').value;
+
+    try {
+        const response = await fetch('/enviar_proposta', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                contador_id: contadorAtualId,
+                mensagem: mensagem
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            fecharModal('modalProposta');
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao enviar proposta. Tente novamente.');
+    }
+});
+
+// Enviar avaliação
+async function enviarAvaliacao() {
+    const comentario = document.getElementById('comentarioAvaliacao').value;
+
+    if (avaliacaoAtual === 0) {
+        alert('Por favor, selecione uma avaliação com as estrelas!');
+        return;
+    }
+
+    try {
+        const response = await fetch('/avaliar_contador', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                contador_id: contadorAtualId,
+                nota: avaliacaoAtual,
+                comentario: comentario
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            fecharModal('modalAvaliacao');
+            window.location.reload();
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao enviar avaliação. Tente novamente.');
+    }
+}
+
+// Carregar mais avaliações (a primeira página já vem na página)
+const botaoMaisAvaliacoes = document.getElementById('carregar-avaliacoes');
+if (botaoMaisAvaliacoes) {
+    const listaAvaliacoes = document.getElementById('avaliacoes-lista');
+
+    botaoMaisAvaliacoes.addEventListener('click', async () => {
+        botaoMaisAvaliacoes.disabled = true;
+        const params = new URLSearchParams({ cursor: botaoMaisAvaliacoes.dataset.cursor });
+
+        try {
+            const response = await fetch(`/perfil_contador/${listaAvaliacoes.dataset.contadorId}/avaliacoes?${params}`);
+            const pagina = await response.json();
+            if (!response.ok) throw new Error(pagina.message);
+
+            listaAvaliacoes.insertAdjacentHTML('beforeend', pagina.html);
+            if (pagina.next) {
+                botaoMaisAvaliacoes.dataset.cursor = pagina.next;
+                botaoMaisAvaliacoes.disabled = false;
+            } else {
+                botaoMaisAvaliacoes.remove();
+            }
+        } catch (error) {
+            console.error('Erro ao carregar avaliações:', error);
+            botaoMaisAvaliacoes.disabled = false;
+        }
+    });
+}
+
+// Fechar modais ao clicar fora
+document.querySelectorAll('.modal').forEach(modal => {
+    modal.addEventListener('click', function(e) {
+        if (e.target === this) {
+            this.classList.remove('active');
+        }
+    });
+});
@@ -0,0 +1,60 @@
+// Configurar estrelas de avaliação (delegado, vale também para cards inseridos depois)
+document.addEventListener('click', function(e) {
+    const star = e.target.closest('.rating-stars-input .rating-star');
+    if (!star) return;
+    const rating = parseInt(star.getAttribute('data-rating'));
+    const container = star.parentElement;
+
+    // Atualizar visual das estrelas
+    container.querySelectorAll('.rating-star').forEach(s => {
+        s.classList.toggle('active', parseInt(s.getAttribute('data-rating')) <= rating);
+    });
+});
+
+// Enviar avaliação
+async function enviarAvaliacao(contadorId, btn) {
+    const container = btn.parentElement;
+    const stars = container.querySelectorAll('.rating-star');
+    const rating = Array.from(stars).findIndex(star => star.classList.contains('active')) + 1;
+    const comentario = container.querySelector('textarea').value;
+
+    if (rating === 0) {
+        alert('Por favor, selecione uma avaliação com as estrelas!');
+        return;
+    }
+
+    try {
+        const response = await fetch('/avaliar_contador', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                contador_id: contadorId,
+                nota: rating,
+                comentario: comentario
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            // Remover seção de avaliação após envio
+            container.innerHTML = '<p style="color: var(--success);"><i class="fas fa-check-circle"></i> Avaliação enviada com sucesso!</p>';
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao enviar avaliação. Tente novamente.');
+    }
+}
+
+// Animações de entrada
+document.addEventListener('DOMContentLoaded', function() {
+    const solicitacoes = document.querySelectorAll('.solicitacao-item');
+    solicitacoes.forEach((solicitacao, index) => {
+        solicitacao.style.animationDelay = `${index * 0.1}s`;
+    });
+});
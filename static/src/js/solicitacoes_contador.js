@@ -0,0 +1,45 @@
+// Responder proposta
+async function responderProposta(propostaId, status) {
+    const respostaTextarea = document.getElementById(`resposta-${propostaId}`);
+    const mensagemResposta = respostaTextarea ? respostaTextarea.value : '';
+
+    const acao = status === 'aceita' ? 'aceitar' : 'recusar';
+    if (!confirm(`Tem certeza que deseja ${acao} esta proposta?`)) {
+        return;
+    }
+
+    try {
+        const response = await fetch('/responder_proposta', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                proposta_id: propostaId,
+                status: status,
+                mensagem_resposta: mensagemResposta
+            })
+        });
+
+        const resultado = await response.json();
+
+        if (resultado.success) {
+            alert(resultado.message);
+            // Com o /eventos conectado o card e os contadores chegam por lá
+            if (!eventosConectados) window.location.reload();
+        } else {
+            alert(resultado.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        alert('Erro ao responder proposta. Tente novamente.');
+    }
+}
+
+// Animações de entrada
+document.addEventListener('DOMContentLoaded', function() {
+    const solicitacoes = document.querySelectorAll('.solicitacao-item');
+    solicitacoes.forEach((solicitacao, index) => {
+        solicitacao.style.animationDelay = `${index * 0.1}s`;
+    });
+});
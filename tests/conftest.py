@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+from flask import g
+from flask.testing import FlaskClient
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+class ClienteTeste(FlaskClient):
+    """Cada requisição começa como num servidor real: sessão do SQLAlchemy e `g` vazios"""
+
+    def open(self, *args, **kwargs):
+        # O cliente de teste reaproveita o contexto de aplicação que o teste mantém ativo
+        import app as modulo
+        modulo.db.session.remove()
+        g.__dict__.clear()
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture(scope='session')
+def app_teste(tmp_path_factory):
+    """Aplicação apontando para um banco SQLite temporário, já com os dados iniciais"""
+    pasta = tmp_path_factory.mktemp('banco')
+    # A configuração é lida na importação do app
+    os.environ['DATABASE_URL'] = f"sqlite:///{pasta / 'contadores.db'}"
+    os.environ['METRICAS_PASTA'] = str(pasta / 'metricas')
+    os.environ['SENHA_METODO'] = 'pbkdf2:sha256:1000'
+    import app as modulo
+    modulo.app.config['TESTING'] = True
+    modulo.app.test_client_class = ClienteTeste
+    modulo.init_db()
+    modulo.construir_assets()  # as páginas apontam para os arquivos do build
+    with modulo.app.app_context():
+        yield modulo
+
+
+@pytest.fixture
+def cliente(app_teste):
+    return app_teste.app.test_client()
+
+
+@pytest.fixture
+def criar_usuario(app_teste):
+    """Cria um usuário (cliente por padrão) e retorna o id"""
+    def criar(tipo='cliente'):
+        sufixo = os.urandom(4).hex()
+        usuario = app_teste.Usuario(nome=f'Usuário Teste {sufixo}', email=f'{tipo}.{sufixo}@teste.com',
+                                    senha='-', tipo=tipo)
+        app_teste.db.session.add(usuario)
+        app_teste.db.session.commit()
+        return usuario.id
+    return criar
+
+
+@pytest.fixture
+def criar_contador(app_teste, criar_usuario):
+    """Cria um contador com uma tag e retorna o id"""
+    def criar():
+        usuario_id = criar_usuario('contador')
+        contador = app_teste.Contador(usuario_id=usuario_id, nome=f'Contador Teste {usuario_id}',
+                                      especialidade='Imposto de Renda')
+        app_teste.db.session.add(contador)
+        app_teste.definir_tags(contador, ['IRPF'])
+        app_teste.db.session.commit()
+        return contador.id
+    return criar
+
+
+def logar(cliente, usuario_id):
+    with cliente.session_transaction() as sessao:
+        sessao['usuario_id'] = usuario_id
+
+
+def abrir(cliente, url):
+    """GET que precisa responder 200"""
+    resposta = cliente.get(url)
+    assert resposta.status_code == 200, resposta.status_code
+    return resposta
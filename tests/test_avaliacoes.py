@@ -0,0 +1,47 @@
+import base64
+import json
+
+import pytest
+
+from conftest import logar
+
+
+def cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('valor', ['nao-e-base64!', cursor([10 ** 18, 1]), cursor([-10 ** 18, 1]),
+                                   cursor(['a', 1]), cursor([1])])
+def test_cursor_invalido_responde_400(app_teste, cliente, valor):
+    resposta = cliente.get('/perfil_contador/1/avaliacoes', query_string={'cursor': valor})
+
+    assert resposta.status_code == 400
+    assert resposta.get_json()["success"] is False
+
+
+@pytest.mark.parametrize('nota', [True, 1.0, 0, 6, '5', None])
+def test_nota_precisa_ser_inteiro_de_1_a_5(app_teste, cliente, criar_usuario, criar_contador, nota):
+    contador_id = criar_contador()
+    logar(cliente, criar_usuario())
+
+    resposta = cliente.post('/avaliar_contador', json={'contador_id': contador_id, 'nota': nota})
+
+    assert resposta.get_json()["success"] is False
+    assert app_teste.db.session.get(app_teste.Contador, contador_id).avaliacoes_count == 0
+
+
+def test_recalcular_preserva_contador_sem_avaliacoes(app_teste, cliente, criar_usuario, criar_contador):
+    semeado_id, avaliado_id = criar_contador(), criar_contador()
+    semeado = app_teste.db.session.get(app_teste.Contador, semeado_id)
+    semeado.nota, semeado.soma_notas, semeado.avaliacoes_count, semeado.estrelas_5 = 4.5, 45.0, 10, 5
+    app_teste.db.session.commit()
+    logar(cliente, criar_usuario())
+    assert cliente.post('/avaliar_contador', json={'contador_id': avaliado_id, 'nota': 3}).get_json()["success"]
+
+    app_teste.recalcular_avaliacoes()
+    app_teste.db.session.expire_all()
+
+    semeado = app_teste.db.session.get(app_teste.Contador, semeado_id)
+    assert (semeado.nota, semeado.avaliacoes_count, semeado.estrelas_5) == (4.5, 10, 5)
+    avaliado = app_teste.db.session.get(app_teste.Contador, avaliado_id)
+    assert (avaliado.nota, avaliado.avaliacoes_count, avaliado.estrelas_3) == (3.0, 1, 1)
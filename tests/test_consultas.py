@@ -0,0 +1,87 @@
+"""O número de consultas SQL das páginas não pode crescer com a quantidade de linhas"""
+from conftest import abrir, logar
+
+LINHAS_POR_RODADA = 3
+
+
+def contador_de_teste(app_teste):
+    """(id do contador, id do usuário dele) do primeiro contador dos dados iniciais"""
+    return app_teste.db.session.execute(
+        app_teste.db.select(app_teste.Contador.id, app_teste.Contador.usuario_id)
+        .order_by(app_teste.Contador.id)).first()
+
+
+def test_minhas_solicitacoes(app_teste, cliente, criar_usuario, criar_contador):
+    usuario_id = criar_usuario()
+    logar(cliente, usuario_id)
+
+    def requisitar():
+        abrir(cliente, '/minhas_solicitacoes')
+
+    def aumentar_dados():
+        # Contadores diferentes a cada proposta: o template mostra nome e tags de cada um
+        for numero in range(LINHAS_POR_RODADA):
+            app_teste.db.session.add(app_teste.Proposta(contador_id=criar_contador(), cliente_id=usuario_id,
+                                                        mensagem=f'Proposta {numero}', status='pendente'))
+        app_teste.db.session.commit()
+
+    aumentar_dados()  # com a lista vazia as cargas em lote (selectin) nem chegam a rodar
+    app_teste.verificar_consultas_constantes(requisitar, aumentar_dados)
+
+
+def test_solicitacoes_contador(app_teste, cliente, criar_usuario):
+    contador_id, contador_usuario_id = contador_de_teste(app_teste)
+    logar(cliente, contador_usuario_id)
+
+    def requisitar():
+        abrir(cliente, '/solicitacoes_contador')
+
+    def aumentar_dados():
+        # Clientes diferentes a cada proposta: o template mostra o nome de cada um
+        for numero in range(LINHAS_POR_RODADA):
+            app_teste.db.session.add(app_teste.Proposta(contador_id=contador_id, cliente_id=criar_usuario(),
+                                                        mensagem=f'Proposta {numero}', status='pendente'))
+        app_teste.db.session.commit()
+
+    aumentar_dados()  # com a lista vazia as cargas em lote (selectin) nem chegam a rodar
+    app_teste.verificar_consultas_constantes(requisitar, aumentar_dados)
+
+
+def test_perfil_contador(app_teste, cliente, criar_usuario, monkeypatch):
+    contador_id, _ = contador_de_teste(app_teste)
+
+    def requisitar():
+        # Sempre sem os fragmentos em cache: é o caminho que consulta o contador e as tags
+        monkeypatch.setattr(app_teste, 'cache_perfis', app_teste.CacheFragmentos(10))
+        abrir(cliente, f'/perfil_contador/{contador_id}')
+
+    def aumentar_dados():
+        # Cada avaliação de um autor diferente, como faz a rota /avaliar_contador
+        for numero in range(LINHAS_POR_RODADA):
+            app_teste.db.session.add(app_teste.Avaliacao(contador_id=contador_id, usuario_id=criar_usuario(),
+                                                         nota=5, comentario=f'Avaliação {numero}'))
+            app_teste.registrar_nota(contador_id, 5)
+        app_teste.db.session.commit()
+
+    aumentar_dados()  # com a lista vazia as cargas em lote (selectin) nem chegam a rodar
+    app_teste.verificar_consultas_constantes(requisitar, aumentar_dados)
+
+
+def test_minhas_avaliacoes(app_teste, cliente, criar_usuario, criar_contador):
+    usuario_id = criar_usuario()
+    logar(cliente, usuario_id)
+
+    def requisitar():
+        abrir(cliente, '/minhas_avaliacoes')
+
+    def aumentar_dados():
+        # Contadores diferentes a cada avaliação: o template mostra o nome de cada um
+        for numero in range(LINHAS_POR_RODADA):
+            contador_id = criar_contador()
+            app_teste.db.session.add(app_teste.Avaliacao(contador_id=contador_id, usuario_id=usuario_id,
+                                                         nota=4, comentario=f'Avaliação {numero}'))
+            app_teste.registrar_nota(contador_id, 4)
+        app_teste.db.session.commit()
+
+    aumentar_dados()
+    app_teste.verificar_consultas_constantes(requisitar, aumentar_dados)
@@ -0,0 +1,19 @@
+def test_importar_sem_senha_exige_arquivo_de_senhas(app_teste, tmp_path):
+    arquivo = tmp_path / 'contadores.csv'
+    arquivo.write_text("nome,email,especialidade,senha\n"
+                       "Ana Souza,ana.importada@teste.com,Contabilidade,segredo123\n"
+                       "Bruno Lima,bruno.importado@teste.com,Impostos,\n", encoding='utf-8')
+    executor = app_teste.app.test_cli_runner()
+
+    resultado = executor.invoke(args=['contadores', 'importar', str(arquivo), '--processos', '1'])
+
+    assert resultado.exit_code == 2
+    assert 'linha 3' in resultado.output
+    assert app_teste.Usuario.query.filter_by(email='ana.importada@teste.com').first() is None
+
+    senhas = tmp_path / 'senhas.csv'
+    resultado = executor.invoke(args=['contadores', 'importar', str(arquivo), '--processos', '1',
+                                      '--senhas', str(senhas)])
+
+    assert resultado.exit_code == 0, resultado.output
+    assert senhas.read_text(encoding='utf-8').splitlines()[1].startswith('bruno.importado@teste.com,')
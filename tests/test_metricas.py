@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+CHAVE = ('tarefas_total', (('resultado', 'concluida'), ('tipo', 'teste')))
+
+
+def pid_encerrado():
+    processo = subprocess.Popen([sys.executable, '-c', 'pass'])
+    processo.wait()
+    return processo.pid
+
+
+def gravar_arquivo(pasta, nome_arquivo, valor):
+    with open(os.path.join(pasta, nome_arquivo), 'w', encoding='utf-8') as arquivo:
+        json.dump([[CHAVE[0], [list(par) for par in CHAVE[1]], [valor]]], arquivo)
+
+
+def test_processos_encerrados_vao_para_o_consolidado(app_teste, tmp_path):
+    metricas = app_teste.Metricas(str(tmp_path), intervalo=60)
+    morto = f"{pid_encerrado()}-abcd1234.json"
+    gravar_arquivo(tmp_path, morto, 5)
+
+    metricas.incrementar('tarefas_total', 2, tipo='teste', resultado='concluida')
+    metricas.gravar()  # a primeira gravação do processo consolida os mortos
+
+    assert not os.path.exists(tmp_path / morto)
+    assert metricas.somar_processos()[CHAVE] == [7]
+
+    metricas.encerrar()
+
+    assert os.listdir(tmp_path) == [app_teste.Metricas.CONSOLIDADO]
+    assert metricas.somar_processos()[CHAVE] == [7]
+
+
+def test_arquivo_ja_consolidado_nao_conta_duas_vezes(app_teste, tmp_path):
+    metricas = app_teste.Metricas(str(tmp_path), intervalo=60)
+    # Consolidação interrompida depois de gravar o consolidado e antes de apagar o arquivo
+    sobra = f"{pid_encerrado()}-abcd1234.json"
+    gravar_arquivo(tmp_path, sobra, 5)
+    with open(tmp_path / app_teste.Metricas.CONSOLIDADO, 'w', encoding='utf-8') as arquivo:
+        json.dump({"series": [[CHAVE[0], [list(par) for par in CHAVE[1]], [5]]], "incluidos": [sobra]}, arquivo)
+
+    assert metricas.somar_processos()[CHAVE] == [5]
+    assert metricas.consolidar() == 0
+    assert metricas.somar_processos()[CHAVE] == [5]
+    assert not os.path.exists(tmp_path / sobra)
+
+
+def test_metrics_restrito_sem_token_ou_admin(app_teste, cliente, monkeypatch):
+    monkeypatch.setitem(app_teste.app.config, 'METRICAS_TOKEN', 'segredo')
+
+    # O cliente de teste chega de 127.0.0.1: loopback não basta
+    assert cliente.get('/metrics').status_code == 403
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer errado'}).status_code == 403
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer segredo'}).status_code == 200
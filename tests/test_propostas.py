@@ -0,0 +1,43 @@
+from conftest import logar
+
+
+def contar_propostas(app_teste):
+    return app_teste.db.session.scalar(app_teste.db.select(app_teste.db.func.count(app_teste.Proposta.id)))
+
+
+def test_enviar_proposta_para_contador_inexistente(app_teste, cliente, criar_usuario):
+    logar(cliente, criar_usuario())
+    antes = contar_propostas(app_teste)
+
+    resposta = cliente.post('/enviar_proposta', json={"contador_id": 999999, "mensagem": "Olá"})
+
+    assert resposta.status_code == 404
+    assert resposta.get_json()["success"] is False
+    assert contar_propostas(app_teste) == antes
+
+
+def test_enviar_proposta(app_teste, cliente, criar_usuario, criar_contador):
+    logar(cliente, criar_usuario())
+    antes = contar_propostas(app_teste)
+
+    resposta = cliente.post('/enviar_proposta', json={"contador_id": criar_contador(), "mensagem": "Olá"})
+
+    assert resposta.get_json()["success"] is True
+    assert contar_propostas(app_teste) == antes + 1
+
+
+def test_responder_proposta_com_status_invalido(app_teste, cliente, criar_usuario, criar_contador):
+    contador_id = criar_contador()
+    contador = app_teste.db.session.get(app_teste.Contador, contador_id)
+    proposta = app_teste.Proposta(contador_id=contador_id, cliente_id=criar_usuario(), mensagem='Olá',
+                                  status='pendente')
+    app_teste.db.session.add(proposta)
+    app_teste.db.session.commit()
+    proposta_id = proposta.id
+    logar(cliente, contador.usuario_id)
+
+    resposta = cliente.post('/responder_proposta', json={"proposta_id": proposta_id, "status": "apagada"})
+
+    assert resposta.status_code == 400
+    assert resposta.get_json()["success"] is False
+    assert app_teste.db.session.get(app_teste.Proposta, proposta_id).status == 'pendente'
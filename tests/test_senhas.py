@@ -0,0 +1,15 @@
+import threading
+
+import pytest
+
+
+def test_pool_hash_converte_timeout_em_sobrecarga(app_teste):
+    pool = app_teste.PoolHashSenhas(workers=1, fila_max=1)
+    liberar = threading.Event()
+    try:
+        with pytest.raises(app_teste.HashSobrecarregado):
+            pool.executar(liberar.wait, timeout=0.05)
+    finally:
+        liberar.set()
+    # A vaga volta quando o hash termina
+    assert pool.executar(lambda: 'ok', timeout=5) == 'ok'
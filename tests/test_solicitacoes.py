@@ -0,0 +1,50 @@
+from conftest import logar
+
+
+def criar_propostas(app_teste, quantidade, cliente_id, contador_id, status='pendente'):
+    for numero in range(quantidade):
+        app_teste.db.session.add(app_teste.Proposta(contador_id=contador_id, cliente_id=cliente_id,
+                                                    mensagem=f'Proposta {numero}', status=status))
+    app_teste.db.session.commit()
+
+
+def test_painel_do_cliente_paginado(app_teste, cliente, criar_usuario, criar_contador):
+    usuario_id = criar_usuario()
+    contador_id = criar_contador()
+    criar_propostas(app_teste, 23, usuario_id, contador_id)
+    criar_propostas(app_teste, 2, usuario_id, contador_id, status='aceita')
+    logar(cliente, usuario_id)
+    por_pagina = app_teste.app.config['PROPOSTAS_POR_PAGINA']
+
+    pagina = cliente.get('/minhas_solicitacoes').get_data(as_text=True)
+    assert pagina.count('class="solicitacao-item"') == por_pagina
+    assert 'data-estatistica="total">25<' in pagina
+
+    ids = set()
+    cursor = None
+    while True:
+        resposta = cliente.get('/minhas_solicitacoes/propostas', query_string={'cursor': cursor} if cursor else {})
+        dados = resposta.get_json()
+        assert dados["success"] is True
+        ids.update(linha.split('"')[0] for linha in dados["html"].split('id="proposta-')[1:])
+        cursor = dados["next"]
+        if not cursor:
+            break
+    assert len(ids) == 25
+
+    aceitas = cliente.get('/minhas_solicitacoes/propostas', query_string={'status': 'aceita'}).get_json()
+    assert aceitas["html"].count('class="solicitacao-item"') == 2
+    assert aceitas["next"] is None
+
+
+def test_painel_do_contador_paginado(app_teste, cliente, criar_usuario, criar_contador):
+    contador_id = criar_contador()
+    contador = app_teste.db.session.get(app_teste.Contador, contador_id)
+    criar_propostas(app_teste, 21, criar_usuario(), contador_id)
+    logar(cliente, contador.usuario_id)
+
+    pagina = cliente.get('/solicitacoes_contador').get_data(as_text=True)
+    assert pagina.count('class="solicitacao-item"') == app_teste.app.config['PROPOSTAS_POR_PAGINA']
+
+    resposta = cliente.get('/solicitacoes_contador/propostas', query_string={'status': 'qualquer'})
+    assert resposta.status_code == 400
@@ -0,0 +1,22 @@
+def test_lote_com_falha_so_penaliza_a_tarefa_que_falhou(app_teste, monkeypatch):
+    executadas = []
+
+    def processar(lista):
+        if any(dados['n'] == 2 for dados in lista):
+            raise ValueError('n inválido')
+        executadas.extend(dados['n'] for dados in lista)
+
+    monkeypatch.setitem(app_teste.TAREFAS, 'teste_lote', (processar, True))
+    for n in range(1, 4):
+        app_teste.enfileirar('teste_lote', n=n)
+    app_teste.db.session.commit()
+
+    # Outros testes podem ter deixado tarefas na fila; elas rodam junto
+    app_teste.executar_tarefas(app_teste.reservar_tarefas('teste', 100))
+
+    situacao = dict(app_teste.db.session.execute(
+        app_teste.db.select(app_teste.Tarefa.dados, app_teste.Tarefa.status)
+        .where(app_teste.Tarefa.tipo == 'teste_lote')
+    ).all())
+    assert situacao == {'{"n": 1}': 'concluida', '{"n": 2}': 'pendente', '{"n": 3}': 'concluida'}
+    assert sorted(executadas) == [1, 3]